@@ -1,17 +1,76 @@
-from pymongo import MongoClient
-import certifi
-from typing import List, Dict
-from collections import Counter
+from typing import List, Dict, Optional
+from datetime import datetime
 import os
 from dotenv import load_dotenv
+import db_registry
+import dislike_rollup
+import waste_rollup
 
 load_dotenv()
 
+def _dislike_counts_stages(limit: int = 0) -> List[Dict]:
+    """Pipeline stages producing {_id: food, count} rows, most disliked first."""
+    stages = [
+        {"$unwind": "$disliked_foods"},
+        {"$group": {"_id": "$disliked_foods", "count": {"$sum": 1}}},
+        {"$sort": {"count": -1, "_id": 1}},
+    ]
+    if limit:
+        stages.append({"$limit": limit})
+    return stages
+
+def _aggregate_dislike_counts(db, limit: int) -> Dict:
+    """
+    Compute the insight counts from `users` with one aggregation.
+    
+    Used when the dislike rollup has not been built yet.
+    """
+    dislikes = {"$ifNull": ["$disliked_foods", []]}
+    pipeline = [
+        {"$project": {"_id": 0, "disliked_foods": 1}},
+        {"$facet": {
+            "summary": [
+                {"$group": {
+                    "_id": None,
+                    "total_users": {"$sum": 1},
+                    "users_with_preferences": {"$sum": {"$cond": [{"$gt": [{"$size": dislikes}, 0]}, 1, 0]}},
+                    "total_dislikes": {"$sum": {"$size": dislikes}}
+                }}
+            ],
+            "unique_dislikes": [
+                {"$unwind": "$disliked_foods"},
+                {"$group": {"_id": "$disliked_foods"}},
+                {"$count": "count"}
+            ],
+            "top_dislikes": _dislike_counts_stages(limit)
+        }}
+    ]
+    result = next(db['users'].aggregate(pipeline), {})
+    return {
+        "summary": (result.get('summary') or [{}])[0],
+        "unique_dislikes": (result.get('unique_dislikes') or [{}])[0].get('count', 0),
+        "top_dislikes": [(row['_id'], row['count']) for row in result.get('top_dislikes', [])]
+    }
+
+def _rollup_dislike_counts(db, limit: int) -> Optional[Dict]:
+    """Read the insight counts from the dislike rollup (None if it has never been built)."""
+    summary = dislike_rollup.get_summary(db)
+    if summary is None:
+        return None
+    return {
+        "summary": summary,
+        "unique_dislikes": dislike_rollup.count_disliked_foods(db),
+        "top_dislikes": [(row['food'], row['count']) for row in dislike_rollup.get_top_dislikes(db, limit)]
+    }
+
 def get_admin_waste_insights(limit: int = 20) -> Dict:
     """
     Get aggregated insights about food waste across all users.
     Helps admins understand what foods should be reduced or improved.
     
+    Counts are read from the dislike_rollup collection (see
+    dislike_rollup.py); until it is built they are aggregated from `users`.
+    
     Args:
         limit: Number of top disliked items to return
         
@@ -19,35 +78,18 @@ def get_admin_waste_insights(limit: int = 20) -> Dict:
         Dictionary with waste insights and recommendations
     """
     try:
-        # Connect to MongoDB
-        mongodb_uri = os.getenv("MONGODB_URI")
-        client = MongoClient(
-            mongodb_uri,
-            tlsCAFile=certifi.where(),
-            serverSelectionTimeoutMS=5000
-        )
-        
-        db = client["food_preferences"]
-        users_collection = db['users']
-        
-        # Get all users
-        all_users = list(users_collection.find({}, {"_id": 0, "user_id": 1, "disliked_foods": 1, "meal_count": 1}))
-        
-        # Aggregate dislikes across all users
-        dislike_counter = Counter()
-        total_users = len(all_users)
-        users_with_data = 0
+        # Borrow the shared MongoDB client
+        db = db_registry.get_database("food_preferences", os.getenv("MONGODB_URI"))
         
-        for user in all_users:
-            dislikes = user.get('disliked_foods', [])
-            if dislikes:
-                users_with_data += 1
-                for food in dislikes:
-                    dislike_counter[food] += 1
+        counts = _rollup_dislike_counts(db, limit) or _aggregate_dislike_counts(db, limit)
+        summary = counts['summary']
+        total_users = summary.get('total_users', 0)
+        users_with_data = summary.get('users_with_preferences', 0)
+        total_unique_dislikes = counts['unique_dislikes']
         
         # Calculate percentages and create insights
         top_dislikes = []
-        for food, count in dislike_counter.most_common(limit):
+        for food, count in counts['top_dislikes']:
             percentage = (count / total_users) * 100 if total_users > 0 else 0
             
             # Determine severity
@@ -73,10 +115,7 @@ def get_admin_waste_insights(limit: int = 20) -> Dict:
             })
         
         # Calculate overall stats
-        total_unique_dislikes = len(dislike_counter)
-        avg_dislikes_per_user = sum(len(u.get('disliked_foods', [])) for u in all_users) / total_users if total_users > 0 else 0
-        
-        client.close()
+        avg_dislikes_per_user = summary.get('total_dislikes', 0) / total_users if total_users > 0 else 0
         
         return {
             "summary": {
@@ -107,43 +146,50 @@ def get_admin_waste_insights(limit: int = 20) -> Dict:
             "recommendations": {}
         }
 
+def _aggregate_category_breakdown(db) -> List[Dict]:
+    """
+    Compute the per-category breakdown from `users`.
+    
+    The server counts dislikes per food; the (much smaller) per-food rows
+    are then categorized and folded into categories here. Same shape and
+    ordering as dislike_rollup.get_category_breakdown, which is used
+    instead once the dislike rollup has been built.
+    """
+    users_collection = db['users']
+    
+    from recommendation_service import categorize_food
+    
+    food_counts = users_collection.aggregate([
+        {"$project": {"_id": 0, "disliked_foods": 1}},
+        {"$unwind": "$disliked_foods"},
+        {"$group": {"_id": "$disliked_foods", "count": {"$sum": 1}}}
+    ])
+    
+    categories: Dict[str, List] = {}
+    for row in food_counts:
+        categories.setdefault(categorize_food(row['_id']), []).append((row['_id'], row['count']))
+    
+    breakdown = []
+    for category, foods in categories.items():
+        foods.sort(key=lambda food: (-food[1], food[0]))
+        breakdown.append({
+            "category": category,
+            "total_dislikes": sum(count for _, count in foods),
+            "unique_items": len(foods),
+            "most_common": [[food, count] for food, count in foods[:3]]
+        })
+    breakdown.sort(key=lambda row: (-row['total_dislikes'], row['category']))
+    return breakdown
+
 def get_waste_trends_by_category() -> Dict:
-    """Get waste insights grouped by food category."""
+    """Get waste insights grouped by food category (from the dislike rollup when available)."""
     try:
-        mongodb_uri = os.getenv("MONGODB_URI")
-        client = MongoClient(mongodb_uri, tlsCAFile=certifi.where(), serverSelectionTimeoutMS=5000)
+        db = db_registry.get_database("food_preferences", os.getenv("MONGODB_URI"))
         
-        db = client["food_preferences"]
-        users_collection = db['users']
-        
-        # Get all users' dislikes
-        all_users = list(users_collection.find({}, {"_id": 0, "disliked_foods": 1}))
-        
-        # Categorize dislikes
-        from recommendation_service import categorize_food
-        
-        category_dislikes = {}
-        for user in all_users:
-            for food in user.get('disliked_foods', []):
-                category = categorize_food(food)
-                if category not in category_dislikes:
-                    category_dislikes[category] = []
-                category_dislikes[category].append(food)
-        
-        # Count by category
-        category_stats = []
-        for category, foods in category_dislikes.items():
-            category_stats.append({
-                "category": category,
-                "total_dislikes": len(foods),
-                "unique_items": len(set(foods)),
-                "most_common": Counter(foods).most_common(3)
-            })
-        
-        # Sort by total dislikes
-        category_stats.sort(key=lambda x: x['total_dislikes'], reverse=True)
-        
-        client.close()
+        if dislike_rollup.get_summary(db) is not None:
+            category_stats = dislike_rollup.get_category_breakdown(db)
+        else:
+            category_stats = _aggregate_category_breakdown(db)
         
         return {
             "category_breakdown": category_stats,
@@ -153,3 +199,32 @@ def get_waste_trends_by_category() -> Dict:
     except Exception as e:
         print(f"Error getting category trends: {e}")
         return {"error": str(e)}
+
+def get_waste_trends(start: Optional[datetime] = None, end: Optional[datetime] = None,
+                     granularity: str = "day", limit: int = 10) -> Dict:
+    """
+    Get meal count and waste percentage over time from the waste rollup buckets.
+    
+    Args:
+        start: Range start (UTC)
+        end: Range end (UTC)
+        granularity: "day" or "hour"
+        limit: Number of top thrown-away items and meals to return
+        
+    Returns:
+        Trend series (see waste_rollup.get_trends)
+    """
+    db = db_registry.get_database("food_preferences", os.getenv("MONGODB_URI"))
+    return waste_rollup.get_trends(db, start=start, end=end, granularity=granularity, limit=limit)
+
+def get_dashboard_snapshot(limit: int = 15) -> Dict:
+    """
+    Everything the admin dashboard shows, as {section: {key: value}}.
+    
+    Computed once per push interval by insights_broadcaster and shared by
+    all connected dashboards.
+    """
+    return {
+        "insights": get_admin_waste_insights(limit=limit),
+        "categories": get_waste_trends_by_category()
+    }
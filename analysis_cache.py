@@ -0,0 +1,295 @@
+"""
+Content-addressed cache for vision analysis results.
+
+Results are keyed by the SHA-256 of the image bytes together with the
+vision model and a hash of the prompt, so re-uploading the same photo
+returns the stored analysis instead of calling the API again, and changing
+the model or prompt never serves stale results.
+
+Backends (ANALYSIS_CACHE_BACKEND):
+    disk   JSON files under ANALYSIS_CACHE_DIR (default)
+    mongo  the `analysis_cache` collection
+    off    no caching
+
+Both are bounded by ANALYSIS_CACHE_MAX_BYTES and evict the least recently
+used entries first.
+"""
+from datetime import datetime
+from typing import Any, BinaryIO, Dict, Optional, Union
+import hashlib
+import json
+import os
+import threading
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "analysis")
+DEFAULT_MAX_BYTES = 100 * 1024 * 1024
+
+CACHE_COLLECTION = "analysis_cache"
+
+
+def _sha256_hex(source: Union[bytes, BinaryIO]) -> str:
+    """SHA-256 of bytes, or of a seekable stream read in chunks and rewound."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return hashlib.sha256(source).hexdigest()
+    digest = hashlib.sha256()
+    position = source.tell()
+    try:
+        for chunk in iter(lambda: source.read(1024 * 1024), b""):
+            digest.update(chunk)
+    finally:
+        source.seek(position)
+    return digest.hexdigest()
+
+
+def cache_key(image_bytes: Union[bytes, BinaryIO], model: str, prompt: str, variant: str = "") -> str:
+    """
+    Content address of an analysis.
+
+    Args:
+        image_bytes: Raw image bytes as uploaded, or a seekable stream of them
+        model: Vision model name
+        prompt: Prompt sent with the image
+        variant: Anything else that changes what the model sees
+            (e.g. image preprocessing settings)
+
+    Returns:
+        Hex SHA-256 key
+    """
+    image_digest = _sha256_hex(image_bytes)
+    prompt_digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+    material = f"{model}\0{prompt_digest}\0{image_digest}"
+    if variant:
+        material += f"\0{variant}"
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class DiskCacheBackend:
+    """Stores each result as <dir>/<key[:2]>/<key>.json; file mtimes track recency."""
+
+    def __init__(self, directory: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._total_bytes = sum(size for _, size, _ in self._entries())
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def _entries(self):
+        """(path, size, mtime) of every cached file."""
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(".json"):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    yield path, stat.st_size, stat.st_mtime
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                value = json.load(f)
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return value
+
+    def set(self, key: str, value: Dict[str, Any]) -> int:
+        """Store a result; returns the number of evicted entries."""
+        data = json.dumps(value, default=str).encode("utf-8")
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+
+        with self._lock:
+            try:
+                previous_size = os.path.getsize(path)
+            except FileNotFoundError:
+                previous_size = 0
+            os.replace(temp_path, path)
+            self._total_bytes += len(data) - previous_size
+            if self._total_bytes <= self.max_bytes:
+                return 0
+            return self._evict()
+
+    def _evict(self) -> int:
+        # Oldest first until we are back under 90% of the bound
+        target = self.max_bytes * 0.9
+        evicted = 0
+        for path, size, _ in sorted(self._entries(), key=lambda entry: entry[2]):
+            if self._total_bytes <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            self._total_bytes -= size
+            evicted += 1
+        return evicted
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "disk", "directory": self.directory, "bytes": self._total_bytes, "max_bytes": self.max_bytes}
+
+
+class MongoCacheBackend:
+    """Stores results in a MongoDB collection; `last_accessed` tracks recency."""
+
+    # Check the size bound every this many writes
+    EVICTION_CHECK_EVERY = 50
+
+    def __init__(self, collection, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.collection = collection
+        self.max_bytes = max_bytes
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        doc = self.collection.find_one_and_update(
+            {"_id": key}, {"$set": {"last_accessed": datetime.utcnow()}}, projection={"result": 1}
+        )
+        return doc["result"] if doc else None
+
+    def set(self, key: str, value: Dict[str, Any]) -> int:
+        """Store a result; returns the number of evicted entries."""
+        size = len(json.dumps(value, default=str))
+        now = datetime.utcnow()
+        self.collection.replace_one(
+            {"_id": key},
+            {"_id": key, "result": value, "size": size, "created_at": now, "last_accessed": now},
+            upsert=True
+        )
+        with self._lock:
+            self._writes += 1
+            if self._writes % self.EVICTION_CHECK_EVERY:
+                return 0
+        return self._evict()
+
+    def _total_bytes(self) -> int:
+        result = next(self.collection.aggregate([{"$group": {"_id": None, "bytes": {"$sum": "$size"}}}]), None)
+        return result["bytes"] if result else 0
+
+    def _evict(self) -> int:
+        total_bytes = self._total_bytes()
+        if total_bytes <= self.max_bytes:
+            return 0
+        # Least recently used first until we are back under 90% of the bound
+        excess = total_bytes - self.max_bytes * 0.9
+        evict_ids = []
+        for doc in self.collection.find({}, {"size": 1}).sort("last_accessed", 1):
+            if excess <= 0:
+                break
+            evict_ids.append(doc["_id"])
+            excess -= doc.get("size", 0)
+        if evict_ids:
+            self.collection.delete_many({"_id": {"$in": evict_ids}})
+        return len(evict_ids)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "mongo", "collection": self.collection.name, "bytes": self._total_bytes(),
+                "max_bytes": self.max_bytes}
+
+
+class AnalysisCache:
+    """
+    Hit/miss-counting front for a cache backend.
+
+    Backend failures are logged and treated as misses, so the cache can
+    never make an analysis fail.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "bypassed": 0, "stores": 0, "evictions": 0, "errors": 0}
+        self._hit_seconds = 0.0
+
+    def _count(self, name: str, amount: int = 1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        started = time.perf_counter()
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            print(f"Analysis cache read failed: {e}")
+            self._count("errors")
+            value = None
+        self._count("hits" if value is not None else "misses")
+        if value is not None:
+            with self._lock:
+                self._hit_seconds += time.perf_counter() - started
+        return value
+
+    def set(self, key: str, value: Dict[str, Any]):
+        try:
+            evicted = self.backend.set(key, value)
+        except Exception as e:
+            print(f"Analysis cache write failed: {e}")
+            self._count("errors")
+            return
+        self._count("stores")
+        if evicted:
+            self._count("evictions", evicted)
+
+    def record_bypass(self):
+        self._count("bypassed")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+            hit_seconds = self._hit_seconds
+        lookups = counters["hits"] + counters["misses"]
+        try:
+            backend = self.backend.stats()
+        except Exception as e:
+            backend = {"error": str(e)}
+        return {
+            **counters,
+            "hit_rate": round(counters["hits"] / lookups, 3) if lookups else None,
+            "avg_hit_ms": round(hit_seconds / counters["hits"] * 1000, 2) if counters["hits"] else None,
+            **backend
+        }
+
+
+_cache: Optional[AnalysisCache] = None
+_cache_configured = False
+_cache_lock = threading.Lock()
+
+
+def get_analysis_cache() -> Optional[AnalysisCache]:
+    """The process-wide analysis cache configured from env (None when disabled)."""
+    global _cache, _cache_configured
+    with _cache_lock:
+        if _cache_configured:
+            return _cache
+
+        backend_name = os.getenv("ANALYSIS_CACHE_BACKEND", "disk").lower()
+        max_bytes = int(os.getenv("ANALYSIS_CACHE_MAX_BYTES", str(DEFAULT_MAX_BYTES)))
+        if backend_name == "disk":
+            backend = DiskCacheBackend(os.getenv("ANALYSIS_CACHE_DIR", DEFAULT_CACHE_DIR), max_bytes)
+        elif backend_name == "mongo":
+            import db_registry
+            db = db_registry.get_database("food_preferences", os.getenv("MONGODB_URI"))
+            backend = MongoCacheBackend(db[CACHE_COLLECTION], max_bytes)
+        elif backend_name in ("off", "none", ""):
+            backend = None
+        else:
+            raise ValueError(f"Unknown ANALYSIS_CACHE_BACKEND: {backend_name}")
+
+        _cache = AnalysisCache(backend) if backend is not None else None
+        _cache_configured = True
+        return _cache
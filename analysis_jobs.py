@@ -0,0 +1,363 @@
+"""
+Durable background queue for vision analyses.
+
+Submitting an analysis stores a job in a local SQLite database and returns
+its id right away; a bounded pool of worker threads runs the analyses.
+Jobs survive restarts: anything still marked running by a process that is
+no longer alive is put back in the queue when the next process starts.
+
+Environment:
+    ANALYSIS_JOBS_DB             SQLite file (default .cache/analysis_jobs.sqlite3)
+    ANALYSIS_JOB_WORKERS         Concurrent analyses (default 4)
+    ANALYSIS_JOB_MAX_QUEUED      Queued jobs before submissions are refused (default 1000)
+    ANALYSIS_JOB_RETENTION_HOURS Finished jobs are deleted after this long (default 24)
+"""
+from collections import deque
+from typing import Any, Dict, List, Optional
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "analysis_jobs.sqlite3")
+
+# A job requeued after this many interrupted attempts is failed instead
+MAX_ATTEMPTS = 3
+
+# Recent wait/run times kept for percentiles
+_SAMPLE_SIZE = 1000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload BLOB,
+    use_cache INTEGER NOT NULL DEFAULT 1,
+    status TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    owner_pid INTEGER,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at);
+"""
+
+
+class QueueFullError(Exception):
+    """Raised when the number of queued jobs has reached its limit."""
+
+
+def _pid_alive(pid: Optional[int]) -> bool:
+    if not pid or pid == os.getpid():
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _percentile(samples: List[float], fraction: float) -> Optional[float]:
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class AnalysisJobQueue:
+    """SQLite-backed job queue with a bounded pool of analysis workers."""
+
+    def __init__(
+        self,
+        path: str = DEFAULT_DB_PATH,
+        workers: int = 4,
+        max_queued: int = 1000,
+        retention_hours: float = 24
+    ):
+        """
+        Args:
+            path: SQLite database file
+            workers: Number of worker threads (concurrent analyses)
+            max_queued: Queued jobs before submit() raises QueueFullError
+            retention_hours: Age after which finished jobs are deleted
+        """
+        self.path = path
+        self.workers = workers
+        self.max_queued = max_queued
+        self.retention_seconds = retention_hours * 3600
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+        self._db_lock = threading.Lock()
+        self._work_available = threading.Condition()
+        self._threads: List[threading.Thread] = []
+        self._stopping = False
+
+        self._metrics_lock = threading.Lock()
+        self._wait_times = deque(maxlen=_SAMPLE_SIZE)
+        self._run_times = deque(maxlen=_SAMPLE_SIZE)
+        self._completed = {"succeeded": 0, "failed": 0}
+        self._last_cleanup = 0.0
+
+    # --- Lifecycle ---
+
+    def start(self) -> int:
+        """
+        Recover interrupted jobs and start the workers.
+
+        Returns:
+            Number of jobs put back in the queue
+        """
+        recovered = self._recover()
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"analysis-job-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        if recovered:
+            print(f"Requeued {recovered} interrupted analysis jobs")
+        return recovered
+
+    def stop(self, timeout: float = 5.0):
+        """Stop the workers after their current job (unfinished jobs stay in the queue)."""
+        self._stopping = True
+        with self._work_available:
+            self._work_available.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _recover(self) -> int:
+        requeued = 0
+        with self._db_lock:
+            rows = self._db.execute("SELECT id, attempts, owner_pid FROM jobs WHERE status = 'running'").fetchall()
+            for row in rows:
+                if _pid_alive(row['owner_pid']):
+                    continue
+                if row['attempts'] >= MAX_ATTEMPTS:
+                    self._db.execute(
+                        "UPDATE jobs SET status = 'failed', error = ?, payload = NULL, finished_at = ? WHERE id = ?",
+                        (f"Interrupted {row['attempts']} times", time.time(), row['id'])
+                    )
+                else:
+                    self._db.execute(
+                        "UPDATE jobs SET status = 'queued', owner_pid = NULL, started_at = NULL WHERE id = ?",
+                        (row['id'],)
+                    )
+                    requeued += 1
+        return requeued
+
+    # --- Public API ---
+
+    def submit(self, kind: str, payload: Any, use_cache: bool = True) -> str:
+        """
+        Queue an analysis.
+
+        Args:
+            kind: "image" (payload is bytes) or "url" (payload is the image URL)
+            payload: Image bytes or URL
+            use_cache: Whether image analyses may be answered from the analysis cache
+
+        Returns:
+            Job id
+
+        Raises:
+            QueueFullError: If max_queued jobs are already waiting
+        """
+        if kind not in ("image", "url"):
+            raise ValueError(f"Unknown job kind: {kind}")
+        job_id = uuid.uuid4().hex
+        stored = sqlite3.Binary(payload) if kind == "image" else payload.encode("utf-8")
+        with self._db_lock:
+            queued = self._db.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+            if queued >= self.max_queued:
+                raise QueueFullError(f"Analysis queue is full ({queued} jobs waiting)")
+            self._db.execute(
+                "INSERT INTO jobs (id, kind, payload, use_cache, status, created_at) VALUES (?, ?, ?, ?, 'queued', ?)",
+                (job_id, kind, stored, int(use_cache), time.time())
+            )
+        with self._work_available:
+            self._work_available.notify()
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get a job's status (and result once it has succeeded).
+
+        Returns:
+            {"job_id", "status", "kind", "created_at", "started_at", "finished_at",
+             "wait_seconds", "result"?, "error"?, "queue_position"?} or None
+        """
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT id, kind, status, result, error, created_at, started_at, finished_at FROM jobs WHERE id = ?",
+                (job_id,)
+            ).fetchone()
+            position = None
+            if row is not None and row['status'] == 'queued':
+                position = self._db.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND created_at <= ?", (row['created_at'],)
+                ).fetchone()[0]
+        if row is None:
+            return None
+
+        job = {
+            "job_id": row['id'],
+            "kind": row['kind'],
+            "status": row['status'],
+            "created_at": row['created_at'],
+            "started_at": row['started_at'],
+            "finished_at": row['finished_at'],
+            "wait_seconds": round((row['started_at'] or time.time()) - row['created_at'], 3)
+        }
+        if position is not None:
+            job["queue_position"] = position
+        if row['result'] is not None:
+            job["result"] = json.loads(row['result'])
+        if row['error'] is not None:
+            job["error"] = row['error']
+        return job
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth, oldest queued age, and wait/run time percentiles."""
+        with self._db_lock:
+            counts = dict(self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+            oldest = self._db.execute("SELECT MIN(created_at) FROM jobs WHERE status = 'queued'").fetchone()[0]
+        with self._metrics_lock:
+            waits, runs = list(self._wait_times), list(self._run_times)
+            completed = dict(self._completed)
+
+        def summary(samples: List[float]) -> Dict[str, Optional[float]]:
+            return {
+                "avg": round(sum(samples) / len(samples), 3) if samples else None,
+                "p50": _percentile(samples, 0.5),
+                "p95": _percentile(samples, 0.95),
+                "max": max(samples) if samples else None
+            }
+
+        return {
+            "workers": self.workers,
+            "queue_depth": counts.get('queued', 0),
+            "running": counts.get('running', 0),
+            "stored": counts,
+            "max_queued": self.max_queued,
+            "oldest_queued_seconds": round(time.time() - oldest, 3) if oldest else None,
+            "completed_since_start": completed,
+            "wait_seconds": summary(waits),
+            "run_seconds": summary(runs)
+        }
+
+    # --- Workers ---
+
+    def _claim(self) -> Optional[sqlite3.Row]:
+        """Atomically move the oldest queued job to running."""
+        with self._db_lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    "SELECT id, kind, payload, use_cache, created_at FROM jobs "
+                    "WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+                ).fetchone()
+                if row is not None:
+                    self._db.execute(
+                        "UPDATE jobs SET status = 'running', started_at = ?, owner_pid = ?, attempts = attempts + 1 "
+                        "WHERE id = ?",
+                        (time.time(), os.getpid(), row['id'])
+                    )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return row
+
+    def _finish(self, job_id: str, result: Optional[Dict] = None, error: Optional[str] = None):
+        with self._db_lock:
+            self._db.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, payload = NULL, finished_at = ? WHERE id = ?",
+                ("failed" if error is not None else "succeeded",
+                 json.dumps(result, default=str) if result is not None else None,
+                 error, time.time(), job_id)
+            )
+
+    def _cleanup(self):
+        """Delete finished jobs past their retention (at most once a minute)."""
+        now = time.time()
+        if now - self._last_cleanup < 60:
+            return
+        self._last_cleanup = now
+        with self._db_lock:
+            self._db.execute(
+                "DELETE FROM jobs WHERE status IN ('succeeded', 'failed') AND finished_at < ?",
+                (now - self.retention_seconds,)
+            )
+
+    def _run_job(self, job: sqlite3.Row) -> Dict:
+        import food_analysis_service
+        import vision_scheduler
+        if job['kind'] == "image":
+            return food_analysis_service.analyze_image_bytes(
+                bytes(job['payload']), use_cache=bool(job['use_cache']), priority=vision_scheduler.BACKFILL
+            )
+        return food_analysis_service.analyze_image_url(
+            bytes(job['payload']).decode("utf-8"), priority=vision_scheduler.BACKFILL
+        )
+
+    def _worker(self):
+        while not self._stopping:
+            try:
+                job = self._claim()
+            except sqlite3.Error as e:
+                print(f"Analysis queue error: {e}")
+                job = None
+            if job is None:
+                self._cleanup()
+                with self._work_available:
+                    # Also poll, in case another process added jobs to the same file
+                    self._work_available.wait(timeout=1.0)
+                continue
+
+            started = time.time()
+            with self._metrics_lock:
+                self._wait_times.append(round(started - job['created_at'], 3))
+            try:
+                result = self._run_job(job)
+                self._finish(job['id'], result=result)
+                outcome = "succeeded"
+            except Exception as e:
+                print(f"Analysis job {job['id']} failed: {e}")
+                self._finish(job['id'], error=str(e))
+                outcome = "failed"
+            with self._metrics_lock:
+                self._run_times.append(round(time.time() - started, 3))
+                self._completed[outcome] += 1
+
+
+_queue: Optional[AnalysisJobQueue] = None
+_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> AnalysisJobQueue:
+    """The process-wide job queue configured from env, started on first use."""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = AnalysisJobQueue(
+                path=os.getenv("ANALYSIS_JOBS_DB", DEFAULT_DB_PATH),
+                workers=int(os.getenv("ANALYSIS_JOB_WORKERS", "4")),
+                max_queued=int(os.getenv("ANALYSIS_JOB_MAX_QUEUED", "1000")),
+                retention_hours=float(os.getenv("ANALYSIS_JOB_RETENTION_HOURS", "24"))
+            )
+            _queue.start()
+        return _queue
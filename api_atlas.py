@@ -1,11 +1,18 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, Response, request, jsonify, render_template, stream_with_context
 from flask_cors import CORS
+from werkzeug.exceptions import RequestEntityTooLarge
 from user_preference_manager import UserFoodPreferenceManager
+from datetime import datetime
 import json
 import os
 import socket
 from dotenv import load_dotenv
 import services
+import command_monitor
+import db_registry
+import metrics
+import schema
+import upload_streaming
 # from pyngrok import ngrok
 
 # Load environment variables from .env file
@@ -14,6 +21,25 @@ load_dotenv()
 app = Flask(__name__)
 CORS(app)  # This enables CORS for all routes and all origins
 
+# Reject oversized bodies before reading them; spool large uploads to disk
+app.request_class = upload_streaming.SpooledRequest
+app.config['MAX_CONTENT_LENGTH'] = upload_streaming.MAX_UPLOAD_BYTES
+
+ANALYZE_BATCH_MAX_IMAGES = int(os.getenv("ANALYZE_BATCH_MAX_IMAGES", "8"))
+
+# Per-route request counts, latency and Mongo/vision time; registered first so it times the other hooks
+metrics.init_app(app)
+# MongoDB round trips per request (X-DB-* headers in debug mode)
+command_monitor.init_app(app)
+
+@app.errorhandler(413)
+def request_too_large(e):
+    upload_streaming.record_rejected()
+    return jsonify({
+        "success": False,
+        "error": f"Request body exceeds the {request.max_content_length // (1024 * 1024)} MB limit"
+    }), 413
+
 # --- Documentation ---
 @app.route('/')
 @app.route('/docs')
@@ -76,6 +102,27 @@ def documentation():
             </div>
         </div>
 
+        <div class="endpoint">
+            <span class="method post">POST</span> <span class="url">/api/analyze/batch</span>
+            <div class="desc">Analyze up to 8 images of one tray concurrently. Send <code>multipart/form-data</code> with repeated <code>files</code> fields, or a JSON body with <code>image_urls</code>. Results come back in the order given, each with its own <code>success</code> flag.</div>
+            <pre>{ "image_urls": ["https://example.com/plate1.jpg", "https://example.com/plate2.jpg"] }</pre>
+            <div class="response-format">
+                <strong>Returns:</strong>
+                <pre>{
+  "success": true,
+  "count": 2,
+  "succeeded": 2,
+  "elapsed_ms": 4210.5,
+  "results": [ { "success": true, "analysis": { ... }, "cached": false, "elapsed_ms": 4180.2 }, ... ]
+}</pre>
+            </div>
+        </div>
+
+        <div class="endpoint">
+            <span class="method get">GET</span> <span class="url">/api/analyze/jobs/&lt;job_id&gt;</span>
+            <div class="desc">Both analyze endpoints accept <code>?async=1</code>: they answer <code>202</code> with a <code>job_id</code> right away and the analysis runs in the background. Poll this endpoint for <code>status</code> (<code>queued</code>, <code>running</code>, <code>succeeded</code>, <code>failed</code>) and <code>result</code>.</div>
+        </div>
+
         <h2>User Management</h2>
 
         <div class="endpoint">
@@ -105,6 +152,15 @@ def documentation():
 }</pre>
         </div>
 
+        <div class="endpoint">
+            <span class="method post">POST</span> <span class="url">/api/user/preferences/bulk-update</span>
+            <div class="desc">Apply many updates at once (JSON array, <code>{"updates": [...]}</code> or NDJSON with <code>Content-Type: application/x-ndjson</code>). Returns a result per item.</div>
+            <pre>[
+  { "user_id": "u123", "waste_analysis": { ... } },
+  { "user_id": "u456", "waste_analysis": { ... } }
+]</pre>
+        </div>
+
         <div class="endpoint">
             <span class="method get">GET</span> <span class="url">/api/user/&lt;user_id&gt;/summary</span>
             <div class="desc">Get comprehensive user summary and stats.</div>
@@ -175,6 +231,10 @@ def documentation():
 def analyze_image():
     """
     Analyze an uploaded image file for food waste.
+    
+    Identical images are answered from the analysis cache; pass
+    ?nocache=1 to force a fresh analysis. The upload is consumed as a
+    (possibly disk-spooled) stream rather than read into memory.
     """
     try:
         if 'file' not in request.files:
@@ -184,14 +244,82 @@ def analyze_image():
         if file.filename == '':
             return jsonify({"success": False, "error": "No selected file"}), 400
 
-        image_bytes = file.read()
-        analysis_result = services.analyze_food_waste_image(image_bytes)
-        return jsonify({"success": True, "analysis": analysis_result}), 200
+        upload_streaming.record_upload(file.stream)
+        use_cache = request.args.get('nocache', '').lower() not in ('1', 'true', 'yes')
+        if _wants_async():
+            # The job queue persists the bytes, so this path has to read them
+            return _submit_analysis_job("image", file.read(), use_cache=use_cache)
+        with upload_streaming.trace_memory(upload_streaming.stream_size(file.stream)) as trace:
+            analysis_result = services.analyze_food_waste_upload(file.stream, use_cache=use_cache)
+        response = jsonify({"success": True, "analysis": analysis_result})
+        if trace.peak_bytes is not None:
+            response.headers['X-Upload-Peak-Memory'] = str(trace.peak_bytes)
+        return response, 200
         
+    except RequestEntityTooLarge:
+        raise
     except Exception as e:
         print(f"Analysis error: {e}")
         return jsonify({"success": False, "error": str(e)}), 500
 
+@app.route('/api/analyze/batch', methods=['POST'])
+def analyze_batch():
+    """
+    Analyze several images of one tray concurrently.
+
+    Send either multipart files (field `files`, repeated) or JSON
+    {"image_urls": [...]}. Results are returned in the order given; one
+    failed image does not fail the others. The body may hold
+    ANALYZE_BATCH_MAX_IMAGES uploads; each file is limited to MAX_UPLOAD_BYTES.
+    """
+    try:
+        max_images = ANALYZE_BATCH_MAX_IMAGES
+        if request.files:
+            files = request.files.getlist('files') or request.files.getlist('file')
+            files = [file for file in files if file.filename]
+            for file in files:
+                if upload_streaming.stream_size(file.stream) > upload_streaming.MAX_UPLOAD_BYTES:
+                    upload_streaming.record_rejected()
+                    return jsonify({
+                        "success": False,
+                        "error": f"{file.filename} exceeds the "
+                                 f"{upload_streaming.MAX_UPLOAD_BYTES // (1024 * 1024)} MB per-image limit"
+                    }), 413
+            images = [file.stream for file in files]
+            for stream in images:
+                upload_streaming.record_upload(stream)
+        else:
+            data = request.get_json(silent=True) or {}
+            images = data.get('image_urls') or []
+            if not isinstance(images, list) or not all(isinstance(url, str) for url in images):
+                return jsonify({"success": False, "error": "image_urls must be a list of strings"}), 400
+
+        if not images:
+            return jsonify({"success": False, "error": "Provide files or image_urls"}), 400
+        if len(images) > max_images:
+            return jsonify({"success": False, "error": f"At most {max_images} images per batch"}), 400
+
+        use_cache = request.args.get('nocache', '').lower() not in ('1', 'true', 'yes')
+        started = datetime.now()
+        results = services.analyze_food_waste_batch(images, use_cache=use_cache)
+        elapsed_ms = (datetime.now() - started).total_seconds() * 1000
+        return jsonify({
+            "success": True,
+            "count": len(results),
+            "succeeded": sum(1 for result in results if result["success"]),
+            "elapsed_ms": round(elapsed_ms, 1),
+            "results": results
+        }), 200
+
+    except RequestEntityTooLarge:
+        raise
+    except Exception as e:
+        print(f"Batch analysis error: {e}")
+        return jsonify({"success": False, "error": str(e)}), 500
+
+# Room for a full batch of uploads; analyze_batch checks each file against MAX_UPLOAD_BYTES
+upload_streaming.set_endpoint_limit('analyze_batch', ANALYZE_BATCH_MAX_IMAGES)
+
 @app.route('/api/analyze/url', methods=['POST'])
 def analyze_url():
     """
@@ -203,12 +331,58 @@ def analyze_url():
             return jsonify({"success": False, "error": "image_url is required"}), 400
             
         image_url = data['image_url']
+        if _wants_async():
+            return _submit_analysis_job("url", image_url)
         analysis_result = services.analyze_food_waste_url(image_url)
         return jsonify({"success": True, "analysis": analysis_result}), 200
         
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
+def _wants_async() -> bool:
+    """True when the client asked for job mode (?async=1)."""
+    return request.args.get('async', '').lower() in ('1', 'true', 'yes')
+
+def _submit_analysis_job(kind, payload, use_cache=True):
+    """Queue an analysis and answer 202 with the job id (503 when the queue is full)."""
+    import analysis_jobs
+    try:
+        job_id = analysis_jobs.get_job_queue().submit(kind, payload, use_cache=use_cache)
+    except analysis_jobs.QueueFullError as e:
+        return jsonify({"success": False, "error": str(e)}), 503
+    return jsonify({
+        "success": True,
+        "job_id": job_id,
+        "status": "queued",
+        "status_url": f"/api/analyze/jobs/{job_id}"
+    }), 202
+
+@app.route('/api/analyze/jobs/<job_id>', methods=['GET'])
+def get_analysis_job(job_id):
+    """
+    Get the status of a queued analysis.
+    
+    Returns:
+    {
+        "success": true,
+        "job": {
+            "job_id": "...",
+            "status": "queued" | "running" | "succeeded" | "failed",
+            "result": { ... },      // when succeeded (same shape as "analysis")
+            "error": "...",         // when failed
+            "queue_position": 3     // while queued
+        }
+    }
+    """
+    try:
+        import analysis_jobs
+        job = analysis_jobs.get_job_queue().get(job_id)
+        if job is None:
+            return jsonify({"success": False, "error": "Job not found"}), 404
+        return jsonify({"success": True, "job": job}), 200
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
 
 MONGODB_URI = os.getenv("MONGODB_URI")
 
@@ -236,6 +410,19 @@ def get_manager():
             )
     return manager
 
+@app.before_request
+def ensure_database_schema():
+    """
+    Startup hook: bootstrap indexes and the schema version once per process.
+    After the first request this is an in-memory check only.
+    """
+    if not MONGODB_URI:
+        return
+    try:
+        schema.ensure_schema(db_registry.get_database("food_preferences", MONGODB_URI))
+    except Exception as e:
+        print(f"Schema bootstrap error: {e}")
+
 @app.route('/api/user/preferences/update', methods=['POST'])
 def update_preferences():
     """
@@ -297,6 +484,143 @@ def update_preferences():
             "error": str(e)
         }), 500
 
+# Bulk ingest limits (items are applied in chunks so memory stays bounded)
+BULK_UPDATE_MAX_ITEMS = int(os.getenv("BULK_UPDATE_MAX_ITEMS", "10000"))
+BULK_UPDATE_CHUNK_SIZE = int(os.getenv("BULK_UPDATE_CHUNK_SIZE", "500"))
+
+class BulkUpdateTooLarge(ValueError):
+    """A bulk update body holds more than BULK_UPDATE_MAX_ITEMS items."""
+
+    def __init__(self, count=None):
+        self.count = count
+        super().__init__(f"Too many updates (max {BULK_UPDATE_MAX_ITEMS})")
+
+def _iter_bulk_update_items():
+    """
+    Yield raw update items from a bulk request body.
+    
+    Accepts a JSON array, {"updates": [...]}, or NDJSON (one update per line,
+    Content-Type application/x-ndjson), which is read line by line.
+    """
+    if request.mimetype in ('application/x-ndjson', 'application/ndjson'):
+        for line in request.stream:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                yield ValueError(f"Invalid JSON line: {e}")
+        return
+    
+    data = request.get_json(silent=True)
+    if isinstance(data, dict):
+        data = data.get('updates')
+    if not isinstance(data, list):
+        raise ValueError("Expected a JSON array of updates, {\"updates\": [...]} or NDJSON")
+    # The whole array is in memory already, so reject it before anything is written
+    if len(data) > BULK_UPDATE_MAX_ITEMS:
+        raise BulkUpdateTooLarge(len(data))
+    yield from data
+
+@app.route('/api/user/preferences/bulk-update', methods=['POST'])
+def bulk_update_preferences():
+    """
+    Update preferences for many meals (e.g. a tray-return station backlog).
+    
+    Expected body: JSON array of {"user_id", "waste_analysis"} objects,
+    {"updates": [...]}, or NDJSON with one such object per line.
+    
+    Returns:
+    {
+        "success": true,
+        "results": [ {"index": 0, "user_id": "user123", "success": true}, ... ],
+        "count": 2,
+        "succeeded": 2,
+        "failed": 0
+    }
+    """
+    try:
+        from models import UpdatePreferencesRequest
+        from pydantic import ValidationError
+        
+        results = []
+        chunk = []
+        
+        def apply_chunk():
+            valid = [item for item in chunk if 'update' in item]
+            if valid:
+                applied = get_manager().bulk_update_user_preferences([item['update'] for item in valid])
+                for item, result in zip(valid, applied):
+                    item['result'].update(success=result['success'])
+                    if 'error' in result:
+                        item['result']['error'] = result['error']
+            results.extend(item['result'] for item in chunk)
+            chunk.clear()
+        
+        for index, raw in enumerate(_iter_bulk_update_items()):
+            if index >= BULK_UPDATE_MAX_ITEMS:
+                # NDJSON is streamed, so earlier chunks may already be written: apply the
+                # items below the limit and report exactly which ones were, so a retry
+                # resends only the rest instead of applying meals twice
+                apply_chunk()
+                succeeded = sum(1 for result in results if result['success'])
+                return jsonify({
+                    "success": False,
+                    "error": f"Too many updates (max {BULK_UPDATE_MAX_ITEMS}); "
+                             f"items from index {BULK_UPDATE_MAX_ITEMS} on were not applied",
+                    "results": results,
+                    "count": len(results),
+                    "succeeded": succeeded,
+                    "failed": len(results) - succeeded,
+                    "not_applied_from_index": BULK_UPDATE_MAX_ITEMS
+                }), 413
+            
+            item = {"result": {"index": index, "user_id": raw.get('user_id') if isinstance(raw, dict) else None}}
+            if isinstance(raw, Exception):
+                item['result'].update(success=False, error=str(raw))
+            else:
+                try:
+                    validated = UpdatePreferencesRequest(**raw) if isinstance(raw, dict) else None
+                    if validated is None:
+                        raise ValueError("Each update must be a JSON object")
+                    item['update'] = validated.model_dump()
+                except (ValidationError, ValueError) as e:
+                    item['result'].update(success=False, error=str(e))
+            chunk.append(item)
+            
+            if len(chunk) >= BULK_UPDATE_CHUNK_SIZE:
+                apply_chunk()
+        apply_chunk()
+        
+        succeeded = sum(1 for result in results if result['success'])
+        return jsonify({
+            "success": True,
+            "results": results,
+            "count": len(results),
+            "succeeded": succeeded,
+            "failed": len(results) - succeeded
+        }), 200
+        
+    except BulkUpdateTooLarge as e:
+        return jsonify({
+            "success": False,
+            "error": str(e),
+            "count": e.count,
+            "succeeded": 0,
+            "not_applied_from_index": 0
+        }), 413
+    except ValueError as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 400
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
 @app.route('/api/user/<user_id>/summary', methods=['GET'])
 def get_user_summary(user_id):
     """
@@ -568,7 +892,6 @@ def get_dining_hall_menu(hall_name):
         meal_period = request.args.get('meal_period', default='lunch', type=str)
         manager = DiningHallManager(mongodb_uri=os.getenv("MONGODB_URI"), db_name="food_preferences")
         items = manager.get_items_by_hall_and_period(hall_name, meal_period)
-        manager.close()
         return jsonify({"success": True, "items": items, "count": len(items), "dining_hall": hall_name, "meal_period": meal_period}), 200
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
@@ -652,6 +975,209 @@ def get_waste_by_category():
             "error": str(e)
         }), 500
 
+# Seconds between SSE keep-alive comments when nothing changed
+SSE_HEARTBEAT_SECONDS = 15
+
+@app.route('/api/admin/insights/stream', methods=['GET'])
+def stream_admin_insights():
+    """
+    Server-Sent Events stream of the admin dashboard data.
+    
+    Sends a "snapshot" event with the full data
+    ({"insights": {...}, "categories": {...}}), then "delta" events with
+    only the sections that changed ({"insights.summary": {...}, ...}).
+    All connected dashboards share one computation.
+    """
+    import insights_broadcaster
+    
+    broadcaster = insights_broadcaster.get_broadcaster()
+    subscription = broadcaster.subscribe()
+    
+    def generate():
+        try:
+            yield "retry: 5000\n\n"
+            while not subscription.closed:
+                event = subscription.get(timeout=SSE_HEARTBEAT_SECONDS)
+                if event is None:
+                    yield ": keep-alive\n\n"
+                    continue
+                name, version, data = event
+                yield f"event: {name}\nid: {version}\ndata: {data}\n\n"
+        finally:
+            broadcaster.unsubscribe(subscription)
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.route('/api/admin/insights/stream/stats', methods=['GET'])
+def get_insights_stream_stats():
+    """Get subscriber and computation counters for the dashboard stream."""
+    try:
+        import insights_broadcaster
+        return jsonify({"success": True, "stream": insights_broadcaster.get_broadcaster().stats()}), 200
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/admin/waste-trends', methods=['GET'])
+def get_admin_waste_trends():
+    """
+    Get meal count and waste percentage over time.
+    
+    Query params:
+        from: ISO date/time, UTC (default: 30 days / 48 hours ago)
+        to: ISO date/time, UTC (default: now)
+        granularity: "day" (default) or "hour"
+        limit: Number of top thrown-away items and meals (default 10)
+    """
+    try:
+        import admin_analytics_service
+        
+        try:
+            start = datetime.fromisoformat(request.args['from']) if request.args.get('from') else None
+            end = datetime.fromisoformat(request.args['to']) if request.args.get('to') else None
+            limit = int(request.args.get('limit', 10))
+            if limit < 1:
+                raise ValueError("limit must be at least 1")
+            trends = admin_analytics_service.get_waste_trends(
+                start=start,
+                end=end,
+                granularity=request.args.get('granularity', 'day'),
+                limit=limit
+            )
+        except ValueError as e:
+            return jsonify({"success": False, "error": str(e)}), 400
+        
+        return jsonify({"success": True, "trends": json.loads(json.dumps(trends, default=str))}), 200
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/admin/db-pool-stats', methods=['GET'])
+def get_db_pool_stats():
+    """Get connection pool statistics for the shared MongoDB clients."""
+    try:
+        pools = db_registry.get_pool_stats()
+        return jsonify({"success": True, "pools": pools, "count": len(pools)}), 200
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/admin/slow-commands', methods=['GET'])
+def get_slow_commands():
+    """Get MongoDB command counters and the most recent slow commands with their query plans."""
+    try:
+        return jsonify({"success": True, "monitor": command_monitor.stats()}), 200
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/admin/meal-history-buffer', methods=['GET'])
+def get_meal_history_buffer_stats():
+    """Get write-behind counters for meal history inserts (null when disabled)."""
+    try:
+        return jsonify({"success": True, "buffer": get_manager().get_history_buffer_stats()}), 200
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/admin/analysis-cache', methods=['GET'])
+def get_analysis_cache_stats():
+    """Get hit/miss counters and size of the vision analysis cache (null when disabled)."""
+    try:
+        import analysis_cache
+        cache = analysis_cache.get_analysis_cache()
+        return jsonify({"success": True, "cache": cache.stats() if cache is not None else None}), 200
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/admin/image-preprocessing', methods=['GET'])
+def get_image_preprocessing_stats():
+    """Get bytes before/after preprocessing for images sent to the vision API."""
+    try:
+        import image_preprocessing
+        return jsonify({"success": True, "preprocessing": image_preprocessing.stats()}), 200
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/admin/uploads', methods=['GET'])
+def get_upload_stats():
+    """Get upload counters, size limits and per-request peak memory (when tracing)."""
+    try:
+        return jsonify({"success": True, "uploads": upload_streaming.stats()}), 200
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/admin/vision-scheduler', methods=['GET'])
+def get_vision_scheduler_stats():
+    """Get rate-limit, retry, and queue-time vs call-time metrics for vision API calls."""
+    try:
+        import vision_scheduler
+        return jsonify({"success": True, "scheduler": vision_scheduler.get_scheduler().stats()}), 200
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/admin/analysis-jobs', methods=['GET'])
+def get_analysis_job_stats():
+    """Get queue depth and wait/run time metrics for queued analyses."""
+    try:
+        import analysis_jobs
+        return jsonify({"success": True, "queue": analysis_jobs.get_job_queue().stats()}), 200
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/admin/matching-jobs', methods=['POST'])
+def start_matching_job():
+    """
+    Start a cohort-wide menu matching job in the background.
+
+    Expected JSON body (all optional):
+    {
+        "dining_halls": ["North Campus Dining"],
+        "meal_periods": ["lunch", "dinner"],
+        "top_n": 10,
+        "chunk_size": 500,
+        "workers": 4
+    }
+
+    top_n, chunk_size and workers must be positive integers; workers is
+    capped at the CPU count.
+    """
+    try:
+        import cohort_matching_job
+
+        data = request.get_json(silent=True) or {}
+        options = {key: data[key] for key in ("dining_halls", "meal_periods", "top_n", "chunk_size", "workers")
+                   if data.get(key) is not None}
+        for key in ("top_n", "chunk_size", "workers"):
+            value = options.get(key)
+            if value is not None and (isinstance(value, bool) or not isinstance(value, int) or value < 1):
+                return jsonify({"success": False, "error": f"{key} must be a positive integer"}), 400
+        if "workers" in options:
+            options["workers"] = min(options["workers"], os.cpu_count() or 1)
+        job = cohort_matching_job.start_job(**options)
+        return jsonify({"success": True, "job": job}), 202
+    except RuntimeError as e:
+        return jsonify({"success": False, "error": str(e)}), 409
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/admin/matching-jobs/<job_id>', methods=['GET'])
+def get_matching_job(job_id):
+    """Get the status and progress of a cohort matching job."""
+    try:
+        import cohort_matching_job
+
+        job = cohort_matching_job.get_job(job_id)
+        if not job:
+            return jsonify({"success": False, "error": f"Job {job_id} not found"}), 404
+        return jsonify({"success": True, "job": job}), 200
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Request, dependency and queue metrics in Prometheus text format."""
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
 @app.route('/admin/dashboard', methods=['GET'])
 def admin_dashboard():
     """Serve the admin analytics dashboard."""
@@ -681,6 +1207,24 @@ def internal_error(error):
         "error": "Internal server error"
     }), 500
 
+def start_analysis_jobs():
+    """
+    Resume persisted analysis jobs on boot: requeue the ones a crash or
+    restart interrupted and start the workers, instead of waiting for the
+    first ?async request or status poll to create the queue.
+
+    Called only from explicit boot paths (the __main__ block below and
+    wsgi.py), never at import: spawned process-pool workers re-import the
+    main script and must not claim jobs.
+    """
+    if os.getenv("ANALYSIS_JOBS_AUTOSTART", "true").lower() in ("0", "false", "off", "no"):
+        return
+    try:
+        import analysis_jobs
+        analysis_jobs.get_job_queue()
+    except Exception as e:
+        print(f"[ERROR] Could not start analysis job workers: {e}")
+
 def find_free_port(start_port=5000, max_attempts=10):
     """Find an available port starting from start_port."""
     for i in range(max_attempts):
@@ -712,4 +1256,8 @@ if __name__ == '__main__':
     print(f"   1. Open a new terminal")
     print(f"   2. Run this: ssh -R 80:localhost:port_number serveo.net")
     
+    # debug=True runs the app in a reloader child (WERKZEUG_RUN_MAIN=true); the watcher parent serves nothing
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_analysis_jobs()
+    
     app.run(debug=True, host='0.0.0.0', port=port)
\ No newline at end of file
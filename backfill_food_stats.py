@@ -0,0 +1,32 @@
+"""
+Backfill per-user food statistics (`food_stats`) from meal history.
+
+New meals keep the counters up to date automatically; run this once for
+users whose history predates the counters, or to repair a single user.
+
+Usage:
+    python backfill_food_stats.py              # all users
+    python backfill_food_stats.py --user-id u1 # one user
+"""
+import argparse
+import sys
+from user_preference_manager import UserFoodPreferenceManager
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rebuild per-user food statistics from meal history")
+    parser.add_argument("--user-id", help="Only rebuild this user")
+    parser.add_argument("--batch-size", type=int, default=500, help="User updates per bulk write")
+    args = parser.parse_args(argv)
+
+    manager = UserFoodPreferenceManager(bootstrap=True)
+    try:
+        updated = manager.rebuild_food_stats(user_id=args.user_id, batch_size=args.batch_size)
+        print(f"✅ Rebuilt food stats for {updated} user(s)")
+    finally:
+        manager.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,446 @@
+"""
+Benchmark: hot-path service functions at several data scales.
+
+Covers calculate_match_score, categorize_food, update_user_preferences,
+get_recommendations, get_dislikes, get_admin_waste_insights (aggregated and
+from the dislike rollup) and _parse_json_response. Results can be saved
+as a JSON baseline and later runs compared against it.
+
+Database-backed benchmarks need a real MongoDB (5.2+; the update pipelines
+use $sortArray and $type): either a throwaway mongod started through
+pymongo_inmemory (`pip install pymongo_inmemory`; it downloads a mongod on
+first use) or a server you point --store at. If neither is available the
+run stops with an error; a benchmark is never silently left out of a
+baseline.
+
+Usage:
+    python benchmarks/hot_paths.py                       # users 10,1000,100000; items 10,100,1000
+    python benchmarks/hot_paths.py --save benchmarks/baseline.json
+    python benchmarks/hot_paths.py --compare benchmarks/baseline.json --threshold 0.15
+    python benchmarks/hot_paths.py --store mongodb://localhost:27017/ --reset-db
+    python benchmarks/hot_paths.py --only calculate_match_score,parse_json_response   # no database needed
+
+Compare runs against the same store (and machine) only.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pymongo.errors import PyMongoError
+
+DB_NAME = "food_preferences"
+
+FOODS = [
+    "broccoli", "brussels sprouts", "spinach", "kale salad", "carrots", "green beans", "cauliflower",
+    "mushrooms", "onions", "peppers", "tomatoes", "cucumber", "zucchini", "eggplant", "asparagus",
+    "grilled chicken", "fried chicken", "beef burger", "salmon", "tuna", "tofu", "shrimp", "pork chop",
+    "white rice", "brown rice", "quinoa", "pasta", "garlic bread", "french fries", "mashed potatoes",
+    "apple", "banana", "grapes", "orange", "yogurt", "cheese", "milk", "ice cream", "chocolate cake",
+    "pickles", "olives", "coleslaw", "black beans", "lentil soup", "chili", "pizza", "tacos", "sushi"
+]
+CATEGORIES = ["protein", "grain", "vegetable", "dairy", "fruit"]
+TAGS = ["healthy", "vegan", "vegetarian", "grilled", "baked", "fried", "gluten-free"]
+
+
+# --- data -------------------------------------------------------------------
+
+def make_menu(n_items, rng):
+    items = []
+    for i in range(n_items):
+        ingredients = rng.sample(FOODS, rng.randint(1, 6))
+        items.append({
+            "item_id": f"item_{i:05d}",
+            "name": f"{rng.choice(['Grilled', 'Baked', 'Steamed', 'Roasted'])} {ingredients[0].title()}",
+            "category": rng.choice(CATEGORIES),
+            "ingredients": ingredients,
+            "tags": rng.sample(TAGS, rng.randint(0, 3))
+        })
+    return items
+
+
+def make_analysis(rng, n_items=3):
+    # Beyond the vocabulary, synthesize distinct names so the payload really grows
+    pool = FOODS if 2 * n_items <= len(FOODS) else [f"{rng.choice(FOODS)} {i}" for i in range(2 * n_items)]
+    picked = rng.sample(pool, 2 * n_items)
+    eaten, thrown = picked[:n_items], picked[n_items:]
+    return {
+        "original_meal": {"name": f"{eaten[0].title()} Plate", "description": "Benchmark meal"},
+        "thrown_away": [{"item": food, "quantity": "1/2 cup", "percentage_of_original": "60%"} for food in thrown],
+        "eaten": [{"item": food, "quantity": "1 cup", "percentage_of_original": "90%"} for food in eaten],
+        "food_preferences": {"likely_dislikes": thrown, "likely_likes": eaten, "insights": "Benchmark"},
+        "waste_summary": {"total_waste_percentage": f"{rng.randint(5, 80)}%", "waste_value": "medium"}
+    }
+
+
+def make_user_doc(user_id, rng, now):
+    liked = rng.sample(FOODS, rng.randint(3, 15))
+    disliked = rng.sample([food for food in FOODS if food not in liked], rng.randint(0, 8))
+    food_stats = {}
+    for food in liked:
+        food_stats[food] = {"eaten_count": rng.randint(1, 10), "thrown_away_count": 0,
+                            "last_eaten": now - timedelta(days=rng.randint(0, 30))}
+    for food in disliked:
+        food_stats[food] = {"eaten_count": 0, "thrown_away_count": rng.randint(1, 6),
+                            "last_thrown_away": now - timedelta(days=rng.randint(0, 30))}
+    return {
+        "user_id": user_id,
+        "user_name": user_id,
+        "liked_foods": liked,
+        "disliked_foods": disliked,
+        "meal_count": rng.randint(1, 40),
+        "total_waste_percentage": round(rng.uniform(5, 70), 1),
+        "food_stats": food_stats,
+        "created_at": now,
+        "updated_at": now
+    }
+
+
+def seed_users(db, n_users, seed=7, batch_size=5000):
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    db.users.delete_many({})
+    db.dislike_rollup.delete_many({})
+    batch = []
+    for i in range(n_users):
+        batch.append(make_user_doc(f"bench_user_{i:06d}", rng, now))
+        if len(batch) >= batch_size:
+            db.users.insert_many(batch)
+            batch = []
+    if batch:
+        db.users.insert_many(batch)
+
+
+# --- timing -----------------------------------------------------------------
+
+def measure(fn, min_time, repeats):
+    """Median/min/p95 microseconds per call over `repeats` timed batches."""
+    # Calibrate the batch size so one batch takes about min_time
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or number >= 1_000_000:
+            break
+        number = min(1_000_000, max(number * 2, int(number * min_time / max(elapsed, 1e-9))))
+
+    per_call = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        per_call.append((time.perf_counter() - start) / number * 1e6)
+    per_call.sort()
+    return {
+        "median_us": round(statistics.median(per_call), 3),
+        "min_us": round(per_call[0], 3),
+        "p95_us": round(per_call[min(len(per_call) - 1, int(0.95 * len(per_call)))], 3),
+        "calls_per_batch": number,
+        "repeats": repeats
+    }
+
+
+@contextlib.contextmanager
+def quiet():
+    # The services print debug lines; keep them out of the report (their cost stays in)
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+# --- benchmarks -------------------------------------------------------------
+
+def bench_calculate_match_score(n_items, ctx):
+    from food_matching_service import calculate_match_score
+
+    rng = random.Random(n_items)
+    items = make_menu(n_items, rng)
+    likes = rng.sample(FOODS, 15)
+    dislikes = rng.sample([food for food in FOODS if food not in likes], 6)
+
+    def run():
+        for item in items:
+            calculate_match_score(likes, dislikes, item)
+    return run
+
+
+def bench_categorize_food(n_items, ctx):
+    from recommendation_service import categorize_food
+
+    rng = random.Random(n_items)
+    names = [f"{rng.choice(['grilled', 'baked', 'spicy', 'fresh'])} {rng.choice(FOODS)} {i}" for i in range(n_items)]
+
+    def run():
+        for name in names:
+            categorize_food(name)
+    return run
+
+
+def bench_categorize_food_uncached(n_items, ctx):
+    from food_categorizer import FoodCategorizer
+    from recommendation_service import FOOD_CATEGORIES
+
+    categorizer = FoodCategorizer(FOOD_CATEGORIES)
+    rng = random.Random(n_items)
+    names = [f"{rng.choice(['grilled', 'baked', 'spicy', 'fresh'])} {rng.choice(FOODS)} {i}" for i in range(n_items)]
+
+    def run():
+        for name in names:
+            categorizer._categorize_uncached(name)
+    return run
+
+
+def _random_user(ctx):
+    return f"bench_user_{ctx['rng'].randrange(ctx['n_users']):06d}"
+
+
+def bench_update_user_preferences(n_users, ctx):
+    analyses = [make_analysis(random.Random(i)) for i in range(20)]
+    manager = ctx["manager"]
+    with quiet():
+        manager.update_user_preferences(_random_user(ctx), analyses[0])
+
+    def run():
+        manager.update_user_preferences(_random_user(ctx), analyses[ctx["rng"].randrange(len(analyses))])
+    return run
+
+
+def bench_get_recommendations(n_users, ctx):
+    from recommendation_service import get_recommendations
+
+    with quiet():
+        if not any(get_recommendations(f"bench_user_{i:06d}", limit=10) for i in range(min(n_users, 10))):
+            raise RuntimeError("get_recommendations returned nothing for seeded users")
+
+    def run():
+        get_recommendations(_random_user(ctx), limit=10)
+    return run
+
+
+def bench_get_dislikes(n_users, ctx):
+    from recommendation_service import get_dislikes
+
+    with quiet():
+        if not any(get_dislikes(f"bench_user_{i:06d}") for i in range(min(n_users, 10))):
+            raise RuntimeError("get_dislikes returned nothing for seeded users")
+
+    def run():
+        get_dislikes(_random_user(ctx))
+    return run
+
+
+def _insights_bench(ctx):
+    from admin_analytics_service import get_admin_waste_insights
+
+    with quiet():
+        result = get_admin_waste_insights(limit=20)
+    if result.get("error"):
+        raise RuntimeError(f"get_admin_waste_insights failed: {result['error']}")
+
+    def run():
+        get_admin_waste_insights(limit=20)
+    return run
+
+
+def bench_get_admin_waste_insights_aggregate(n_users, ctx):
+    ctx["db"].dislike_rollup.delete_many({})
+    return _insights_bench(ctx)
+
+
+def bench_get_admin_waste_insights_rollup(n_users, ctx):
+    import dislike_rollup
+
+    with quiet():
+        dislike_rollup.rebuild(ctx["db"])
+    return _insights_bench(ctx)
+
+
+def bench_parse_json_response(n_items, ctx):
+    from food_analysis_service import _parse_json_response
+
+    analysis = make_analysis(random.Random(n_items), n_items=n_items)
+    text = "```json\n" + json.dumps(analysis, indent=2) + "\n```"
+
+    def run():
+        _parse_json_response(text)
+    return run
+
+
+# (name, scale axis, factory); "items" benchmarks need no database
+BENCHMARKS = [
+    ("calculate_match_score", "items", bench_calculate_match_score),
+    ("categorize_food", "items", bench_categorize_food),
+    ("categorize_food_uncached", "items", bench_categorize_food_uncached),
+    ("parse_json_response", "items", bench_parse_json_response),
+    ("update_user_preferences", "users", bench_update_user_preferences),
+    ("get_recommendations", "users", bench_get_recommendations),
+    ("get_dislikes", "users", bench_get_dislikes),
+    ("get_admin_waste_insights_aggregate", "users", bench_get_admin_waste_insights_aggregate),
+    ("get_admin_waste_insights_rollup", "users", bench_get_admin_waste_insights_rollup),
+]
+
+
+# --- store ------------------------------------------------------------------
+
+def open_store(store, reset_db, stack):
+    """
+    Point the services at the benchmark MongoDB; returns (uri, db, server version).
+
+    "inmemory" starts a throwaway mongod through pymongo_inmemory (stopped
+    when `stack` closes); anything else is a URI whose benchmark
+    collections get wiped, so it needs --reset-db.
+    """
+    import db_registry
+
+    if store == "inmemory":
+        try:
+            from pymongo_inmemory import Mongod
+            from pymongo_inmemory.context import Context
+        except ImportError:
+            raise SystemExit("Database benchmarks need MongoDB: pip install pymongo_inmemory, "
+                             "or pass --store <mongodb uri> --reset-db")
+        try:
+            uri = stack.enter_context(Mongod(Context())).connection_string
+        except Exception as e:
+            raise SystemExit(f"Could not start a mongod through pymongo_inmemory: {e}")
+    else:
+        if not reset_db:
+            raise SystemExit(f"Benchmarks wipe the '{DB_NAME}' users and rollups on {store}; pass --reset-db to confirm")
+        uri = store
+    os.environ["MONGODB_URI"] = uri
+    # Keep meal history writes synchronous so update timings include them
+    os.environ["MEAL_HISTORY_WRITE_BEHIND"] = "false"
+    try:
+        version = db_registry.get_client(uri).server_info()["version"]
+    except PyMongoError as e:
+        raise SystemExit(f"MongoDB at {store} is not reachable: {e}")
+    db = db_registry.get_database(DB_NAME, uri)
+    import schema
+    schema.ensure_schema(db)
+    return uri, db, version
+
+
+# --- baselines --------------------------------------------------------------
+
+def compare(results, baseline, threshold):
+    """Print a comparison table; returns the number of regressions."""
+    regressions = 0
+    print(f"\n{'benchmark':<52}{'baseline':>12}{'current':>12}{'change':>10}")
+    for key, current in results.items():
+        base = baseline.get(key)
+        if not base or "median_us" not in base or "median_us" not in current:
+            continue
+        change = current["median_us"] / base["median_us"] - 1 if base["median_us"] else 0.0
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        elif change < -threshold:
+            flag = "  faster"
+        print(f"{key:<52}{base['median_us']:>10.1f}us{current['median_us']:>10.1f}us{change:>+9.1%}{flag}")
+    missing = sorted(set(baseline) - set(results))
+    if missing:
+        print(f"(not run this time: {', '.join(missing)})")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", default="10,1000,100000", help="User scales, comma-separated")
+    parser.add_argument("--items", default="10,100,1000", help="Menu/item scales, comma-separated")
+    parser.add_argument("--only", help="Comma-separated benchmark names to run")
+    parser.add_argument("--store", default=os.getenv("BENCHMARK_MONGODB_URI", "inmemory"),
+                        help="'inmemory' (throwaway mongod via pymongo_inmemory) or a MongoDB URI "
+                             "(default: BENCHMARK_MONGODB_URI or inmemory)")
+    parser.add_argument("--reset-db", action="store_true", help="Allow wiping the benchmark collections on a real MongoDB")
+    parser.add_argument("--min-time", type=float, default=0.1, help="Seconds per timed batch")
+    parser.add_argument("--repeats", type=int, default=5, help="Timed batches per benchmark")
+    parser.add_argument("--save", help="Write results to this JSON baseline")
+    parser.add_argument("--compare", help="Compare against this JSON baseline")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Relative slowdown flagged as a regression")
+    args = parser.parse_args(argv)
+
+    user_scales = [int(n) for n in args.users.split(",") if n]
+    item_scales = [int(n) for n in args.items.split(",") if n]
+    only = set(args.only.split(",")) if args.only else None
+    selected = [bench for bench in BENCHMARKS if not only or bench[0] in only]
+
+    results = {}
+    server_version = None
+
+    def run_one(name, scale_name, scale, factory, ctx):
+        # Any failure aborts the run: a baseline must not silently miss a benchmark
+        key = f"{name}[{scale_name}={scale}]"
+        fn = factory(scale, ctx)
+        with quiet():
+            results[key] = measure(fn, args.min_time, args.repeats)
+        row = results[key]
+        print(f"{key:<52}{row['median_us']:>12.1f} us  (min {row['min_us']:.1f}, p95 {row['p95_us']:.1f})")
+
+    print(f"{'benchmark':<52}{'median':>15}")
+    for name, axis, factory in selected:
+        if axis == "items":
+            for scale in item_scales:
+                run_one(name, "items", scale, factory, {})
+
+    db_benchmarks = [bench for bench in selected if bench[1] == "users"]
+    if db_benchmarks:
+        from user_preference_manager import UserFoodPreferenceManager
+
+        with contextlib.ExitStack() as stack:
+            uri, db, server_version = open_store(args.store, args.reset_db, stack)
+            print(f"-- MongoDB {server_version}")
+            for n_users in user_scales:
+                started = time.perf_counter()
+                seed_users(db, n_users)
+                print(f"-- seeded {n_users} users in {time.perf_counter() - started:.1f}s")
+                manager = UserFoodPreferenceManager(mongodb_uri=uri, db_name=DB_NAME)
+                for name, _, factory in db_benchmarks:
+                    ctx = {"db": db, "manager": manager, "n_users": n_users, "rng": random.Random(n_users)}
+                    run_one(name, "users", n_users, factory, ctx)
+
+    report = {
+        "meta": {
+            "created_at": datetime.utcnow().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "store": "inmemory" if args.store == "inmemory" else "mongodb",
+            "mongodb_version": server_version,
+            "users": user_scales,
+            "items": item_scales,
+            "min_time": args.min_time,
+            "repeats": args.repeats
+        },
+        "results": results
+    }
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nBaseline written to {args.save}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get("meta", {}).get("store") != report["meta"]["store"]:
+            print(f"⚠️  Baseline was recorded on a different store ({baseline.get('meta', {}).get('store')})")
+        regressions = compare(results, baseline.get("results", {}), args.threshold)
+        if regressions:
+            print(f"\n❌ {regressions} benchmark(s) slower than baseline by more than {args.threshold:.0%}")
+            return 1
+        print(f"\n✅ No regressions beyond {args.threshold:.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
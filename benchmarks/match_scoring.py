@@ -0,0 +1,116 @@
+"""
+Benchmark: per-item calculate_match_score vs. the vectorized MenuScoringEngine
+(with and without the MenuIndex inverted index).
+
+Runs offline on synthetic menus and users, checks that both produce identical
+ranked results (scores, match_reasons, confidence), then reports timings.
+
+Usage:
+    python benchmarks/match_scoring.py
+    python benchmarks/match_scoring.py --items 500 --likes 300 --users 50
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from food_matching_service import calculate_match_score
+from menu_scoring import MenuScoringEngine
+from menu_index import MenuIndex
+
+VOCABULARY = [
+    "chicken", "beef", "pork", "salmon", "tofu", "rice", "brown rice", "pasta", "bread", "quinoa",
+    "broccoli", "carrots", "spinach", "lettuce", "tomatoes", "onions", "garlic", "olive oil",
+    "butter", "cheese", "milk", "yogurt", "lemon", "herbs", "soy sauce", "ginger", "mushrooms",
+    "peppers", "beans", "lentils", "potatoes", "fries", "apples", "grapes", "honey", "dill"
+]
+CATEGORIES = ["protein", "grain", "vegetable", "dairy", "fruit"]
+TAGS = ["healthy", "vegan", "vegetarian", "grilled", "baked", "fried", "gluten-free"]
+
+
+def make_menu(n_items, rng):
+    items = []
+    for i in range(n_items):
+        ingredients = rng.sample(VOCABULARY, rng.randint(1, 6))
+        items.append({
+            "item_id": f"item_{i:05d}",
+            "name": f"{rng.choice(['Grilled', 'Baked', 'Steamed', 'Roasted'])} {ingredients[0].title()}",
+            "category": rng.choice(CATEGORIES),
+            "ingredients": ingredients,
+            "tags": rng.sample(TAGS, rng.randint(0, 3))
+        })
+    return items
+
+
+def make_user(n_likes, n_dislikes, rng):
+    extra = [f"food {i}" for i in range(max(n_likes, n_dislikes))]
+    pool = VOCABULARY + CATEGORIES + extra
+    likes = rng.sample(pool, min(n_likes, len(pool)))
+    dislikes = rng.sample([f for f in pool if f not in likes], min(n_dislikes, len(pool) - len(likes)))
+    return likes, dislikes
+
+
+def rank_reference(items, likes, dislikes, limit):
+    matched = []
+    for item in items:
+        score, reasons, confidence = calculate_match_score(likes, dislikes, item)
+        matched.append({"item": item, "match_score": round(score, 1),
+                        "match_reasons": reasons, "confidence": confidence})
+    matched.sort(key=lambda x: x['match_score'], reverse=True)
+    return matched[:limit]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--items", type=int, default=300, help="Menu items per hall")
+    parser.add_argument("--likes", type=int, default=200, help="Liked foods per user")
+    parser.add_argument("--dislikes", type=int, default=20, help="Disliked foods per user")
+    parser.add_argument("--users", type=int, default=20, help="Users to score")
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    items = make_menu(args.items, rng)
+    users = [make_user(args.likes, args.dislikes, rng) for _ in range(args.users)]
+
+    start = time.perf_counter()
+    reference = [rank_reference(items, likes, dislikes, args.limit) for likes, dislikes in users]
+    reference_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    engine = MenuScoringEngine(items)
+    build_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    vectorized = [engine.rank(likes, dislikes, args.limit) for likes, dislikes in users]
+    vectorized_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    indexed_engine = MenuScoringEngine(items, index=MenuIndex(items))
+    indexed_build_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    indexed = [indexed_engine.rank(likes, dislikes, args.limit) for likes, dislikes in users]
+    indexed_time = time.perf_counter() - start
+
+    mismatches = sum(1 for expected, actual in zip(reference, vectorized) if expected != actual)
+    mismatches += sum(1 for expected, actual in zip(reference, indexed) if expected != actual)
+
+    print(f"Menu: {args.items} items | Users: {args.users} x {args.likes} likes / {args.dislikes} dislikes")
+    print(f"  calculate_match_score : {reference_time / args.users * 1000:8.2f} ms/user")
+    print(f"  MenuScoringEngine     : {vectorized_time / args.users * 1000:8.2f} ms/user "
+          f"(+ {build_time * 1000:.2f} ms one-time build)")
+    print(f"  Engine + MenuIndex    : {indexed_time / args.users * 1000:8.2f} ms/user "
+          f"(+ {indexed_build_time * 1000:.2f} ms one-time build)")
+    print(f"  Speedup               : {reference_time / vectorized_time:8.1f}x / "
+          f"{reference_time / indexed_time:.1f}x")
+    print(f"  Identical results     : {'yes' if mismatches == 0 else f'NO ({mismatches} users differ)'}")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
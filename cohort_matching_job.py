@@ -0,0 +1,284 @@
+"""
+Cohort-wide menu matching job.
+
+Scores every user against every hall/meal-period menu and stores each
+user's top-N matches in the `menu_match_results` collection (one document
+per user, hall and meal period), e.g. to notify students when a new menu
+is published.
+
+Users are streamed from MongoDB in chunks and scored across a process
+pool; each worker builds the menu scoring engines once at startup.
+
+Usage:
+    python cohort_matching_job.py
+    python cohort_matching_job.py --halls "North Campus Dining" --periods lunch dinner --top-n 5
+"""
+from pymongo import UpdateOne
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+import argparse
+import multiprocessing
+import os
+import sys
+import threading
+import time
+import uuid
+from dotenv import load_dotenv
+import db_registry
+from dining_hall_manager import DiningHallManager
+from menu_index import MenuIndex
+from menu_scoring import MenuScoringEngine
+
+load_dotenv()
+
+RESULTS_COLLECTION = "menu_match_results"
+DEFAULT_MEAL_PERIODS = ("breakfast", "lunch", "dinner")
+
+# --- Worker side ---
+
+_worker_engines: Dict[tuple, MenuScoringEngine] = {}
+_worker_top_n = 10
+
+
+def _init_worker(menus: Dict[tuple, List[Dict]], top_n: int):
+    """Build one scoring engine per menu, once per worker process."""
+    global _worker_engines, _worker_top_n
+    _worker_engines = {key: MenuScoringEngine(items, index=MenuIndex(items)) for key, items in menus.items()}
+    _worker_top_n = top_n
+
+
+def _score_chunk(users: List[Dict]) -> List[Dict]:
+    """Score a chunk of users against every menu; returns result documents."""
+    results = []
+    for user in users:
+        likes = user.get('liked_foods', [])
+        dislikes = user.get('disliked_foods', [])
+        for (dining_hall, meal_period), engine in _worker_engines.items():
+            matches = engine.rank(likes, dislikes, limit=_worker_top_n)
+            results.append({
+                "user_id": user['user_id'],
+                "dining_hall": dining_hall,
+                "meal_period": meal_period,
+                "matches": [
+                    {
+                        "item_id": match['item'].get('item_id'),
+                        "name": match['item'].get('name'),
+                        "match_score": match['match_score'],
+                        "match_reasons": match['match_reasons'],
+                        "confidence": match['confidence']
+                    }
+                    for match in matches
+                ]
+            })
+    return results
+
+
+# --- Coordinator side ---
+
+def run_cohort_matching(
+    dining_halls: Optional[List[str]] = None,
+    meal_periods: List[str] = DEFAULT_MEAL_PERIODS,
+    top_n: int = 10,
+    chunk_size: int = 500,
+    workers: Optional[int] = None,
+    progress: Optional[Callable[[Dict], None]] = None,
+    job_id: Optional[str] = None,
+    mongodb_uri: Optional[str] = None,
+    db_name: str = "food_preferences"
+) -> Dict:
+    """
+    Compute and store the top-N menu matches for every user.
+
+    Args:
+        dining_halls: Halls to score (default: all halls on the menu)
+        meal_periods: Meal periods to score
+        top_n: Matches stored per user, hall and meal period
+        chunk_size: Users per work unit (and per cursor batch)
+        workers: Worker processes (default and maximum: CPU count)
+        progress: Called with a progress dict after each chunk is stored
+        job_id: Identifier stored on result documents
+        mongodb_uri: MongoDB connection string (if None, reads from env)
+        db_name: Database name
+
+    Returns:
+        Final progress dict
+    """
+    job_id = job_id or uuid.uuid4().hex
+    db = db_registry.get_database(db_name, mongodb_uri or os.getenv("MONGODB_URI"))
+    dining_manager = DiningHallManager(mongodb_uri=mongodb_uri, db_name=db_name)
+    snapshot = dining_manager.get_menu_snapshot()
+
+    menus = {}
+    for dining_hall in dining_halls or snapshot.halls():
+        for meal_period in meal_periods:
+            items = snapshot.items_for(dining_hall, meal_period)
+            if items:
+                menus[(dining_hall, meal_period)] = items
+
+    users_collection = db['users']
+    results_collection = db[RESULTS_COLLECTION]
+    total_users = users_collection.estimated_document_count()
+    # More processes than CPUs only adds interpreter start-up and memory
+    workers = min(workers or os.cpu_count() or 1, os.cpu_count() or 1)
+
+    state = {
+        "job_id": job_id,
+        "menus": len(menus),
+        "total_users": total_users,
+        "processed_users": 0,
+        "results_written": 0,
+        "users_per_second": 0.0,
+        "eta_seconds": None,
+        "elapsed_seconds": 0.0
+    }
+    if not menus:
+        return state
+
+    started = time.monotonic()
+    computed_at = datetime.utcnow()
+
+    def store(results: List[Dict]):
+        operations = [
+            UpdateOne(
+                {"user_id": doc['user_id'], "dining_hall": doc['dining_hall'], "meal_period": doc['meal_period']},
+                {"$set": {
+                    "matches": doc['matches'],
+                    "menu_version": snapshot.version,
+                    "job_id": job_id,
+                    "computed_at": computed_at
+                }},
+                upsert=True
+            )
+            for doc in results
+        ]
+        if operations:
+            results_collection.bulk_write(operations, ordered=False)
+        state['processed_users'] += len(results) // len(menus)
+        state['results_written'] += len(operations)
+        elapsed = time.monotonic() - started
+        rate = state['processed_users'] / elapsed if elapsed > 0 else 0.0
+        remaining = max(0, state['total_users'] - state['processed_users'])
+        state.update(
+            elapsed_seconds=round(elapsed, 1),
+            users_per_second=round(rate, 1),
+            eta_seconds=round(remaining / rate, 1) if rate > 0 else None
+        )
+        if progress is not None:
+            progress(dict(state))
+
+    cursor = users_collection.find(
+        {}, {"_id": 0, "user_id": 1, "liked_foods": 1, "disliked_foods": 1}
+    ).batch_size(chunk_size)
+
+    # spawn: workers only score, and must not inherit the parent's MongoDB sockets
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=_init_worker, initargs=(menus, top_n)) as pool:
+        in_flight = set()
+        chunk = []
+
+        def drain(block_until: int):
+            nonlocal in_flight
+            while len(in_flight) > block_until:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    store(future.result())
+
+        for user in cursor:
+            if not user.get('user_id'):
+                continue
+            chunk.append(user)
+            if len(chunk) >= chunk_size:
+                in_flight.add(pool.submit(_score_chunk, chunk))
+                chunk = []
+                # Keep at most two chunks per worker in memory
+                drain(workers * 2)
+        if chunk:
+            in_flight.add(pool.submit(_score_chunk, chunk))
+        drain(0)
+
+    state['total_users'] = max(state['total_users'], state['processed_users'])
+    state['eta_seconds'] = 0.0
+    return state
+
+
+# --- Background jobs (admin endpoint) ---
+
+_jobs: Dict[str, Dict] = {}
+_jobs_lock = threading.Lock()
+
+
+def start_job(**kwargs) -> Dict:
+    """
+    Start a cohort matching job in a background thread.
+
+    Only one job runs at a time per process.
+
+    Returns:
+        Job status dict
+
+    Raises:
+        RuntimeError: If a job is already running
+    """
+    with _jobs_lock:
+        if any(job['status'] == "running" for job in _jobs.values()):
+            raise RuntimeError("A matching job is already running")
+        job_id = uuid.uuid4().hex
+        job = {"job_id": job_id, "status": "running", "started_at": datetime.utcnow().isoformat(),
+               "finished_at": None, "progress": {}, "error": None}
+        _jobs[job_id] = job
+
+    def update_progress(state: Dict):
+        job['progress'] = state
+
+    def run():
+        try:
+            job['progress'] = run_cohort_matching(job_id=job_id, progress=update_progress, **kwargs)
+            job['status'] = "completed"
+        except Exception as e:
+            print(f"Cohort matching job {job_id} failed: {e}")
+            job['status'] = "failed"
+            job['error'] = str(e)
+        job['finished_at'] = datetime.utcnow().isoformat()
+
+    threading.Thread(target=run, name=f"cohort-matching-{job_id[:8]}", daemon=True).start()
+    return dict(job)
+
+
+def get_job(job_id: str) -> Optional[Dict]:
+    """Get a background job's status (None if unknown)."""
+    job = _jobs.get(job_id)
+    return dict(job) if job else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compute top menu matches for every user")
+    parser.add_argument("--halls", nargs="*", help="Dining halls (default: all)")
+    parser.add_argument("--periods", nargs="*", default=list(DEFAULT_MEAL_PERIODS))
+    parser.add_argument("--top-n", type=int, default=10)
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    def report(state: Dict):
+        eta = f"{state['eta_seconds']:.0f}s" if state['eta_seconds'] is not None else "?"
+        print(f"  {state['processed_users']}/{state['total_users']} users "
+              f"({state['users_per_second']:.0f} users/s, ETA {eta})")
+
+    print("🍽️  Running cohort menu matching...")
+    state = run_cohort_matching(
+        dining_halls=args.halls,
+        meal_periods=args.periods,
+        top_n=args.top_n,
+        chunk_size=args.chunk_size,
+        workers=args.workers,
+        progress=report
+    )
+    print(f"✅ Scored {state['processed_users']} users against {state['menus']} menus "
+          f"in {state['elapsed_seconds']}s ({state['results_written']} results written)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
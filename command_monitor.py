@@ -0,0 +1,400 @@
+"""
+MongoDB command monitoring: per-request round trips and a slow-command log.
+
+CommandMonitor is registered on every shared client by db_registry. For
+each command it records the name, collection, duration and documents
+returned (documents written, for writes) and:
+
+- attributes it to the Flask request being served, so a request's round
+  trips can be listed (`init_app` installs the hooks; in debug mode, or
+  with MONGODB_COMMAND_SUMMARY_HEADER on, responses carry an X-DB-* summary)
+- feeds the MongoDB timer in metrics.py
+- logs commands slower than MONGODB_SLOW_COMMAND_MS with their query
+  shape (literal values replaced by "?"). When MONGODB_EXPLAIN_SLOW is on,
+  a background thread runs `explain` (queryPlanner only, nothing is
+  executed) once per shape and reports whether an index was used. The
+  monitor's own explain commands are not recorded.
+
+Slow commands are printed with a [SLOW] prefix, appended as JSON lines to
+MONGODB_SLOW_COMMAND_LOG if set, and the most recent ones are kept for
+GET /api/admin/slow-commands.
+"""
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Deque, Dict, List, Optional, Tuple
+import json
+import os
+import queue
+import threading
+import time
+from dotenv import load_dotenv
+import metrics
+
+load_dotenv()
+
+MONITORING_ENABLED = os.getenv("MONGODB_COMMAND_MONITORING", "on").lower() not in ("0", "false", "off", "no")
+SLOW_COMMAND_MS = float(os.getenv("MONGODB_SLOW_COMMAND_MS", "100"))
+EXPLAIN_SLOW = os.getenv("MONGODB_EXPLAIN_SLOW", "on").lower() not in ("0", "false", "off", "no")
+SLOW_COMMAND_LOG = os.getenv("MONGODB_SLOW_COMMAND_LOG", "")
+SUMMARY_HEADER = os.getenv("MONGODB_COMMAND_SUMMARY_HEADER", "off").lower() in ("1", "true", "on", "yes")
+
+# Commands kept per request for the summary; later ones are only counted
+MAX_COMMANDS_PER_REQUEST = 1000
+RECENT_SLOW_COMMANDS = 100
+EXPLAIN_QUEUE_SIZE = 100
+# How long an explained shape's plan is reused before explaining it again
+EXPLAIN_CACHE_SECONDS = 600
+EXPLAIN_CACHE_SIZE = 512
+
+# Where each command keeps the fields that decide its plan
+_SHAPE_FIELDS = {
+    "find": ("filter", "sort", "projection"),
+    "aggregate": ("pipeline",),
+    "count": ("query",),
+    "distinct": ("key", "query"),
+    "findAndModify": ("query", "sort"),
+    "update": ("updates",),
+    "delete": ("deletes",),
+}
+# Session/transport fields the server rejects inside an explain
+_NOT_EXPLAINABLE_FIELDS = {"lsid", "txnNumber", "autocommit", "startTransaction", "writeConcern", "readConcern",
+                           "signature"}
+_INDEX_STAGES = {"IXSCAN", "IDHACK", "EXPRESS_IXSCAN", "EXPRESS_IDHACK", "COUNT_SCAN", "DISTINCT_SCAN"}
+
+
+class RequestCommands:
+    """MongoDB commands issued while serving one request."""
+
+    __slots__ = ("commands", "count", "seconds")
+
+    def __init__(self):
+        self.commands: List[Tuple[str, Optional[str], float, int]] = []  # (name, collection, seconds, docs)
+        self.count = 0
+        self.seconds = 0.0
+
+    def add(self, name: str, collection: Optional[str], seconds: float, docs: int):
+        self.count += 1
+        self.seconds += seconds
+        if len(self.commands) < MAX_COMMANDS_PER_REQUEST:
+            self.commands.append((name, collection, seconds, docs))
+
+    def grouped(self) -> List[Dict[str, Any]]:
+        """Commands grouped by collection and name, most time first."""
+        groups: Dict[Tuple[Optional[str], str], Dict[str, Any]] = {}
+        for name, collection, seconds, docs in self.commands:
+            group = groups.setdefault((collection, name), {"collection": collection, "command": name,
+                                                           "count": 0, "ms": 0.0, "docs": 0})
+            group["count"] += 1
+            group["ms"] += seconds * 1000
+            group["docs"] += docs
+        return sorted(groups.values(), key=lambda group: group["ms"], reverse=True)
+
+
+_current: ContextVar[Optional[RequestCommands]] = ContextVar("request_commands", default=None)
+# Set on the explain worker so its own commands are not monitored
+_local = threading.local()
+
+_stats_lock = threading.Lock()
+_stats = {"commands": 0, "failed": 0, "slow": 0, "explained": 0, "explain_cache_hits": 0,
+          "explain_errors": 0, "explains_dropped": 0}
+_recent_slow: Deque[Dict[str, Any]] = deque(maxlen=RECENT_SLOW_COMMANDS)
+
+_explain_queue: "queue.Queue" = queue.Queue(maxsize=EXPLAIN_QUEUE_SIZE)
+_explain_worker: Optional[threading.Thread] = None
+_explain_lock = threading.Lock()
+_plans: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+
+
+def _count(name: str, amount: int = 1):
+    with _stats_lock:
+        _stats[name] += amount
+
+
+# --- Command inspection ---
+
+def command_collection(command_name: str, command: Dict[str, Any]) -> Optional[str]:
+    """The collection a command targets (None for database/admin commands)."""
+    if command_name == "getMore":
+        return command.get("collection")
+    target = command.get(command_name)
+    return target if isinstance(target, str) else None
+
+
+def docs_returned(reply: Dict[str, Any]) -> int:
+    """Documents in a reply batch; for writes, documents written or matched."""
+    cursor = reply.get("cursor")
+    if isinstance(cursor, dict):
+        return len(cursor.get("firstBatch", cursor.get("nextBatch", ())))
+    if "value" in reply:  # findAndModify
+        return 0 if reply["value"] is None else 1
+    n = reply.get("n", 0)
+    return n if isinstance(n, int) else 0
+
+
+def query_shape(value: Any) -> Any:
+    """Structure of a filter/pipeline with literal values replaced by "?"."""
+    if isinstance(value, dict):
+        return {key: query_shape(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        if all(not isinstance(item, (dict, list, tuple)) for item in value):
+            return ["?"] if value else []
+        return [query_shape(item) for item in value]
+    return "?"
+
+
+def command_shape(command_name: str, command: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """The plan-relevant parts of a command, as a query shape."""
+    fields = _SHAPE_FIELDS.get(command_name)
+    if fields is None:
+        return None
+    shape = {}
+    for field in fields:
+        if field not in command:
+            continue
+        value = command[field]
+        if field in ("updates", "deletes"):
+            # One statement stands for the batch; shapes rarely differ within it
+            statements = list(value)
+            shape["q"] = query_shape(statements[0].get("q", {})) if statements else {}
+            shape["statements"] = len(statements)
+        elif field == "key":
+            shape[field] = value
+        else:
+            shape[field] = query_shape(value)
+    return shape
+
+
+def plan_summary(explain: Dict[str, Any]) -> Dict[str, Any]:
+    """Whether the winning plan used an index, which ones, and its stages."""
+    stages, indexes = set(), set()
+
+    def walk(node):
+        if isinstance(node, dict):
+            for key, item in node.items():
+                if key in ("rejectedPlans", "command"):  # losing plans; the echoed command
+                    continue
+                if key == "stage" and isinstance(item, str):
+                    stages.add(item)
+                elif key == "indexName" and isinstance(item, str):
+                    indexes.add(item)
+                else:
+                    walk(item)
+        elif isinstance(node, list):
+            for item in node:
+                walk(item)
+
+    # Covers find-style explains (queryPlanner.winningPlan) and aggregate ones ($cursor stages)
+    walk(explain)
+    return {
+        "used_index": bool(indexes) or bool(stages & _INDEX_STAGES),
+        "indexes": sorted(indexes),
+        "collscan": "COLLSCAN" in stages,
+        "stages": sorted(stages)
+    }
+
+
+def _explainable(command_name: str, command: Dict[str, Any]) -> Dict[str, Any]:
+    explainable = {key: value for key, value in command.items()
+                   if key not in _NOT_EXPLAINABLE_FIELDS and not key.startswith("$")}
+    # explain takes a single write statement
+    for field in ("updates", "deletes"):
+        if field in explainable:
+            explainable[field] = list(explainable[field])[:1]
+    return explainable
+
+
+# --- Slow command log ---
+
+def _write_slow(entry: Dict[str, Any]):
+    with _stats_lock:
+        _recent_slow.append(entry)
+    plan = entry.get("plan")
+    if plan is None:
+        index = "unknown"
+    elif plan.get("error"):
+        index = f"explain failed ({plan['error']})"
+    else:
+        index = ",".join(plan["indexes"]) if plan["used_index"] else "none (COLLSCAN)" if plan["collscan"] else "none"
+    print(f"[SLOW] {entry['database']}.{entry['collection']} {entry['command']} {entry['duration_ms']}ms "
+          f"docs={entry['docs']} route={entry['route']} index={index} shape={json.dumps(entry['shape'], default=str)}")
+    if SLOW_COMMAND_LOG:
+        try:
+            with open(SLOW_COMMAND_LOG, "a") as f:
+                f.write(json.dumps(entry, default=str) + "\n")
+        except OSError as e:
+            print(f"[ERROR] Could not write slow command log: {e}")
+
+
+def _cached_plan(shape_key: str) -> Optional[Dict[str, Any]]:
+    cached = _plans.get(shape_key)
+    if cached is not None and time.monotonic() - cached[0] < EXPLAIN_CACHE_SECONDS:
+        return cached[1]
+    return None
+
+
+def _run_explains():
+    import db_registry
+
+    _local.suppressed = True
+    while True:
+        uri, entry, command, shape_key = _explain_queue.get()
+        plan = _cached_plan(shape_key)
+        if plan is None:
+            try:
+                database = db_registry.get_client(uri)[entry["database"]]
+                explain = database.command({"explain": _explainable(entry["command"], command),
+                                            "verbosity": "queryPlanner"})
+                plan = plan_summary(explain)
+                _count("explained")
+            except Exception as e:
+                plan = {"error": str(e)}
+                _count("explain_errors")
+            if len(_plans) >= EXPLAIN_CACHE_SIZE:
+                _plans.clear()
+            _plans[shape_key] = (time.monotonic(), plan)
+        else:
+            _count("explain_cache_hits")
+        entry["plan"] = plan
+        _write_slow(entry)
+
+
+def _submit_explain(uri: str, entry: Dict[str, Any], command: Dict[str, Any]):
+    global _explain_worker
+    shape_key = json.dumps([entry["database"], entry["collection"], entry["command"], entry["shape"]],
+                           sort_keys=True, default=str)
+    plan = _cached_plan(shape_key)
+    if plan is not None:
+        _count("explain_cache_hits")
+        entry["plan"] = plan
+        _write_slow(entry)
+        return
+    with _explain_lock:
+        if _explain_worker is None:
+            _explain_worker = threading.Thread(target=_run_explains, name="slow-command-explain", daemon=True)
+            _explain_worker.start()
+    try:
+        _explain_queue.put_nowait((uri, entry, command, shape_key))
+    except queue.Full:
+        _count("explains_dropped")
+        _write_slow(entry)
+
+
+# --- Listener ---
+
+class CommandMonitor(metrics.CommandTimingListener):
+    """Per-request command accounting and slow-command logging for one client."""
+
+    def __init__(self, uri: str, slow_ms: float = SLOW_COMMAND_MS, explain_slow: bool = EXPLAIN_SLOW):
+        self.uri = uri
+        self.slow_ms = slow_ms
+        self.explain_slow = explain_slow
+        # request_id -> command document, held only until the command finishes
+        self._pending: Dict[Tuple[int, Any], Dict[str, Any]] = {}
+
+    def started(self, event):
+        if getattr(_local, "suppressed", False):
+            return
+        self._pending[(event.request_id, event.connection_id)] = event.command
+
+    def succeeded(self, event):
+        self._finish(event, docs_returned(event.reply), failed=False)
+
+    def failed(self, event):
+        self._finish(event, 0, failed=True)
+
+    def _finish(self, event, docs: int, failed: bool):
+        command = self._pending.pop((event.request_id, event.connection_id), None)
+        if command is None:  # suppressed, or started before the monitor saw it
+            return
+        seconds = event.duration_micros / 1e6
+        metrics.observe("mongodb", seconds)
+
+        name = event.command_name
+        collection = command_collection(name, command)
+        commands = _current.get()
+        if commands is not None:
+            commands.add(name, collection, seconds, docs)
+        with _stats_lock:
+            _stats["commands"] += 1
+            if failed:
+                _stats["failed"] += 1
+
+        if seconds * 1000 >= self.slow_ms:
+            _count("slow")
+            self._log_slow(event, command, collection, seconds, docs, failed)
+
+    def _log_slow(self, event, command, collection, seconds, docs, failed):
+        from flask import has_request_context, request
+
+        route = None
+        if has_request_context():
+            rule = request.url_rule
+            route = f"{request.method} {rule.rule if rule is not None else request.path}"
+        entry = {
+            "timestamp": datetime.utcnow().isoformat(),
+            "database": event.database_name,
+            "collection": collection,
+            "command": event.command_name,
+            "duration_ms": round(seconds * 1000, 1),
+            "docs": docs,
+            "failed": failed,
+            "route": route,
+            "shape": command_shape(event.command_name, command),
+            "plan": None
+        }
+        if self.explain_slow and entry["shape"] is not None:
+            _submit_explain(self.uri, entry, command)
+        else:
+            _write_slow(entry)
+
+
+# --- Flask hooks ---
+
+def current_request() -> Optional[RequestCommands]:
+    """Commands issued so far by the request being served, if any."""
+    return _current.get()
+
+
+def _start_request():
+    _current.set(RequestCommands())
+
+
+def _summary_headers(response):
+    from flask import current_app
+
+    commands = _current.get()
+    _current.set(None)
+    if commands is None or not (SUMMARY_HEADER or current_app.debug):
+        return response
+    response.headers["X-DB-Round-Trips"] = str(commands.count)
+    response.headers["X-DB-Time-Ms"] = f"{commands.seconds * 1000:.1f}"
+    detail = ", ".join(
+        f"{group['collection'] or '-'}.{group['command']}x{group['count']}={group['ms']:.1f}ms/{group['docs']}docs"
+        for group in commands.grouped()
+    )
+    response.headers["X-DB-Commands"] = detail[:2000]
+    return response
+
+
+def init_app(app):
+    """Install the per-request command hooks on a Flask app (no-op when monitoring is off)."""
+    if not MONITORING_ENABLED:
+        return
+    app.before_request(_start_request)
+    app.after_request(_summary_headers)
+
+
+def stats() -> Dict[str, Any]:
+    """Counters, settings and the most recent slow commands (newest first)."""
+    with _stats_lock:
+        counters = dict(_stats)
+        recent = list(_recent_slow)
+    counters.update({
+        "enabled": MONITORING_ENABLED,
+        "slow_command_ms": SLOW_COMMAND_MS,
+        "explain_slow": EXPLAIN_SLOW,
+        "explain_queue": _explain_queue.qsize(),
+        "recent_slow": recent[::-1]
+    })
+    return counters
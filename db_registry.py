@@ -0,0 +1,196 @@
+from pymongo import MongoClient
+from pymongo import monitoring
+import certifi
+from typing import Dict, List, Optional
+import atexit
+import os
+import threading
+from dotenv import load_dotenv
+import command_monitor
+import metrics
+
+load_dotenv()
+
+DEFAULT_DB_NAME = "food_preferences"
+
+# Pool sizing (can be overridden per deployment through the environment)
+MAX_POOL_SIZE = int(os.getenv("MONGODB_MAX_POOL_SIZE", "50"))
+MIN_POOL_SIZE = int(os.getenv("MONGODB_MIN_POOL_SIZE", "0"))
+MAX_IDLE_TIME_MS = int(os.getenv("MONGODB_MAX_IDLE_TIME_MS", "300000"))
+WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGODB_WAIT_QUEUE_TIMEOUT_MS", "10000"))
+
+
+class PoolStatsListener(monitoring.ConnectionPoolListener):
+    """Counts connection pool events for one client so they can be monitored."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.connections_created = 0
+        self.connections_closed = 0
+        self.checked_out = 0
+        self.checked_in = 0
+        self.checkout_failures = 0
+        self.pools_cleared = 0
+
+    def _incr(self, name: str):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._incr("pools_cleared")
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._incr("connections_created")
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._incr("connections_closed")
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        self._incr("checkout_failures")
+
+    def connection_checked_out(self, event):
+        self._incr("checked_out")
+
+    def connection_checked_in(self, event):
+        self._incr("checked_in")
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                "connections_created": self.connections_created,
+                "connections_closed": self.connections_closed,
+                "open_connections": self.connections_created - self.connections_closed,
+                "in_use": self.checked_out - self.checked_in,
+                "checkouts": self.checked_out,
+                "checkout_failures": self.checkout_failures,
+                "pools_cleared": self.pools_cleared
+            }
+
+
+# One pooled client per URI for the whole process
+_clients: Dict[str, MongoClient] = {}
+_pool_listeners: Dict[str, PoolStatsListener] = {}
+_lock = threading.Lock()
+
+
+def _resolve_uri(mongodb_uri: Optional[str]) -> str:
+    uri = mongodb_uri or os.getenv("MONGODB_URI")
+    if not uri:
+        raise ValueError("MongoDB URI must be provided either as parameter or MONGODB_URI environment variable")
+    return uri
+
+
+def get_client(mongodb_uri: Optional[str] = None) -> MongoClient:
+    """
+    Get the shared MongoClient for a URI, creating it on first use.
+
+    MongoClient is thread-safe and keeps its own connection pool, so every
+    service and manager in the process should borrow this client instead of
+    opening (and closing) a new one per request.
+
+    Args:
+        mongodb_uri: MongoDB connection string (if None, reads from env)
+
+    Returns:
+        Shared MongoClient instance
+    """
+    uri = _resolve_uri(mongodb_uri)
+
+    client = _clients.get(uri)
+    if client is not None:
+        return client
+
+    with _lock:
+        client = _clients.get(uri)
+        if client is None:
+            listener = PoolStatsListener()
+            # Per-request round trips and the slow-command log; plain timing when monitoring is off
+            command_listener = (command_monitor.CommandMonitor(uri) if command_monitor.MONITORING_ENABLED
+                                else metrics.CommandTimingListener())
+            client = MongoClient(
+                uri,
+                tlsCAFile=certifi.where(),
+                serverSelectionTimeoutMS=5000,
+                connectTimeoutMS=10000,
+                socketTimeoutMS=10000,
+                maxPoolSize=MAX_POOL_SIZE,
+                minPoolSize=MIN_POOL_SIZE,
+                maxIdleTimeMS=MAX_IDLE_TIME_MS,
+                waitQueueTimeoutMS=WAIT_QUEUE_TIMEOUT_MS,
+                event_listeners=[listener, command_listener]
+            )
+            _clients[uri] = client
+            _pool_listeners[uri] = listener
+    return client
+
+
+def get_database(db_name: str = DEFAULT_DB_NAME, mongodb_uri: Optional[str] = None):
+    """
+    Get a database handle backed by the shared client.
+
+    Args:
+        db_name: Database name
+        mongodb_uri: MongoDB connection string (if None, reads from env)
+
+    Returns:
+        pymongo Database
+    """
+    return get_client(mongodb_uri)[db_name]
+
+
+def get_pool_stats() -> List[Dict]:
+    """
+    Get connection pool statistics for every registered client.
+
+    Returns:
+        List of per-client stats (URIs are reported without credentials)
+    """
+    stats = []
+    for uri, listener in list(_pool_listeners.items()):
+        stats.append({
+            "host": _redact_uri(uri),
+            "max_pool_size": MAX_POOL_SIZE,
+            "min_pool_size": MIN_POOL_SIZE,
+            **listener.snapshot()
+        })
+    return stats
+
+
+def _redact_uri(uri: str) -> str:
+    """Strip credentials from a connection string for reporting."""
+    scheme, sep, rest = uri.partition("://")
+    if not sep:
+        return uri
+    if "@" in rest:
+        rest = rest.split("@", 1)[1]
+    return f"{scheme}://{rest.split('/', 1)[0]}"
+
+
+def close_all():
+    """Close every shared client (called automatically at interpreter exit)."""
+    with _lock:
+        for client in _clients.values():
+            try:
+                client.close()
+            except Exception as e:
+                print(f"Error closing MongoDB client: {e}")
+        _clients.clear()
+        _pool_listeners.clear()
+
+
+atexit.register(close_all)
@@ -1,35 +1,93 @@
-from pymongo import MongoClient
-import certifi
+from pymongo import ReplaceOne, ReturnDocument
 from typing import List, Dict, Optional
 from datetime import datetime
 import os
+import threading
+import time
 from dotenv import load_dotenv
+import db_registry
+import schema
+from menu_index import MenuIndex
 
 load_dotenv()
 
+# How often (seconds) a process checks the menu version document, and the
+# maximum age of a snapshot even if no version change is seen
+MENU_VERSION_CHECK_INTERVAL = float(os.getenv("MENU_VERSION_CHECK_INTERVAL", "2"))
+MENU_SNAPSHOT_TTL = float(os.getenv("MENU_SNAPSHOT_TTL", "300"))
+
+MENU_VERSION_ID = "menu_version"
+
+
+class MenuSnapshot:
+    """
+    Immutable in-memory copy of dining_hall_items at one menu version.
+    
+    Per hall/meal-period views and their inverted indexes are built lazily
+    and live as long as the snapshot. Returned items are shared between
+    requests and must be treated as read-only.
+    """
+    
+    def __init__(self, items: List[Dict], version: Optional[int]):
+        self.items = items
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self.checked_at = self.loaded_at
+        self._by_hall: Dict[str, List[Dict]] = {}
+        for item in items:
+            self._by_hall.setdefault(item.get('dining_hall'), []).append(item)
+        self._views: Dict[tuple, List[Dict]] = {}
+        self._indexes: Dict[tuple, MenuIndex] = {}
+    
+    def items_for(self, dining_hall: str, meal_period: str) -> List[Dict]:
+        """Items served at a hall for a meal period (same filter as the original query)."""
+        key = (dining_hall, meal_period)
+        view = self._views.get(key)
+        if view is None:
+            view = [
+                item for item in self._by_hall.get(dining_hall, [])
+                if item.get('meal_period') == meal_period or "Daily" in item.get('available_days', [])
+            ]
+            self._views[key] = view
+        return view
+    
+    def index_for(self, dining_hall: str, meal_period: str) -> MenuIndex:
+        key = (dining_hall, meal_period)
+        index = self._indexes.get(key)
+        if index is None:
+            index = MenuIndex(self.items_for(dining_hall, meal_period))
+            self._indexes[key] = index
+        return index
+    
+    def halls(self) -> List[str]:
+        return sorted(hall for hall in self._by_hall if hall is not None)
+
+
+# Process-wide snapshots: (mongodb_uri, db_name) -> MenuSnapshot
+_menu_snapshots: Dict[tuple, MenuSnapshot] = {}
+_snapshot_lock = threading.Lock()
+
 class DiningHallManager:
     """Manages dining hall menu items in MongoDB."""
     
-    def __init__(self, mongodb_uri: Optional[str] = None, db_name: str = "food_preferences"):
+    def __init__(self, mongodb_uri: Optional[str] = None, db_name: str = "food_preferences",
+                 bootstrap: bool = False):
         self.mongodb_uri = mongodb_uri or os.getenv("MONGODB_URI")
         
         if not self.mongodb_uri:
             raise ValueError("MongoDB URI must be provided")
         
-        self.client = MongoClient(
-            self.mongodb_uri,
-            tlsCAFile=certifi.where(),
-            serverSelectionTimeoutMS=5000
-        )
+        # Borrow the process-wide pooled client for this URI
+        self.client = db_registry.get_client(self.mongodb_uri)
         
+        self.db_name = db_name
         self.db = self.client[db_name]
         self.dining_items_collection = self.db['dining_hall_items']
+        self.menu_meta_collection = self.db['menu_meta']
         
-        # Create indexes
-        self.dining_items_collection.create_index("item_id", unique=True)
-        self.dining_items_collection.create_index("dining_hall")
-        self.dining_items_collection.create_index("meal_period")
-        self.dining_items_collection.create_index("category")
+        # Indexes are created once by the schema bootstrap, not per instance
+        if bootstrap:
+            schema.ensure_schema(self.db)
     
     def populate_sample_items(self):
         """Populate database with realistic dining hall menu items."""
@@ -245,34 +303,137 @@ class DiningHallManager:
         result = self.dining_items_collection.insert_many(sample_items)
         print(f"✅ Inserted {len(result.inserted_ids)} dining hall items")
         
+        self.bump_menu_version()
+        
         return len(result.inserted_ids)
     
+    def import_items(self, items: List[Dict], replace_hall: Optional[str] = None) -> int:
+        """
+        Import menu items (upsert by item_id) and publish a new menu version.
+        
+        Args:
+            items: Dining hall item documents
+            replace_hall: If set, remove this hall's items that are not in the import
+            
+        Returns:
+            Number of items imported
+        """
+        if items:
+            self.dining_items_collection.bulk_write(
+                [ReplaceOne({"item_id": item['item_id']}, item, upsert=True) for item in items],
+                ordered=False
+            )
+        if replace_hall is not None:
+            self.dining_items_collection.delete_many({
+                "dining_hall": replace_hall,
+                "item_id": {"$nin": [item['item_id'] for item in items]}
+            })
+        self.bump_menu_version()
+        return len(items)
+    
+    def bump_menu_version(self) -> int:
+        """
+        Publish a menu change: every process reloads its snapshot within
+        MENU_VERSION_CHECK_INTERVAL seconds. Call after any write to dining_hall_items.
+        
+        Returns:
+            The new menu version
+        """
+        meta = self.menu_meta_collection.find_one_and_update(
+            {"_id": MENU_VERSION_ID},
+            {"$inc": {"version": 1}, "$set": {"updated_at": datetime.utcnow()}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        _menu_snapshots.pop(self._snapshot_key(), None)
+        return meta.get('version', 0)
+    
+    def _snapshot_key(self) -> tuple:
+        return (self.mongodb_uri, self.db_name)
+    
+    def _read_menu_version(self) -> Optional[int]:
+        meta = self.menu_meta_collection.find_one({"_id": MENU_VERSION_ID}, {"version": 1})
+        return meta.get('version') if meta else None
+    
+    def get_menu_snapshot(self) -> MenuSnapshot:
+        """
+        Get the process-wide menu snapshot, reloading it when the menu version
+        changes (checked at most every MENU_VERSION_CHECK_INTERVAL seconds) or
+        when it is older than MENU_SNAPSHOT_TTL.
+        
+        Returns:
+            Current MenuSnapshot
+        """
+        key = self._snapshot_key()
+        snapshot = _menu_snapshots.get(key)
+        now = time.monotonic()
+        
+        if snapshot is not None and now - snapshot.loaded_at < MENU_SNAPSHOT_TTL:
+            if now - snapshot.checked_at < MENU_VERSION_CHECK_INTERVAL:
+                return snapshot
+            if self._read_menu_version() == snapshot.version:
+                snapshot.checked_at = now
+                return snapshot
+        
+        with _snapshot_lock:
+            # Another thread may have reloaded while we waited
+            current = _menu_snapshots.get(key)
+            if current is not None and current is not snapshot:
+                return current
+            
+            # Read the version first: a write racing with the load is caught on the next check
+            version = self._read_menu_version()
+            items = list(self.dining_items_collection.find({}, {"_id": 0}))
+            snapshot = MenuSnapshot(items, version)
+            _menu_snapshots[key] = snapshot
+            return snapshot
+    
     def get_items_by_hall_and_period(self, dining_hall: str, meal_period: str) -> List[Dict]:
-        """Get all items for a specific dining hall and meal period."""
-        items = list(self.dining_items_collection.find(
-            {
-                "dining_hall": dining_hall,
-                "$or": [
-                    {"meal_period": meal_period},
-                    {"available_days": "Daily"}
-                ]
-            },
-            {"_id": 0}
-        ))
-        return items
+        """
+        Get all items for a specific dining hall and meal period.
+        
+        Served from the in-memory menu snapshot; items are shared and read-only.
+        """
+        return list(self.get_menu_snapshot().items_for(dining_hall, meal_period))
+    
+    def get_menu_index(self, dining_hall: str, meal_period: str) -> MenuIndex:
+        """
+        Get the inverted index for a hall's menu.
+        
+        The index belongs to the current menu snapshot, so it is rebuilt
+        whenever the menu version changes and shared by every manager in
+        the process.
+        
+        Args:
+            dining_hall: Name of dining hall
+            meal_period: Meal period (breakfast/lunch/dinner)
+            
+        Returns:
+            MenuIndex over get_items_by_hall_and_period(dining_hall, meal_period)
+        """
+        return self.get_menu_snapshot().index_for(dining_hall, meal_period)
+    
+    def search_menu(self, dining_hall: str, meal_period: str, query: str) -> List[Dict]:
+        """Find menu items whose name or ingredients contain every word of the query."""
+        return self.get_menu_index(dining_hall, meal_period).search(query)
+    
+    def get_dining_halls(self) -> List[str]:
+        """Get the sorted list of dining hall names."""
+        return self.get_menu_snapshot().halls()
     
     def get_all_items(self) -> List[Dict]:
-        """Get all dining hall items."""
-        return list(self.dining_items_collection.find({}, {"_id": 0}))
+        """Get all dining hall items (from the menu snapshot; read-only)."""
+        return list(self.get_menu_snapshot().items)
     
     def close(self):
-        """Close MongoDB connection."""
-        self.client.close()
+        """Release the shared MongoDB client (it stays open for other callers)."""
+        self.client = None
+        self.db = None
 
 
 # Script to populate database
 if __name__ == "__main__":
-    manager = DiningHallManager()
+    manager = DiningHallManager(bootstrap=True)
     count = manager.populate_sample_items()
     print(f"\n🎉 Successfully populated {count} dining hall items!")
     
@@ -0,0 +1,355 @@
+"""
+Materialized dislike counts for the admin dashboard.
+
+The `dislike_rollup` collection holds one document per disliked food
+({kind: "food", food, category, count}) and one summary document
+({kind: "summary", total_users, users_with_preferences, total_dislikes}).
+UserFoodPreferenceManager keeps it current with $inc deltas on every
+preference change, so the admin endpoints read a few indexed documents
+instead of scanning `users`.
+
+Usage:
+    python dislike_rollup.py --rebuild   # recompute from users in one pass
+    python dislike_rollup.py --check     # compare the rollup with users
+"""
+from pymongo import ReplaceOne, UpdateOne
+from datetime import datetime
+from typing import Dict, List, Optional
+import argparse
+import os
+import sys
+from dotenv import load_dotenv
+import db_registry
+
+load_dotenv()
+
+ROLLUP_COLLECTION = "dislike_rollup"
+
+# Written by the preference update pipeline: what the update changed in
+# disliked_foods. Read back by the manager and stripped from responses.
+DELTA_FIELD = "_last_dislike_delta"
+# Bulk updates append their deltas here instead (tagged with the batch
+# token), so a concurrent update cannot overwrite one before it is read
+# back; the reader $pulls its own entries afterwards
+PENDING_DELTAS_FIELD = "_pending_dislike_deltas"
+# Starting state of a user's meals split across several pipelines, kept
+# between the first and the last of them
+TRACKING_FIELD = "_dislike_tracking"
+
+SUMMARY_FIELDS = ("total_users", "users_with_preferences", "total_dislikes")
+
+
+def _delta(before: str, created: str, token: Optional[str]) -> Dict:
+    delta = {
+        "token": {"$literal": token},
+        "added": {"$setDifference": ["$disliked_foods", before]},
+        "removed": {"$setDifference": [before, "$disliked_foods"]},
+        "created": created,
+        "had_dislikes": {"$gt": [{"$size": before}, 0]},
+        "has_dislikes": {"$gt": [{"$size": "$disliked_foods"}, 0]}
+    }
+    if token is None:
+        # Returned by the write itself (find_one_and_update)
+        return {"$set": {DELTA_FIELD: delta}}
+    return {"$set": {PENDING_DELTAS_FIELD: {
+        "$concatArrays": [{"$ifNull": [f"${PENDING_DELTAS_FIELD}", []]}, [delta]]
+    }}}
+
+
+def track_dislike_changes(
+    stages: List[Dict],
+    token: Optional[str] = None,
+    first: bool = True,
+    last: bool = True
+) -> List[Dict]:
+    """
+    Wrap preference update stages so the document records its dislike delta.
+
+    Args:
+        stages: Update pipeline stages applied to one user document
+        token: Batch identifier; when given, the delta is appended to
+            PENDING_DELTAS_FIELD under it instead of set in DELTA_FIELD
+        first: This is the first of several pipelines applied to the user in
+            order; it records the starting state in TRACKING_FIELD
+        last: This is the last of them; it writes one delta covering all of
+            them and removes TRACKING_FIELD (a single pipeline is both)
+
+    Returns:
+        Update pipeline stages
+    """
+    if first and last:
+        return [
+            {"$set": {
+                "_dislikes_before": {"$ifNull": ["$disliked_foods", []]},
+                "_created_now": {"$eq": [{"$type": "$created_at"}, "missing"]}
+            }},
+            *stages,
+            _delta("$_dislikes_before", "$_created_now", token),
+            {"$unset": ["_dislikes_before", "_created_now"]}
+        ]
+
+    prefix = [{"$set": {TRACKING_FIELD: {
+        "before": {"$ifNull": ["$disliked_foods", []]},
+        "created": {"$eq": [{"$type": "$created_at"}, "missing"]}
+    }}}] if first else []
+    suffix = close_dislike_tracking(token) if last else []
+    return [*prefix, *stages, *suffix]
+
+
+def close_dislike_tracking(token: Optional[str] = None) -> List[Dict]:
+    """
+    Stages that write the delta since TRACKING_FIELD was recorded and remove it.
+
+    Ends every split update; also run on its own when a later pipeline
+    failed, so the pipelines already applied still reach the rollup.
+    """
+    return [
+        _delta(f"${TRACKING_FIELD}.before", f"${TRACKING_FIELD}.created", token),
+        {"$unset": [TRACKING_FIELD]}
+    ]
+
+
+def created_user_change() -> Dict:
+    """Delta for a newly created user with no preferences."""
+    return {"added": [], "removed": [], "created": True, "had_dislikes": False, "has_dislikes": False}
+
+
+def deleted_user_change(disliked_foods: List[str]) -> Dict:
+    """Delta for a deleted user."""
+    return {"added": [], "removed": list(disliked_foods or []), "created": False, "deleted": True,
+            "had_dislikes": bool(disliked_foods), "has_dislikes": False}
+
+
+def apply_changes(db, changes: List[Dict]):
+    """
+    Fold dislike deltas into the rollup with one unordered bulk_write.
+
+    The summary document is only incremented if it exists, so deltas
+    recorded before the first rebuild do not produce a partial summary.
+
+    Args:
+        db: pymongo Database
+        changes: Deltas from DELTA_FIELD / PENDING_DELTAS_FIELD, created_user_change
+            or deleted_user_change
+    """
+    food_increments: Dict[str, int] = {}
+    summary = dict.fromkeys(SUMMARY_FIELDS, 0)
+    for change in changes:
+        for food in change.get('added', []):
+            food_increments[food] = food_increments.get(food, 0) + 1
+        for food in change.get('removed', []):
+            food_increments[food] = food_increments.get(food, 0) - 1
+        summary['total_users'] += int(bool(change.get('created'))) - int(bool(change.get('deleted')))
+        summary['users_with_preferences'] += int(bool(change.get('has_dislikes'))) - int(bool(change.get('had_dislikes')))
+        summary['total_dislikes'] += len(change.get('added', [])) - len(change.get('removed', []))
+
+    from recommendation_service import categorize_food
+
+    now = datetime.utcnow()
+    operations = [
+        UpdateOne(
+            {"kind": "food", "food": food},
+            {"$inc": {"count": increment},
+             "$set": {"updated_at": now},
+             "$setOnInsert": {"category": categorize_food(food)}},
+            upsert=True
+        )
+        for food, increment in food_increments.items() if increment
+    ]
+    summary = {field: value for field, value in summary.items() if value}
+    if summary:
+        operations.append(UpdateOne({"kind": "summary"}, {"$inc": summary, "$set": {"updated_at": now}}))
+    if operations:
+        db[ROLLUP_COLLECTION].bulk_write(operations, ordered=False)
+
+
+def compute_from_users(db) -> Dict:
+    """
+    Compute the rollup contents from `users` with one aggregation.
+
+    Returns:
+        {"summary": {...}, "foods": {food: count}}
+    """
+    dislikes = {"$ifNull": ["$disliked_foods", []]}
+    result = next(db['users'].aggregate([
+        {"$project": {"_id": 0, "disliked_foods": 1}},
+        {"$facet": {
+            "summary": [
+                {"$group": {
+                    "_id": None,
+                    "total_users": {"$sum": 1},
+                    "users_with_preferences": {"$sum": {"$cond": [{"$gt": [{"$size": dislikes}, 0]}, 1, 0]}},
+                    "total_dislikes": {"$sum": {"$size": dislikes}}
+                }}
+            ],
+            "foods": [
+                {"$unwind": "$disliked_foods"},
+                {"$group": {"_id": "$disliked_foods", "count": {"$sum": 1}}}
+            ]
+        }}
+    ]), {})
+
+    summary = (result.get('summary') or [{}])[0]
+    return {
+        "summary": {field: summary.get(field, 0) for field in SUMMARY_FIELDS},
+        "foods": {row['_id']: row['count'] for row in result.get('foods', [])}
+    }
+
+
+def rebuild(db, batch_size: int = 1000) -> Dict:
+    """
+    Recompute the whole rollup from `users`.
+
+    Updates that land while the rebuild runs may be missed; run check()
+    afterwards if writes were not paused.
+
+    Args:
+        db: pymongo Database
+        batch_size: Food documents per bulk_write
+
+    Returns:
+        Summary of the rebuilt rollup
+    """
+    from recommendation_service import categorize_food
+
+    expected = compute_from_users(db)
+    collection = db[ROLLUP_COLLECTION]
+    now = datetime.utcnow()
+
+    operations = []
+    for food, count in expected['foods'].items():
+        operations.append(ReplaceOne(
+            {"kind": "food", "food": food},
+            {"kind": "food", "food": food, "category": categorize_food(food), "count": count, "updated_at": now},
+            upsert=True
+        ))
+        if len(operations) >= batch_size:
+            collection.bulk_write(operations, ordered=False)
+            operations = []
+    if operations:
+        collection.bulk_write(operations, ordered=False)
+
+    # Foods nobody dislikes any more
+    collection.delete_many({"kind": "food", "updated_at": {"$lt": now}})
+    collection.replace_one(
+        {"kind": "summary"},
+        {"kind": "summary", **expected['summary'], "rebuilt_at": now, "updated_at": now},
+        upsert=True
+    )
+    return {**expected['summary'], "foods": len(expected['foods'])}
+
+
+def check(db) -> Dict:
+    """
+    Compare the rollup with a fresh computation from `users`.
+
+    Returns:
+        {"consistent": bool, "summary_mismatches": {...}, "food_mismatches": [...]}
+    """
+    expected = compute_from_users(db)
+    collection = db[ROLLUP_COLLECTION]
+
+    stored_summary = collection.find_one({"kind": "summary"}) or {}
+    summary_mismatches = {
+        field: {"expected": expected['summary'][field], "actual": stored_summary.get(field)}
+        for field in SUMMARY_FIELDS
+        if stored_summary.get(field) != expected['summary'][field]
+    }
+
+    actual_foods = {
+        doc['food']: doc.get('count', 0)
+        for doc in collection.find({"kind": "food"}, {"_id": 0, "food": 1, "count": 1})
+    }
+    food_mismatches = [
+        {"food": food, "expected": expected['foods'].get(food, 0), "actual": actual_foods.get(food, 0)}
+        for food in sorted(set(expected['foods']) | set(actual_foods))
+        if expected['foods'].get(food, 0) != actual_foods.get(food, 0)
+    ]
+
+    return {
+        "consistent": not summary_mismatches and not food_mismatches,
+        "summary_mismatches": summary_mismatches,
+        "food_mismatches": food_mismatches
+    }
+
+
+def get_summary(db) -> Optional[Dict]:
+    """Get the rollup summary (None if the rollup has never been built)."""
+    return db[ROLLUP_COLLECTION].find_one({"kind": "summary"}, {"_id": 0})
+
+
+def get_top_dislikes(db, limit: int = 20) -> List[Dict]:
+    """Get the most disliked foods as {food, count, category}, most disliked first."""
+    return list(
+        db[ROLLUP_COLLECTION]
+        .find({"kind": "food", "count": {"$gt": 0}}, {"_id": 0, "food": 1, "count": 1, "category": 1})
+        .sort([("count", -1), ("food", 1)])
+        .limit(limit)
+    )
+
+
+def count_disliked_foods(db) -> int:
+    """Number of distinct foods disliked by at least one user."""
+    return db[ROLLUP_COLLECTION].count_documents({"kind": "food", "count": {"$gt": 0}})
+
+
+def get_category_breakdown(db) -> List[Dict]:
+    """
+    Per-category totals from the rollup, most disliked category first.
+
+    Returns:
+        List of {"category", "total_dislikes", "unique_items", "most_common"}
+    """
+    rows = db[ROLLUP_COLLECTION].aggregate([
+        {"$match": {"kind": "food", "count": {"$gt": 0}}},
+        {"$group": {
+            "_id": "$category",
+            "total_dislikes": {"$sum": "$count"},
+            "unique_items": {"$sum": 1},
+            "most_common": {"$topN": {"n": 3, "sortBy": {"count": -1, "food": 1}, "output": ["$food", "$count"]}}
+        }},
+        {"$sort": {"total_dislikes": -1, "_id": 1}}
+    ])
+    return [
+        {
+            "category": row['_id'],
+            "total_dislikes": row['total_dislikes'],
+            "unique_items": row['unique_items'],
+            "most_common": row['most_common']
+        }
+        for row in rows
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rebuild or check the dislike rollup")
+    action = parser.add_mutually_exclusive_group(required=True)
+    action.add_argument("--rebuild", action="store_true", help="Recompute the rollup from users")
+    action.add_argument("--check", action="store_true", help="Report differences between the rollup and users")
+    parser.add_argument("--db-name", default="food_preferences")
+    args = parser.parse_args(argv)
+
+    db = db_registry.get_database(args.db_name, os.getenv("MONGODB_URI"))
+
+    if args.rebuild:
+        result = rebuild(db)
+        print(f"✅ Rebuilt dislike rollup: {result['foods']} foods, {result['total_users']} users, "
+              f"{result['users_with_preferences']} with preferences")
+        return 0
+
+    result = check(db)
+    if result['consistent']:
+        print("✅ Dislike rollup is consistent with users")
+        return 0
+    for field, values in result['summary_mismatches'].items():
+        print(f"❌ {field}: expected {values['expected']}, found {values['actual']}")
+    for mismatch in result['food_mismatches'][:50]:
+        print(f"❌ {mismatch['food']}: expected {mismatch['expected']}, found {mismatch['actual']}")
+    if len(result['food_mismatches']) > 50:
+        print(f"   ... and {len(result['food_mismatches']) - 50} more")
+    print("Run `python dislike_rollup.py --rebuild` to repair.")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
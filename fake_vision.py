@@ -0,0 +1,224 @@
+"""
+Deterministic local stand-in for the OpenAI vision API.
+
+Set VISION_BACKEND=fake to run the analyze endpoints without an API key
+or network. The fake exposes the same `chat.completions.create` surface
+as the OpenAI clients (sync and async) and returns real ChatCompletion
+objects, so the scheduler, parsing and validation paths are exercised
+unchanged.
+
+- The analysis is one of CANNED_ANALYSES, chosen by a hash of the image
+  (the same image always gets the same analysis).
+- Latency is VISION_FAKE_LATENCY_MS plus up to VISION_FAKE_JITTER_MS.
+- A VISION_FAKE_ERROR_RATE fraction of calls fails with
+  VISION_FAKE_ERROR_STATUS (default 503; 429 also sends retry-after).
+  Which calls fail is drawn from a generator seeded with VISION_FAKE_SEED.
+"""
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+import asyncio
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+CANNED_ANALYSES: List[Dict[str, Any]] = [
+    {
+        "original_meal": {"name": "Grilled Chicken Rice Bowl", "description": "Grilled chicken over brown rice with steamed broccoli"},
+        "thrown_away": [{"item": "broccoli", "quantity": "3/4 cup", "percentage_of_original": "90%"}],
+        "eaten": [
+            {"item": "grilled chicken", "quantity": "6 oz", "percentage_of_original": "100%"},
+            {"item": "brown rice", "quantity": "1 cup", "percentage_of_original": "85%"}
+        ],
+        "food_preferences": {
+            "likely_dislikes": ["broccoli"],
+            "likely_likes": ["grilled chicken", "brown rice"],
+            "insights": "Eats protein and grains, leaves green vegetables"
+        },
+        "waste_summary": {"total_waste_percentage": "25%", "waste_value": "low"}
+    },
+    {
+        "original_meal": {"name": "Spaghetti Marinara", "description": "Spaghetti with marinara sauce, side salad and garlic bread"},
+        "thrown_away": [
+            {"item": "side salad", "quantity": "1 cup", "percentage_of_original": "100%"},
+            {"item": "spaghetti", "quantity": "1/2 cup", "percentage_of_original": "30%"}
+        ],
+        "eaten": [
+            {"item": "garlic bread", "quantity": "2 slices", "percentage_of_original": "100%"},
+            {"item": "spaghetti", "quantity": "1 cup", "percentage_of_original": "70%"}
+        ],
+        "food_preferences": {
+            "likely_dislikes": ["side salad", "lettuce"],
+            "likely_likes": ["garlic bread", "spaghetti"],
+            "insights": "Prefers carbohydrates; skipped the salad entirely"
+        },
+        "waste_summary": {"total_waste_percentage": "40%", "waste_value": "medium"}
+    },
+    {
+        "original_meal": {"name": "Baked Salmon Plate", "description": "Baked salmon with roasted carrots and quinoa"},
+        "thrown_away": [
+            {"item": "baked salmon", "quantity": "4 oz", "percentage_of_original": "80%"},
+            {"item": "quinoa", "quantity": "1/2 cup", "percentage_of_original": "50%"}
+        ],
+        "eaten": [{"item": "roasted carrots", "quantity": "1 cup", "percentage_of_original": "100%"}],
+        "food_preferences": {
+            "likely_dislikes": ["salmon", "quinoa"],
+            "likely_likes": ["roasted carrots"],
+            "insights": "Avoids fish; finished the vegetables"
+        },
+        "waste_summary": {"total_waste_percentage": "60%", "waste_value": "high"}
+    },
+    {
+        "original_meal": {"name": "Cheeseburger and Fries", "description": "Beef cheeseburger with french fries and pickles"},
+        "thrown_away": [{"item": "pickles", "quantity": "3 slices", "percentage_of_original": "100%"}],
+        "eaten": [
+            {"item": "cheeseburger", "quantity": "1 burger", "percentage_of_original": "100%"},
+            {"item": "french fries", "quantity": "1 serving", "percentage_of_original": "95%"}
+        ],
+        "food_preferences": {
+            "likely_dislikes": ["pickles"],
+            "likely_likes": ["cheeseburger", "french fries"],
+            "insights": "Finished nearly everything except the pickles"
+        },
+        "waste_summary": {"total_waste_percentage": "5%", "waste_value": "low"}
+    },
+    {
+        "original_meal": {"name": "Tofu Stir Fry", "description": "Tofu stir fry with peppers, mushrooms and white rice"},
+        "thrown_away": [
+            {"item": "mushrooms", "quantity": "1/2 cup", "percentage_of_original": "100%"},
+            {"item": "tofu", "quantity": "3 oz", "percentage_of_original": "60%"}
+        ],
+        "eaten": [
+            {"item": "white rice", "quantity": "1 cup", "percentage_of_original": "100%"},
+            {"item": "peppers", "quantity": "1/2 cup", "percentage_of_original": "90%"}
+        ],
+        "food_preferences": {
+            "likely_dislikes": ["mushrooms", "tofu"],
+            "likely_likes": ["white rice", "peppers"],
+            "insights": "Picked out the mushrooms and most of the tofu"
+        },
+        "waste_summary": {"total_waste_percentage": "45%", "waste_value": "medium"}
+    }
+]
+
+
+class FakeVisionError(Exception):
+    """Simulated API failure; shaped like OpenAI's status errors for retry_decision."""
+
+    def __init__(self, status_code: int, retry_after: Optional[float] = None):
+        super().__init__(f"Fake vision backend error {status_code}")
+        self.status_code = status_code
+        headers = {"retry-after": str(retry_after)} if retry_after is not None else {}
+        self.response = SimpleNamespace(headers=headers)
+
+
+def _image_reference(messages: List[Dict]) -> str:
+    for message in messages:
+        content = message.get("content")
+        for part in content if isinstance(content, list) else []:
+            if part.get("type") == "image_url":
+                return part["image_url"]["url"]
+    return ""
+
+
+def canned_analysis(image_reference: str) -> Dict[str, Any]:
+    """The canned analysis for an image (data URL or URL); stable across runs."""
+    digest = hashlib.sha256(image_reference.encode("utf-8")).digest()
+    return CANNED_ANALYSES[int.from_bytes(digest[:4], "big") % len(CANNED_ANALYSES)]
+
+
+class _FakeVisionBase:
+    def __init__(
+        self,
+        latency_ms: float = 800,
+        jitter_ms: float = 400,
+        error_rate: float = 0.0,
+        error_status: int = 503,
+        seed: int = 0
+    ):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            latency_ms=float(os.getenv("VISION_FAKE_LATENCY_MS", "800")),
+            jitter_ms=float(os.getenv("VISION_FAKE_JITTER_MS", "400")),
+            error_rate=float(os.getenv("VISION_FAKE_ERROR_RATE", "0")),
+            error_status=int(os.getenv("VISION_FAKE_ERROR_STATUS", "503")),
+            seed=int(os.getenv("VISION_FAKE_SEED", "0"))
+        )
+
+    def _plan(self, kwargs: Dict[str, Any]):
+        """(delay seconds, error or None, completion) for one call."""
+        with self._lock:
+            self.calls += 1
+            delay = (self.latency_ms + self._rng.uniform(0, self.jitter_ms)) / 1000.0
+            fails = self._rng.random() < self.error_rate
+        if fails:
+            retry_after = 1.0 if self.error_status == 429 else None
+            return delay, FakeVisionError(self.error_status, retry_after), None
+        return delay, None, self._completion(kwargs)
+
+    def _completion(self, kwargs: Dict[str, Any]):
+        from openai.types.chat import ChatCompletion
+
+        messages = kwargs.get("messages", [])
+        content = json.dumps(canned_analysis(_image_reference(messages)))
+        completion_tokens = len(content) // 4
+        return ChatCompletion.model_validate({
+            "id": f"chatcmpl-fake-{self.calls}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": kwargs.get("model", "fake"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": 1200, "completion_tokens": completion_tokens,
+                      "total_tokens": 1200 + completion_tokens}
+        })
+
+
+class FakeVisionClient(_FakeVisionBase):
+    """Drop-in for openai.OpenAI as far as food_analysis_service uses it."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, **kwargs):
+        delay, error, completion = self._plan(kwargs)
+        time.sleep(delay)
+        if error is not None:
+            raise error
+        return completion
+
+
+class AsyncFakeVisionClient(_FakeVisionBase):
+    """Drop-in for openai.AsyncOpenAI as far as food_analysis_service uses it."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def _create(self, **kwargs):
+        delay, error, completion = self._plan(kwargs)
+        await asyncio.sleep(delay)
+        if error is not None:
+            raise error
+        return completion
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
@@ -1,14 +1,85 @@
 import openai
-import base64
+import asyncio
 import json
 import os
-from typing import Dict, Any, Union
+import threading
+import time
+from typing import Any, BinaryIO, Dict, List, Union
 from dotenv import load_dotenv
 from models import WasteAnalysis
+import analysis_cache
+import image_preprocessing
+import metrics
+import upload_streaming
+import vision_scheduler
 
 # Load environment variables
 load_dotenv()
-openai.api_key = os.getenv("OPENAI_KEY")
+
+VISION_MODEL = "gpt-4o"
+MAX_OUTPUT_TOKENS = 1000
+# Typical size of the analysis JSON; reserved up front and settled to the reported usage afterwards
+EXPECTED_OUTPUT_TOKENS = 400
+
+# Images of one batch request analyzed concurrently
+BATCH_CONCURRENCY = int(os.getenv("ANALYZE_BATCH_CONCURRENCY", "4"))
+
+# What a preprocessed (<= 2048px) image costs in high detail: 85 + 170 per 512px tile, 4 tiles typical
+IMAGE_TOKEN_ESTIMATE = 765
+
+# "openai" or "fake" (deterministic local stand-in, see fake_vision)
+VISION_BACKEND = os.getenv("VISION_BACKEND", "openai").lower()
+
+_client = None
+_async_fake_client = None
+_client_lock = threading.Lock()
+
+
+def _get_client():
+    """
+    Shared vision client for the configured backend.
+
+    OPENAI_BASE_URL points the OpenAI client at a proxy or local fake
+    server. The SDK's own retries are disabled; vision_scheduler owns
+    retries and backoff.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            if VISION_BACKEND == "fake":
+                import fake_vision
+                _client = fake_vision.FakeVisionClient.from_env()
+            elif VISION_BACKEND == "openai":
+                _client = openai.OpenAI(
+                    api_key=os.getenv("OPENAI_KEY") or os.getenv("OPENAI_API_KEY"),
+                    base_url=os.getenv("OPENAI_BASE_URL") or None,
+                    max_retries=0
+                )
+            else:
+                raise ValueError(f"Unknown VISION_BACKEND: {VISION_BACKEND}")
+        return _client
+
+def _get_async_client():
+    """
+    Async vision client for one batch, used as an async context manager.
+
+    OpenAI clients are bound to the event loop, so each batch gets its own;
+    the fake is shared so its seeded error sequence carries across batches.
+    """
+    global _async_fake_client
+    if VISION_BACKEND == "fake":
+        import fake_vision
+        with _client_lock:
+            if _async_fake_client is None:
+                _async_fake_client = fake_vision.AsyncFakeVisionClient.from_env()
+            return _async_fake_client
+    if VISION_BACKEND != "openai":
+        raise ValueError(f"Unknown VISION_BACKEND: {VISION_BACKEND}")
+    return openai.AsyncOpenAI(
+        api_key=os.getenv("OPENAI_KEY") or os.getenv("OPENAI_API_KEY"),
+        base_url=os.getenv("OPENAI_BASE_URL") or None,
+        max_retries=0
+    )
 
 SYSTEM_PROMPT = """Analyze this image of unfinished food carefully. 
 
@@ -84,36 +155,61 @@ def _parse_json_response(response_text: str) -> Dict[str, Any]:
         print(f"[ERROR] Unexpected error in parsing: {e}")
         raise
 
-def _call_openai_vision(payload_content: list) -> Dict[str, Any]:
-    """Internal helper to call OpenAI API."""
+def _estimate_tokens(payload_content: list) -> int:
+    """
+    Rough tokens/min charge for a call: prompt + images + the expected output.
+
+    Reserving the full MAX_OUTPUT_TOKENS would hold back over twice what an
+    analysis uses; the scheduler corrects the charge with the actual usage.
+    """
+    images = sum(1 for part in payload_content if part.get("type") == "image_url")
+    return len(SYSTEM_PROMPT) // 4 + images * IMAGE_TOKEN_ESTIMATE + EXPECTED_OUTPUT_TOKENS
+
+def _completion_request(payload_content: list) -> Dict[str, Any]:
+    """Keyword arguments for chat.completions.create."""
+    return {
+        "model": VISION_MODEL,
+        "messages": [
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": SYSTEM_PROMPT},
+                    *payload_content
+                ]
+            }
+        ],
+        "max_tokens": MAX_OUTPUT_TOKENS
+    }
+
+def _tokens_used(response) -> Any:
+    return response.usage.total_tokens if response.usage else None
+
+def _parse_completion(response) -> Dict[str, Any]:
+    """Extract, parse and validate the analysis from a chat completion."""
+    response_content = response.choices[0].message.content
+    print(f"[DEBUG] OpenAI response received, length: {len(response_content) if response_content else 0}")
+    
+    if not response_content:
+        raise ValueError("OpenAI returned empty content")
+    
+    result_dict = _parse_json_response(response_content)
+    
+    # Validate against the Pydantic model (this ensures structure compliance)
+    validated_result = WasteAnalysis(**result_dict)
+    return validated_result.model_dump()
+
+def _call_openai_vision(payload_content: list, priority: int = vision_scheduler.INTERACTIVE) -> Dict[str, Any]:
+    """Internal helper to call OpenAI API (through the rate-limit-aware scheduler)."""
     try:
         print(f"[DEBUG] Calling OpenAI Vision API...")
-        response = openai.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": SYSTEM_PROMPT},
-                        *payload_content
-                    ]
-                }
-            ],
-            max_tokens=1000
-        )
-        
-        # Extract response content
-        response_content = response.choices[0].message.content
-        print(f"[DEBUG] OpenAI response received, length: {len(response_content) if response_content else 0}")
-        
-        if not response_content:
-            raise ValueError("OpenAI returned empty content")
-        
-        result_dict = _parse_json_response(response_content)
-        
-        # Validate against the Pydantic model (this ensures structure compliance)
-        validated_result = WasteAnalysis(**result_dict)
-        return validated_result.model_dump()
+        with metrics.timer("vision"):
+            response = vision_scheduler.get_scheduler().run(
+                lambda: _get_client().chat.completions.create(**_completion_request(payload_content)),
+                priority=priority,
+                estimated_tokens=_estimate_tokens(payload_content),
+                tokens_used=_tokens_used
+            )
+        return _parse_completion(response)
         
     except openai.APIError as e:
         print(f"[ERROR] OpenAI API Error: {e}")
@@ -124,26 +220,74 @@ def _call_openai_vision(payload_content: list) -> Dict[str, Any]:
         raise Exception(f"Analysis failed: {str(e)}")
 
 
-def analyze_image_bytes(image_bytes: bytes) -> Dict[str, Any]:
+def analyze_image_bytes(
+    image_bytes: bytes,
+    use_cache: bool = True,
+    priority: int = vision_scheduler.INTERACTIVE
+) -> Dict[str, Any]:
     """
     Analyze an image provided as bytes.
+    
+    Results are cached by image content (see analysis_cache), so the same
+    photo uploaded twice is only sent to the vision API once. On a miss the
+    image is downscaled and re-encoded first (see image_preprocessing).
+    
+    Args:
+        image_bytes: Raw image bytes
+        use_cache: Set to False to skip the cache lookup and force a fresh
+            analysis (the new result still replaces the cached one)
+        priority: vision_scheduler lane (INTERACTIVE or BACKFILL)
     """
-    base64_image = base64.b64encode(image_bytes).decode('utf-8')
-    payload = [
+    return _analyze_image(image_bytes, use_cache, priority)
+
+def analyze_image_file(stream: BinaryIO, use_cache: bool = True) -> Dict[str, Any]:
+    """
+    Analyze an image provided as a seekable binary stream (e.g. a spooled upload).
+    
+    The stream is hashed, decoded and encoded in chunks and never read
+    into memory as a whole (see upload_streaming).
+    
+    Args:
+        stream: Seekable binary stream positioned at the start of the image
+        use_cache: As for analyze_image_bytes
+    """
+    return _analyze_image(stream, use_cache, vision_scheduler.INTERACTIVE)
+
+def _cached_analysis(source: Union[bytes, BinaryIO], use_cache: bool):
+    """
+    Look up an image in the analysis cache.
+
+    Returns:
+        (cache or None, key or None, cached result or None)
+    """
+    cache = analysis_cache.get_analysis_cache()
+    if cache is None:
+        return None, None, None
+    # Keyed on the uploaded bytes so duplicates hit before any decoding;
+    # fake-backend results never mix with real ones
+    variant = image_preprocessing.settings_signature()
+    if VISION_BACKEND != "openai":
+        variant += f"|{VISION_BACKEND}"
+    key = analysis_cache.cache_key(source, VISION_MODEL, SYSTEM_PROMPT, variant)
+    if not use_cache:
+        cache.record_bypass()
+        return cache, key, None
+    return cache, key, cache.get(key)
+
+def _image_payload(source: Union[bytes, BinaryIO]) -> list:
+    # Downscale and strip metadata; the MIME type follows the bytes actually sent
+    prepared = image_preprocessing.prepare_image(source)
+    return [
         {
             "type": "image_url",
             "image_url": {
-                "url": f"data:image/jpeg;base64,{base64_image}"
+                "url": upload_streaming.encode_data_url(prepared.data, prepared.mime_type)
             }
         }
     ]
-    return _call_openai_vision(payload)
 
-def analyze_image_url(image_url: str) -> Dict[str, Any]:
-    """
-    Analyze an image provided via URL.
-    """
-    payload = [
+def _url_payload(image_url: str) -> list:
+    return [
         {
             "type": "image_url",
             "image_url": {
@@ -151,4 +295,80 @@ def analyze_image_url(image_url: str) -> Dict[str, Any]:
             }
         }
     ]
-    return _call_openai_vision(payload)
+
+def _analyze_image(source: Union[bytes, BinaryIO], use_cache: bool, priority: int) -> Dict[str, Any]:
+    cache, key, cached = _cached_analysis(source, use_cache)
+    if cached is not None:
+        return cached
+
+    result = _call_openai_vision(_image_payload(source), priority)
+    if cache is not None:
+        cache.set(key, result)
+    return result
+
+def analyze_image_url(image_url: str, priority: int = vision_scheduler.INTERACTIVE) -> Dict[str, Any]:
+    """
+    Analyze an image provided via URL.
+    """
+    return _call_openai_vision(_url_payload(image_url), priority)
+
+async def analyze_images_async(
+    images: List[Union[bytes, BinaryIO, str]],
+    use_cache: bool = True,
+    concurrency: int = BATCH_CONCURRENCY
+) -> List[Dict[str, Any]]:
+    """
+    Analyze several images concurrently on an async OpenAI client.
+
+    At most `concurrency` images are in flight for this batch (the
+    scheduler's global limits still apply). Cache lookups and
+    preprocessing run in worker threads so they overlap too. One failed
+    image does not fail the others.
+
+    Args:
+        images: Image bytes, seekable streams, or image URLs (str)
+        use_cache: As for analyze_image_bytes (URLs are never cached)
+        concurrency: Maximum images of this batch in flight at once
+
+    Returns:
+        One {"success", "analysis" | "error", "cached", "elapsed_ms"} dict
+        per image, in input order
+    """
+    scheduler = vision_scheduler.get_scheduler()
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async with _get_async_client() as client:
+
+        async def analyze_one(source) -> Dict[str, Any]:
+            started = time.perf_counter()
+            async with semaphore:
+                try:
+                    cache = key = None
+                    if isinstance(source, str):
+                        payload = _url_payload(source)
+                    else:
+                        cache, key, cached = await asyncio.to_thread(_cached_analysis, source, use_cache)
+                        if cached is not None:
+                            return {"success": True, "analysis": cached, "cached": True,
+                                    "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)}
+                        payload = await asyncio.to_thread(_image_payload, source)
+
+                    with metrics.timer("vision"):
+                        response = await scheduler.run_async(
+                            lambda: client.chat.completions.create(**_completion_request(payload)),
+                            priority=vision_scheduler.INTERACTIVE,
+                            estimated_tokens=_estimate_tokens(payload),
+                            tokens_used=_tokens_used
+                        )
+                    result = _parse_completion(response)
+                    if cache is not None:
+                        await asyncio.to_thread(cache.set, key, result)
+                    return {"success": True, "analysis": result, "cached": False,
+                            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)}
+                except Exception as e:
+                    print(f"[ERROR] Batch image analysis failed: {e}")
+                    return {"success": False, "error": str(e),
+                            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)}
+
+        # gather preserves input order
+        return await asyncio.gather(*(analyze_one(source) for source in images))
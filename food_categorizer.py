@@ -0,0 +1,173 @@
+from collections import deque
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+import csv
+import json
+import os
+
+
+class FoodCategorizer:
+    """
+    Categorizes food names against a keyword -> category table.
+
+    The table is compiled once into an Aho-Corasick automaton, so a lookup
+    costs O(len(food_name)) no matter how many keywords there are (tens of
+    thousands are fine). Results are memoized in an LRU cache.
+
+    Matching rules (deterministic):
+        1. An exact match of the whole (lowercased) name wins.
+        2. Otherwise the longest keyword contained in the name wins.
+        3. Ties go to the keyword that starts earliest in the name, then to
+           the keyword listed first in the table.
+        4. Names matching no keyword are "other".
+    """
+
+    def __init__(self, categories: Dict[str, str], cache_size: int = 4096, default: str = "other"):
+        """
+        Args:
+            categories: Mapping of keyword -> category (keywords are lowercased)
+            cache_size: Maximum number of memoized lookups
+            default: Category returned when nothing matches
+        """
+        self.default = default
+        self.categories: Dict[str, str] = {}
+        for keyword, category in categories.items():
+            keyword = keyword.lower()
+            if keyword and keyword not in self.categories:
+                self.categories[keyword] = category
+
+        self._build_automaton()
+        self._lookup = lru_cache(maxsize=cache_size)(self._categorize_uncached)
+
+    def _build_automaton(self):
+        # Node i: goto transitions, failure link, best keyword ending here
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._best: List[Optional[Tuple[int, int, str]]] = [None]  # (length, table order, category)
+
+        for order, (keyword, category) in enumerate(self.categories.items()):
+            node = 0
+            for char in keyword:
+                next_node = self._goto[node].get(char)
+                if next_node is None:
+                    next_node = len(self._goto)
+                    self._goto[node][char] = next_node
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._best.append(None)
+                node = next_node
+            self._best[node] = (len(keyword), order, category)
+
+        # Breadth-first pass to set failure links; a node's own keyword is
+        # always longer than anything reachable through its failure link.
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0) if node else 0
+                if self._best[child] is None:
+                    self._best[child] = self._best[self._fail[child]]
+
+    def _categorize_uncached(self, food_lower: str) -> str:
+        exact = self.categories.get(food_lower)
+        if exact is not None:
+            return exact
+
+        goto, fail, best = self._goto, self._fail, self._best
+        node = 0
+        winner = None  # (length, -start, -order) compared as "greater is better"
+        winner_category = self.default
+        for end, char in enumerate(food_lower):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+
+            # Longest keyword ending here; shorter ones on the failure chain
+            # may start later but can never beat it on length.
+            candidate = best[node]
+            if candidate is not None:
+                length, order, category = candidate
+                key = (length, length - end - 1, -order)
+                if winner is None or key > winner:
+                    winner, winner_category = key, category
+        return winner_category
+
+    def categorize(self, food_name: str) -> str:
+        """
+        Categorize a food item.
+
+        Args:
+            food_name: Food name (any case)
+
+        Returns:
+            Category name, or the default category if nothing matches
+        """
+        return self._lookup(food_name.lower())
+
+    def cache_info(self):
+        """LRU cache statistics (hits, misses, maxsize, currsize)."""
+        return self._lookup.cache_info()
+
+    @classmethod
+    def from_file(cls, path: str, base: Optional[Dict[str, str]] = None, **kwargs) -> "FoodCategorizer":
+        """
+        Build a categorizer from a vocabulary file, optionally on top of a base table.
+
+        Supported formats:
+            .json  {"keyword": "category", ...} or {"category": ["keyword", ...], ...}
+            .csv / .tsv  rows of keyword,category (a header row is skipped)
+
+        Args:
+            path: Path to the vocabulary file
+            base: Built-in table; entries from the file take precedence
+
+        Returns:
+            FoodCategorizer
+        """
+        categories = load_category_file(path)
+        if base:
+            merged = {keyword.lower(): category for keyword, category in categories.items()}
+            for keyword, category in base.items():
+                merged.setdefault(keyword.lower(), category)
+            categories = merged
+        return cls(categories, **kwargs)
+
+
+def load_category_file(path: str) -> Dict[str, str]:
+    """
+    Load a keyword -> category mapping from a JSON or CSV/TSV file.
+
+    Args:
+        path: Path to the vocabulary file
+
+    Returns:
+        Mapping of keyword -> category
+    """
+    extension = os.path.splitext(path)[1].lower()
+    categories: Dict[str, str] = {}
+
+    if extension == ".json":
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        for key, value in data.items():
+            if isinstance(value, list):
+                for keyword in value:
+                    categories.setdefault(keyword.lower(), key)
+            else:
+                categories.setdefault(key.lower(), value)
+        return categories
+
+    delimiter = "\t" if extension == ".tsv" else ","
+    with open(path, encoding="utf-8", newline="") as f:
+        for row in csv.reader(f, delimiter=delimiter):
+            if len(row) < 2 or not row[0].strip():
+                continue
+            keyword, category = row[0].strip().lower(), row[1].strip()
+            if (keyword, category.lower()) in (("keyword", "category"), ("term", "category"), ("food", "category")):
+                continue
+            categories.setdefault(keyword, category)
+    return categories
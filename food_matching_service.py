@@ -3,13 +3,40 @@ import os
 from dotenv import load_dotenv
 from user_preference_manager import UserFoodPreferenceManager
 from dining_hall_manager import DiningHallManager
+from menu_scoring import MenuScoringEngine
+from menu_index import MenuIndex
 
 load_dotenv()
 
+# (dining_hall, meal_period) -> engine built on that menu's index
+_scoring_engines: Dict[tuple, MenuScoringEngine] = {}
+
+def get_scoring_engine(dining_hall: str, meal_period: str, index: MenuIndex) -> MenuScoringEngine:
+    """
+    Get the scoring engine for a hall's menu, rebuilding it only when the menu index changes.
+    
+    Args:
+        dining_hall: Name of dining hall
+        meal_period: Meal period (breakfast/lunch/dinner)
+        index: Current MenuIndex for that hall and period
+        
+    Returns:
+        MenuScoringEngine for the menu
+    """
+    key = (dining_hall, meal_period)
+    engine = _scoring_engines.get(key)
+    if engine is None or engine.index is not index:
+        engine = MenuScoringEngine(index.items, index=index)
+        _scoring_engines[key] = engine
+    return engine
+
 def calculate_match_score(user_likes: List[str], user_dislikes: List[str], food_item: Dict) -> tuple[float, List[str], str]:
     """
     Calculate how well a food item matches user preferences.
     
+    This is the reference implementation; get_matched_items scores whole
+    menus with menu_scoring.MenuScoringEngine, which returns identical results.
+    
     Returns:
         (match_score, match_reasons, confidence)
     """
@@ -125,28 +152,18 @@ def get_matched_items(user_id: str, dining_hall: str = "North Campus Dining",
             db_name="food_preferences"
         )
         
-        items = dining_manager.get_items_by_hall_and_period(dining_hall, meal_period)
-        
-        # Calculate match scores
-        matched_items = []
-        for item in items:
-            score, reasons, confidence = calculate_match_score(user_likes, user_dislikes, item)
-            
-            matched_items.append({
-                "item": item,
-                "match_score": round(score, 1),
-                "match_reasons": reasons,
-                "confidence": confidence
-            })
+        index = dining_manager.get_menu_index(dining_hall, meal_period)
         
-        # Sort by match score (descending)
-        matched_items.sort(key=lambda x: x['match_score'], reverse=True)
+        # Score the whole menu at once (same scores and reasons as calculate_match_score);
+        # the inverted index limits substring checks to candidate items
+        engine = get_scoring_engine(dining_hall, meal_period, index)
+        matched_items = engine.rank(user_likes, user_dislikes, limit=limit)
         
         # Close connections
         user_manager.close()
         dining_manager.close()
         
-        return matched_items[:limit]
+        return matched_items
         
     except Exception as e:
         print(f"Error getting matched items: {e}")
@@ -161,11 +178,10 @@ def get_all_dining_halls() -> List[str]:
             db_name="food_preferences"
         )
         
-        items = dining_manager.get_all_items()
-        halls = list(set(item['dining_hall'] for item in items))
+        halls = dining_manager.get_dining_halls()
         
         dining_manager.close()
-        return sorted(halls)
+        return halls
         
     except Exception as e:
         print(f"Error getting dining halls: {e}")
@@ -0,0 +1,255 @@
+"""
+Shrink uploaded photos before they are sent to the vision API.
+
+Phone photos are often 4-12 MB; the vision model does not need more than
+about 1.5k pixels on the long side to read a food tray. Each upload is
+decoded, rotated according to its EXIF orientation, downscaled to
+IMAGE_MAX_DIMENSION, and re-encoded as JPEG or WebP without metadata
+(which also drops GPS and camera tags). An image that needed no downscaling,
+carries no metadata and is already in a format the API accepts is sent
+unchanged when re-encoding would not make it smaller.
+
+Pillow is optional: without it, or for formats it cannot decode, the
+original bytes are sent unchanged with their detected MIME type.
+
+Environment:
+    IMAGE_PREPROCESSING     "off" to send uploads unchanged (default on)
+    IMAGE_MAX_DIMENSION     Longest side in pixels after downscaling (default 1536)
+    IMAGE_OUTPUT_FORMAT     "jpeg" (default) or "webp"
+    IMAGE_QUALITY           Encoder quality 1-95 (default 85)
+"""
+from dataclasses import dataclass
+from typing import BinaryIO, Dict, Optional, Tuple, Union
+import io
+import os
+import threading
+from dotenv import load_dotenv
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional
+    Image = None
+    ImageOps = None
+
+load_dotenv()
+
+PREPROCESSING_ENABLED = os.getenv("IMAGE_PREPROCESSING", "on").lower() not in ("0", "off", "false", "no")
+MAX_DIMENSION = int(os.getenv("IMAGE_MAX_DIMENSION", "1536"))
+OUTPUT_FORMAT = os.getenv("IMAGE_OUTPUT_FORMAT", "jpeg").lower()
+QUALITY = int(os.getenv("IMAGE_QUALITY", "85"))
+
+MIME_TYPES = {
+    "jpeg": "image/jpeg",
+    "png": "image/png",
+    "gif": "image/gif",
+    "webp": "image/webp",
+    "heic": "image/heic",
+    "bmp": "image/bmp",
+    "tiff": "image/tiff",
+}
+
+# Formats the vision API accepts as they are
+PASSTHROUGH_FORMATS = ("jpeg", "png", "gif", "webp")
+
+# Image.info keys holding metadata that must not leave the server
+_METADATA_KEYS = ("exif", "xmp", "XML:com.adobe.xmp", "comment")
+
+_stats_lock = threading.Lock()
+_stats = {"images": 0, "reencoded": 0, "passed_through": 0, "bytes_in": 0, "bytes_out": 0}
+
+
+@dataclass
+class PreparedImage:
+    """
+    An image ready to be sent to the vision API.
+
+    `data` is the re-encoded bytes, or the original bytes/stream when the
+    image is passed through unchanged.
+    """
+    data: Union[bytes, BinaryIO]
+    mime_type: str
+    original_format: Optional[str]
+    original_bytes: int
+    byte_size: int
+    original_size: Optional[Tuple[int, int]] = None
+    size: Optional[Tuple[int, int]] = None
+
+    @property
+    def reduction(self) -> float:
+        """Fraction of bytes saved (0.0 when sent unchanged)."""
+        return 1 - self.byte_size / self.original_bytes if self.original_bytes else 0.0
+
+
+def detect_format(data: bytes) -> Optional[str]:
+    """
+    Detect an image format from its magic bytes.
+
+    Returns:
+        "jpeg", "png", "gif", "webp", "heic", "bmp", "tiff", or None
+    """
+    if data.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if data[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "webp"
+    if data[4:8] == b"ftyp" and data[8:12] in (b"heic", b"heix", b"hevc", b"hevx", b"mif1", b"msf1"):
+        return "heic"
+    if data.startswith(b"BM"):
+        return "bmp"
+    if data[:4] in (b"II*\x00", b"MM\x00*"):
+        return "tiff"
+    return None
+
+
+def settings_signature() -> str:
+    """Identifies the current settings (part of the analysis cache key)."""
+    if not PREPROCESSING_ENABLED or Image is None:
+        return "raw"
+    return f"{OUTPUT_FORMAT}:{MAX_DIMENSION}:{QUALITY}"
+
+
+def _record(image: PreparedImage, reencoded: bool):
+    with _stats_lock:
+        _stats["images"] += 1
+        _stats["reencoded" if reencoded else "passed_through"] += 1
+        _stats["bytes_in"] += image.original_bytes
+        _stats["bytes_out"] += image.byte_size
+
+
+def _source_size(source: Union[bytes, BinaryIO]) -> int:
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return len(source)
+    position = source.tell()
+    end = source.seek(0, os.SEEK_END)
+    source.seek(position)
+    return end - position
+
+
+def _head(source: Union[bytes, BinaryIO], length: int = 16) -> bytes:
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return bytes(source[:length])
+    position = source.tell()
+    head = source.read(length)
+    source.seek(position)
+    return head
+
+
+def _passthrough(source: Union[bytes, BinaryIO], image_format: Optional[str]) -> PreparedImage:
+    size = _source_size(source)
+    image = PreparedImage(
+        data=source,
+        mime_type=MIME_TYPES.get(image_format, "image/jpeg"),
+        original_format=image_format,
+        original_bytes=size,
+        byte_size=size
+    )
+    _record(image, reencoded=False)
+    return image
+
+
+def prepare_image(
+    data: Union[bytes, BinaryIO],
+    max_dimension: Optional[int] = None,
+    output_format: Optional[str] = None,
+    quality: Optional[int] = None
+) -> PreparedImage:
+    """
+    Downscale and re-encode an uploaded image for the vision API.
+
+    Args:
+        data: Uploaded image bytes, or a seekable stream positioned at the image
+        max_dimension: Longest side after downscaling (default IMAGE_MAX_DIMENSION)
+        output_format: "jpeg" or "webp" (default IMAGE_OUTPUT_FORMAT)
+        quality: Encoder quality (default IMAGE_QUALITY)
+
+    Returns:
+        PreparedImage with the bytes to send, their MIME type and size before/after
+
+    Raises:
+        ValueError: If the image has an absurd pixel count (decompression bomb)
+    """
+    image_format = detect_format(_head(data))
+    if not PREPROCESSING_ENABLED or Image is None:
+        return _passthrough(data, image_format)
+
+    max_dimension = max_dimension or MAX_DIMENSION
+    output_format = (output_format or OUTPUT_FORMAT).lower()
+    quality = quality or QUALITY
+
+    position = None if isinstance(data, (bytes, bytearray, memoryview)) else data.tell()
+    try:
+        img = Image.open(io.BytesIO(data) if position is None else data)
+        original_size = img.size
+        if img.format == "JPEG":
+            # Let libjpeg decode at a reduced scale instead of full resolution
+            img.draft("RGB", (max_dimension, max_dimension))
+        img.load()
+        # Orientation lives in EXIF too, so an image without metadata needs no rotation
+        has_metadata = bool(img.getexif()) or any(key in img.info for key in _METADATA_KEYS)
+        animated = getattr(img, "n_frames", 1) > 1
+        img = ImageOps.exif_transpose(img)
+    except Image.DecompressionBombError as e:
+        raise ValueError(f"Image is too large to process: {e}")
+    except Exception as e:
+        print(f"[DEBUG] Image preprocessing skipped ({image_format or 'unknown format'}): {e}")
+        return _passthrough(data, image_format)
+
+    finally:
+        if position is not None:
+            data.seek(position)
+
+    img.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+
+    has_alpha = img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info)
+    if output_format == "webp":
+        img = img.convert("RGBA" if has_alpha else "RGB")
+        save_options = {"format": "WEBP", "quality": quality, "method": 4}
+    else:
+        output_format = "jpeg"
+        if has_alpha:
+            # JPEG has no alpha channel: flatten onto white like a tray photo background
+            background = Image.new("RGB", img.size, (255, 255, 255))
+            background.paste(img.convert("RGBA"), mask=img.convert("RGBA").getchannel("A"))
+            img = background
+        else:
+            img = img.convert("RGB")
+        save_options = {"format": "JPEG", "quality": quality, "optimize": True, "progressive": True}
+
+    buffer = io.BytesIO()
+    # No exif/icc arguments: metadata is not carried over
+    img.save(buffer, **save_options)
+
+    encoded = buffer.getvalue()
+    original_bytes = _source_size(data)
+    if (img.size == original_size and len(encoded) >= original_bytes and not has_metadata
+            and not animated and image_format in PASSTHROUGH_FORMATS):
+        # Small already-compact image: re-encoding would only add bytes
+        return _passthrough(data, image_format)
+
+    prepared = PreparedImage(
+        data=encoded,
+        mime_type=MIME_TYPES[output_format],
+        original_format=image_format,
+        original_bytes=original_bytes,
+        byte_size=len(encoded),
+        original_size=original_size,
+        size=img.size
+    )
+    _record(prepared, reencoded=True)
+    print(f"[DEBUG] Image preprocessed: {prepared.original_bytes / 1024:.0f} KB -> {prepared.byte_size / 1024:.0f} KB "
+          f"({original_size[0]}x{original_size[1]} -> {img.size[0]}x{img.size[1]} {output_format})")
+    return prepared
+
+
+def stats() -> Dict:
+    """Counters for processed images and bytes before/after."""
+    with _stats_lock:
+        counters = dict(_stats)
+    counters["bytes_saved"] = counters["bytes_in"] - counters["bytes_out"]
+    counters["reduction"] = round(1 - counters["bytes_out"] / counters["bytes_in"], 3) if counters["bytes_in"] else None
+    counters["settings"] = settings_signature()
+    counters["pillow_available"] = Image is not None
+    return counters
@@ -0,0 +1,178 @@
+"""
+Push admin dashboard insights to every open dashboard from one computation.
+
+A single background thread recomputes the dashboard snapshot every
+ADMIN_INSIGHTS_PUSH_INTERVAL seconds while at least one dashboard is
+connected, diffs it against the previous one, and hands only the changed
+sections to each subscriber's queue. The cost of the computation does
+not depend on the number of open dashboards.
+"""
+from typing import Callable, Dict, List, Optional, Tuple
+import json
+import os
+import queue
+import threading
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Seconds between recomputations while dashboards are connected
+PUSH_INTERVAL = float(os.getenv("ADMIN_INSIGHTS_PUSH_INTERVAL", "10"))
+
+# Events buffered per dashboard before it is considered too slow and dropped
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+class Subscription:
+    """One connected dashboard: a bounded queue of (event, id, data) tuples."""
+
+    def __init__(self):
+        self.queue: "queue.Queue[Tuple[str, int, str]]" = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.closed = False
+
+    def get(self, timeout: float) -> Optional[Tuple[str, int, str]]:
+        """Next event, or None if nothing arrived within timeout."""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+def diff_snapshots(previous: Optional[Dict], current: Dict) -> Dict[str, object]:
+    """
+    Changed sections between two snapshots of {section: {key: value}}.
+
+    Returns:
+        Mapping of "section.key" -> new value (None for removed keys)
+    """
+    changes = {}
+    previous = previous or {}
+    for section, values in current.items():
+        old_values = previous.get(section) or {}
+        for key, value in values.items():
+            if key not in old_values or old_values[key] != value:
+                changes[f"{section}.{key}"] = value
+        for key in old_values:
+            if key not in values:
+                changes[f"{section}.{key}"] = None
+    return changes
+
+
+class InsightsBroadcaster:
+    """
+    Shares one periodically recomputed snapshot among many SSE subscribers.
+
+    New subscribers receive the latest full snapshot ("snapshot" event),
+    then only the sections that changed ("delta" events). The worker
+    thread starts with the first subscriber and stops when the last one
+    leaves.
+    """
+
+    def __init__(self, compute: Callable[[], Dict], interval: float = PUSH_INTERVAL):
+        """
+        Args:
+            compute: Returns the dashboard snapshot as {section: {key: value}}
+            interval: Seconds between recomputations
+        """
+        self.compute = compute
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._subscribers: List[Subscription] = []
+        self._snapshot: Optional[Dict] = None
+        self._snapshot_event: Optional[Tuple[str, int, str]] = None
+        self._version = 0
+        self._thread: Optional[threading.Thread] = None
+        self._computations = 0
+        self._dropped = 0
+        self._last_computed_at: Optional[float] = None
+
+    def subscribe(self) -> Subscription:
+        """Register a dashboard; it gets the current snapshot right away if there is one."""
+        subscription = Subscription()
+        with self._lock:
+            if self._snapshot_event is not None:
+                subscription.queue.put_nowait(self._snapshot_event)
+            self._subscribers.append(subscription)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="insights-broadcaster", daemon=True)
+                self._thread.start()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        """Remove a dashboard (idempotent)."""
+        with self._lock:
+            subscription.closed = True
+            if subscription in self._subscribers:
+                self._subscribers.remove(subscription)
+            if not self._subscribers:
+                self._wakeup.set()
+
+    def refresh(self):
+        """Recompute now instead of waiting for the next interval."""
+        self._wakeup.set()
+
+    def stats(self) -> Dict:
+        """Subscriber and computation counters."""
+        with self._lock:
+            return {
+                "subscribers": len(self._subscribers),
+                "version": self._version,
+                "computations": self._computations,
+                "dropped_subscribers": self._dropped,
+                "last_computed_at": self._last_computed_at,
+                "interval_seconds": self.interval
+            }
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._subscribers:
+                    self._thread = None
+                    return
+            try:
+                snapshot = self.compute()
+            except Exception as e:
+                print(f"Error computing dashboard insights: {e}")
+                snapshot = None
+            if snapshot is not None:
+                self._publish(snapshot)
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+
+    def _publish(self, snapshot: Dict):
+        first = self._snapshot is None
+        changes = diff_snapshots(self._snapshot, snapshot)
+        with self._lock:
+            self._computations += 1
+            self._last_computed_at = time.time()
+            if not first and not changes:
+                return
+            self._version += 1
+            self._snapshot = snapshot
+            # Serialized once and shared by every subscriber
+            self._snapshot_event = ("snapshot", self._version, json.dumps(snapshot, default=str))
+            event = self._snapshot_event if first else ("delta", self._version, json.dumps(changes, default=str))
+            for subscription in list(self._subscribers):
+                try:
+                    subscription.queue.put_nowait(event)
+                except queue.Full:
+                    # Too far behind: drop it, the browser reconnects and gets a fresh snapshot
+                    subscription.closed = True
+                    self._subscribers.remove(subscription)
+                    self._dropped += 1
+
+
+_broadcaster: Optional[InsightsBroadcaster] = None
+_broadcaster_lock = threading.Lock()
+
+
+def get_broadcaster() -> InsightsBroadcaster:
+    """The process-wide broadcaster for the admin dashboard."""
+    global _broadcaster
+    with _broadcaster_lock:
+        if _broadcaster is None:
+            import admin_analytics_service
+            _broadcaster = InsightsBroadcaster(admin_analytics_service.get_dashboard_snapshot)
+        return _broadcaster
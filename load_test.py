@@ -0,0 +1,244 @@
+"""
+Load-test driver for a running API server.
+
+Replays a weighted mix of analyze / preference update / summary /
+recommendation / matching calls at a target request rate and reports
+throughput and latency percentiles per endpoint.
+
+Requests are issued open-loop on a fixed schedule (or Poisson arrivals):
+a slow server does not slow the offered load down, and latency is measured
+from each request's scheduled start, so client-side queueing shows up in
+the numbers instead of being hidden.
+
+Run the server against the local fake vision backend to load-test without
+OpenAI:
+
+    VISION_BACKEND=fake VISION_FAKE_LATENCY_MS=800 python api_atlas.py
+    python load_test.py --rps 20 --duration 60
+    python load_test.py --mix analyze=1,update=3,summary=4,recommendations=2,matching=2 --json results.json
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from fake_vision import CANNED_ANALYSES
+
+DEFAULT_MIX = "analyze=1,update=3,summary=4,recommendations=2,matching=2"
+DEFAULT_IMAGE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "unfinished_food.jpg")
+DINING_HALL = "North Campus Dining"
+
+_local = threading.local()
+
+
+def _session() -> requests.Session:
+    # One keep-alive session per worker thread
+    if not hasattr(_local, "session"):
+        _local.session = requests.Session()
+    return _local.session
+
+
+class LoadTest:
+    """Issues the request mix and collects per-endpoint latencies."""
+
+    def __init__(self, base_url, users, image_bytes, allow_cache, timeout):
+        self.base_url = base_url.rstrip("/")
+        self.users = users
+        self.image_bytes = image_bytes
+        self.allow_cache = allow_cache
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.results = {}  # endpoint -> list of (latency_s, service_s, ok)
+
+    # --- operations -------------------------------------------------------
+
+    def analyze(self, rng):
+        query = "" if self.allow_cache else "?nocache=1"
+        return _session().post(
+            f"{self.base_url}/api/analyze/image{query}",
+            files={"file": ("tray.jpg", self.image_bytes, "image/jpeg")},
+            timeout=self.timeout
+        )
+
+    def update(self, rng):
+        return _session().post(
+            f"{self.base_url}/api/user/preferences/update",
+            json={"user_id": rng.choice(self.users), "waste_analysis": rng.choice(CANNED_ANALYSES)},
+            timeout=self.timeout
+        )
+
+    def summary(self, rng):
+        return _session().get(f"{self.base_url}/api/user/{rng.choice(self.users)}/summary", timeout=self.timeout)
+
+    def recommendations(self, rng):
+        return _session().get(
+            f"{self.base_url}/api/user/{rng.choice(self.users)}/recommendations",
+            params={"limit": 5}, timeout=self.timeout
+        )
+
+    def matching(self, rng):
+        return _session().get(
+            f"{self.base_url}/api/user/{rng.choice(self.users)}/matched-items",
+            params={"dining_hall": DINING_HALL, "meal_period": rng.choice(["breakfast", "lunch", "dinner"]), "limit": 5},
+            timeout=self.timeout
+        )
+
+    OPERATIONS = ("analyze", "update", "summary", "recommendations", "matching")
+
+    # --- driver ------------------------------------------------------------
+
+    def setup(self):
+        """Create the test users and give each some preferences."""
+        rng = random.Random(0)
+        for user_id in self.users:
+            _session().post(f"{self.base_url}/api/user/create",
+                            json={"user_id": user_id, "user_name": user_id}, timeout=self.timeout)
+            _session().post(f"{self.base_url}/api/user/preferences/update",
+                            json={"user_id": user_id, "waste_analysis": rng.choice(CANNED_ANALYSES)},
+                            timeout=self.timeout)
+
+    def _execute(self, name, scheduled_at, seed):
+        started = time.perf_counter()
+        try:
+            response = getattr(self, name)(random.Random(seed))
+            ok = response.status_code < 400
+        except requests.RequestException:
+            ok = False
+        finished = time.perf_counter()
+        with self.lock:
+            self.results.setdefault(name, []).append((finished - scheduled_at, finished - started, ok))
+
+    def run(self, mix, rps, duration, workers, poisson, seed):
+        names = list(mix)
+        weights = [mix[name] for name in names]
+        rng = random.Random(seed)
+        total = int(rps * duration)
+        max_lag = 0.0
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            start = time.perf_counter()
+            scheduled = start
+            for i in range(total):
+                scheduled += rng.expovariate(rps) if poisson else 1.0 / rps
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    max_lag = max(max_lag, -delay)
+                executor.submit(self._execute, rng.choices(names, weights)[0], scheduled, rng.random())
+            issued_for = time.perf_counter() - start
+        elapsed = time.perf_counter() - start
+        return elapsed, issued_for, max_lag
+
+
+def _percentile(ordered, pct):
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+def summarize(results, elapsed):
+    """Per-endpoint and overall throughput and latency percentiles (ms)."""
+    def stats(samples):
+        latencies = sorted(latency for latency, _, _ in samples)
+        service = sorted(service for _, service, _ in samples)
+        errors = sum(1 for _, _, ok in samples if not ok)
+        return {
+            "requests": len(samples),
+            "errors": errors,
+            "error_rate": round(errors / len(samples), 4) if samples else None,
+            "throughput_rps": round((len(samples) - errors) / elapsed, 2) if elapsed else None,
+            "p50_ms": round(_percentile(latencies, 50) * 1000, 1) if samples else None,
+            "p90_ms": round(_percentile(latencies, 90) * 1000, 1) if samples else None,
+            "p99_ms": round(_percentile(latencies, 99) * 1000, 1) if samples else None,
+            "max_ms": round(latencies[-1] * 1000, 1) if samples else None,
+            "service_p50_ms": round(_percentile(service, 50) * 1000, 1) if samples else None
+        }
+
+    report = {name: stats(samples) for name, samples in sorted(results.items())}
+    report["ALL"] = stats([sample for samples in results.values() for sample in samples])
+    return report
+
+
+def print_report(report):
+    header = f"{'endpoint':<16}{'reqs':>7}{'errors':>8}{'ok rps':>9}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}"
+    print(header)
+    print("-" * len(header))
+    for name, row in report.items():
+        if not row["requests"]:
+            continue
+        print(f"{name:<16}{row['requests']:>7}{row['errors']:>8}{row['throughput_rps']:>9}"
+              f"{row['p50_ms']:>9}{row['p90_ms']:>9}{row['p99_ms']:>9}{row['max_ms']:>9}")
+    print("(latencies in ms, measured from each request's scheduled start)")
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in LoadTest.OPERATIONS:
+            raise argparse.ArgumentTypeError(f"unknown operation '{name}' (choose from {', '.join(LoadTest.OPERATIONS)})")
+        mix[name] = float(weight or 1)
+    return {name: weight for name, weight in mix.items() if weight > 0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a realistic request mix at a target RPS")
+    parser.add_argument("--base-url", default=os.getenv("LOAD_TEST_BASE_URL", "http://localhost:5001"))
+    parser.add_argument("--rps", type=float, default=10.0, help="Target requests per second")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to generate load for")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX), help=f"Weights (default {DEFAULT_MIX})")
+    parser.add_argument("--users", type=int, default=50, help="Distinct test users")
+    parser.add_argument("--workers", type=int, default=64, help="Client threads (must cover rps x latency)")
+    parser.add_argument("--image", default=DEFAULT_IMAGE, help="Image uploaded by analyze calls")
+    parser.add_argument("--allow-cache", action="store_true", help="Let analyze calls hit the analysis cache")
+    parser.add_argument("--poisson", action="store_true", help="Poisson arrivals instead of a fixed interval")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--skip-setup", action="store_true", help="Reuse users from a previous run")
+    parser.add_argument("--json", help="Also write the report to this file")
+    args = parser.parse_args()
+
+    with open(args.image, "rb") as f:
+        image_bytes = f.read()
+    users = [f"load_user_{i:04d}" for i in range(args.users)]
+    test = LoadTest(args.base_url, users, image_bytes, args.allow_cache, args.timeout)
+
+    try:
+        requests.get(f"{test.base_url}/api/health", timeout=5)
+    except requests.RequestException as e:
+        print(f"❌ Server not reachable at {test.base_url}: {e}")
+        sys.exit(1)
+
+    if not args.skip_setup:
+        print(f"Setting up {len(users)} users...")
+        test.setup()
+
+    print(f"Offering {args.rps} rps for {args.duration:.0f}s ({'poisson' if args.poisson else 'fixed'} arrivals), "
+          f"mix {args.mix}")
+    elapsed, issued_for, max_lag = test.run(args.mix, args.rps, args.duration, args.workers, args.poisson, args.seed)
+    report = summarize(test.results, elapsed)
+    print()
+    print_report(report)
+    if max_lag > 0.1:
+        print(f"⚠️  Driver fell {max_lag:.2f}s behind schedule; raise --workers or lower --rps")
+    print(f"Offered {report['ALL']['requests'] / issued_for:.1f} rps over {issued_for:.1f}s; finished in {elapsed:.1f}s")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": {k: v for k, v in vars(args).items() if k != "mix"}, "mix": args.mix,
+                       "elapsed_s": round(elapsed, 2), "endpoints": report}, f, indent=2)
+        print(f"Report written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+from pymongo.errors import BulkWriteError
+from typing import Dict, List
+import atexit
+import os
+import threading
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Defaults (can be overridden through the environment)
+DEFAULT_BATCH_SIZE = int(os.getenv("MEAL_HISTORY_BATCH_SIZE", "100"))
+DEFAULT_FLUSH_INTERVAL = float(os.getenv("MEAL_HISTORY_FLUSH_INTERVAL", "1.0"))
+DEFAULT_MAX_BUFFERED = int(os.getenv("MEAL_HISTORY_MAX_BUFFERED", "5000"))
+
+
+class MealHistoryBuffer:
+    """
+    Write-behind buffer for meal_history documents.
+
+    Documents are accumulated in memory and written with unordered
+    insert_many once `batch_size` documents are queued or `flush_interval`
+    seconds have passed, whichever comes first. Memory is bounded: when
+    `max_buffered` documents are waiting, the caller flushes synchronously
+    instead of queueing more. Pending documents are flushed on close() and
+    at interpreter exit.
+    """
+
+    def __init__(
+        self,
+        collection,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+        max_buffered: int = DEFAULT_MAX_BUFFERED
+    ):
+        """
+        Args:
+            collection: pymongo Collection to write history documents into
+            batch_size: Flush as soon as this many documents are queued
+            flush_interval: Maximum seconds a document waits before being flushed
+            max_buffered: Upper bound on documents held in memory
+        """
+        self.collection = collection
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.max_buffered = max(self.batch_size, max_buffered)
+
+        self._buffer: List[Dict] = []
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._closed = False
+
+        # Counters
+        self.queued = 0
+        self.flushed = 0
+        self.failed = 0
+        self.flushes = 0
+
+        # The flusher thread starts on the first add(), so read-only managers cost nothing
+        self._thread = None
+
+    def add(self, doc: Dict):
+        """
+        Queue a history document for writing.
+
+        Args:
+            doc: meal_history document
+        """
+        with self._cond:
+            closed = self._closed
+            if not closed:
+                if self._thread is None:
+                    self._start()
+                self._buffer.append(doc)
+                self.queued += 1
+                pending = len(self._buffer)
+                if pending >= self.batch_size:
+                    self._cond.notify()
+
+        if closed:
+            # Shutting down: write through so nothing is stranded in memory
+            self.collection.insert_one(doc)
+            return
+
+        # Backpressure: never hold more than max_buffered documents
+        if pending >= self.max_buffered:
+            self.flush()
+
+    def _start(self):
+        self._thread = threading.Thread(target=self._run, name="meal-history-flusher", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def flush(self) -> int:
+        """
+        Write all queued documents now.
+
+        Returns:
+            Number of documents written
+        """
+        with self._flush_lock:
+            with self._cond:
+                batch, self._buffer = self._buffer, []
+            if not batch:
+                return 0
+            return self._write(batch)
+
+    def _write(self, batch: List[Dict]) -> int:
+        try:
+            self.collection.insert_many(batch, ordered=False)
+            written = len(batch)
+        except BulkWriteError as e:
+            written = e.details.get('nInserted', 0)
+            self.failed += len(batch) - written
+            print(f"Error flushing meal history: {len(batch) - written} document(s) rejected")
+        except Exception as e:
+            written = 0
+            requeued = self._requeue(batch)
+            self.failed += len(batch) - requeued
+            print(f"Error flushing meal history ({requeued} document(s) requeued): {e}")
+
+        self.flushed += written
+        self.flushes += 1
+        return written
+
+    def _requeue(self, batch: List[Dict]) -> int:
+        """Put a failed batch back at the front of the queue, within the memory bound."""
+        if self._closed:
+            return 0
+        with self._cond:
+            room = max(0, self.max_buffered - len(self._buffer))
+            keep = batch[:room]
+            self._buffer = keep + self._buffer
+            return len(keep)
+
+    def _run(self):
+        deadline = time.monotonic() + self.flush_interval
+        while not self._closed:
+            with self._cond:
+                remaining = deadline - time.monotonic()
+                if len(self._buffer) < self.batch_size and remaining > 0:
+                    self._cond.wait(remaining)
+                due = len(self._buffer) >= self.batch_size or time.monotonic() >= deadline
+            if due:
+                self.flush()
+                deadline = time.monotonic() + self.flush_interval
+
+    def close(self):
+        """Stop the background flusher and write any pending documents."""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_interval + 1)
+        self.flush()
+
+    def stats(self) -> Dict:
+        """Get buffer counters for monitoring."""
+        with self._cond:
+            pending = len(self._buffer)
+        return {
+            "pending": pending,
+            "queued": self.queued,
+            "flushed": self.flushed,
+            "failed": self.failed,
+            "flushes": self.flushes,
+            "batch_size": self.batch_size,
+            "flush_interval": self.flush_interval,
+            "max_buffered": self.max_buffered
+        }
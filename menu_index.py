@@ -0,0 +1,153 @@
+import re
+from typing import Dict, Iterable, List, Optional, Set
+
+# Every substring up to this length is indexed, so short terms are answered
+# exactly from the index and longer terms only verify a few candidates.
+_MAX_GRAM = 3
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+FIELDS = ("ingredients", "name")
+
+
+def _grams(text: str) -> Set[str]:
+    """All substrings of text with length 1.._MAX_GRAM."""
+    grams = set()
+    for n in range(1, _MAX_GRAM + 1):
+        for start in range(len(text) - n + 1):
+            grams.add(text[start:start + n])
+    return grams
+
+
+class MenuIndex:
+    """
+    In-memory inverted index over one menu (a dining hall + meal period).
+
+    Maps normalized ingredient and name tokens, and every substring of up to
+    three characters, to the items that contain them. Substring lookups use
+    the short-gram postings to shortlist candidate items and only verify
+    those, so checking a user's likes/dislikes touches the few items that
+    can match instead of scanning every ingredient on the menu.
+
+    Normalization matches food_matching_service.calculate_match_score:
+    ingredients are lowercased and stripped, names are lowercased.
+    """
+
+    def __init__(self, items: List[Dict]):
+        """
+        Args:
+            items: Menu item documents; positions in this list identify items
+        """
+        self.items = items
+        self.item_ids = [item.get('item_id') for item in items]
+        self._texts = {
+            "ingredients": [[ing.lower().strip() for ing in item.get('ingredients', [])] for item in items],
+            "name": [[item.get('name', '').lower()] for item in items]
+        }
+        self._grams: Dict[str, Dict[str, Set[int]]] = {field: {} for field in FIELDS}
+        self._tokens: Dict[str, Dict[str, Set[int]]] = {field: {} for field in FIELDS}
+
+        for field in FIELDS:
+            grams, tokens = self._grams[field], self._tokens[field]
+            for position, texts in enumerate(self._texts[field]):
+                for text in texts:
+                    for gram in _grams(text):
+                        grams.setdefault(gram, set()).add(position)
+                    for token in _TOKEN_PATTERN.findall(text):
+                        tokens.setdefault(token, set()).add(position)
+
+    def __len__(self):
+        return len(self.items)
+
+    def positions_containing(self, term: str, field: str = "ingredients") -> Set[int]:
+        """
+        Positions of items where `term` is a substring of the field.
+
+        For "ingredients" the term must occur within a single ingredient,
+        exactly like `any(term in ing for ing in ingredients)`.
+
+        Args:
+            term: Normalized (lowercased, stripped) search term
+            field: "ingredients" or "name"
+
+        Returns:
+            Set of item positions
+        """
+        if not term:
+            # "" is in every string, but any() over no ingredients is still False
+            return {position for position, texts in enumerate(self._texts[field]) if texts}
+
+        postings = self._grams[field]
+        if len(term) <= _MAX_GRAM:
+            return set(postings.get(term, ()))
+
+        # Every gram of the term must be present; intersect smallest lists first
+        term_grams = sorted({term[i:i + _MAX_GRAM] for i in range(len(term) - _MAX_GRAM + 1)},
+                            key=lambda gram: len(postings.get(gram, ())))
+        candidates: Optional[Set[int]] = None
+        for gram in term_grams:
+            posting = postings.get(gram)
+            if not posting:
+                return set()
+            candidates = set(posting) if candidates is None else candidates & posting
+            if not candidates:
+                return set()
+
+        texts = self._texts[field]
+        return {position for position in candidates if any(term in text for text in texts[position])}
+
+    def items_containing(self, term: str, fields: Iterable[str] = FIELDS) -> List[str]:
+        """
+        item_ids of items whose ingredients or name contain `term` as a substring.
+
+        Args:
+            term: Search term (normalized here)
+            fields: Fields to search
+
+        Returns:
+            Matching item_ids in menu order
+        """
+        term = term.lower().strip()
+        positions = set()
+        for field in fields:
+            positions |= self.positions_containing(term, field)
+        return [self.item_ids[position] for position in sorted(positions)]
+
+    def lookup_token(self, token: str, fields: Iterable[str] = FIELDS) -> List[str]:
+        """
+        item_ids of items with an exact word match (e.g. "rice" but not "licorice").
+
+        Args:
+            token: Single word
+            fields: Fields to search
+
+        Returns:
+            Matching item_ids in menu order
+        """
+        token = token.lower().strip()
+        positions = set()
+        for field in fields:
+            positions |= self._tokens[field].get(token, set())
+        return [self.item_ids[position] for position in sorted(positions)]
+
+    def search(self, query: str) -> List[Dict]:
+        """
+        Menu search: items whose name or ingredients contain every word of the query.
+
+        Args:
+            query: Free-text query, e.g. "garlic chicken"
+
+        Returns:
+            Matching item documents in menu order
+        """
+        words = _TOKEN_PATTERN.findall(query.lower())
+        if not words:
+            return []
+
+        positions: Optional[Set[int]] = None
+        for word in words:
+            found = self.positions_containing(word, "ingredients") | self.positions_containing(word, "name")
+            positions = found if positions is None else positions & found
+            if not positions:
+                return []
+        return [self.items[position] for position in sorted(positions)]
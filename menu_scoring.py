@@ -0,0 +1,204 @@
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+from menu_index import MenuIndex
+
+# Separator for joining an item's ingredients into one searchable string;
+# a term "is in any ingredient" exactly when it is in the joined string.
+_INGREDIENT_SEPARATOR = "\x1f"
+
+# Per-engine cap on memoized term -> hit vectors
+_TERM_CACHE_SIZE = 4096
+
+
+class MenuScoringEngine:
+    """
+    Scores a whole menu against a user's likes and dislikes at once.
+
+    The per-item features used by food_matching_service.calculate_match_score
+    (lowercased ingredients, name, category, tags) are precomputed when the
+    engine is built. Each like/dislike term is turned into boolean hit
+    vectors over the menu (memoized across users); a user becomes a vector of
+    term counts, and the scores for every item come out of one matrix-vector
+    product per side (likes, dislikes). Scores, confidences and
+    match_reasons are identical to calculate_match_score.
+    """
+
+    def __init__(self, items: List[Dict], index: Optional[MenuIndex] = None):
+        """
+        Args:
+            items: Dining hall item documents (as returned by DiningHallManager)
+            index: Inverted index over the same items; when given, term hits are
+                looked up in the index instead of scanning every item
+        """
+        self.items = items
+        self.index = index
+        self._ingredients = np.array(
+            [_INGREDIENT_SEPARATOR.join(ing.lower().strip() for ing in item.get('ingredients', []))
+             for item in items],
+            dtype=str
+        )
+        self._has_ingredients = np.array([bool(item.get('ingredients')) for item in items], dtype=bool)
+        self._names = np.array([item.get('name', '').lower() for item in items], dtype=str)
+        self._categories_lower = np.array([item.get('category', '').lower() for item in items], dtype=str)
+
+        tags = [[tag.lower() for tag in item.get('tags', [])] for item in items]
+        self._healthy = np.array(['healthy' in item_tags for item_tags in tags], dtype=bool)
+        self._plant_based = np.array(
+            ['vegan' in item_tags or 'vegetarian' in item_tags for item_tags in tags], dtype=bool
+        )
+        self._term_cache: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+
+    def __len__(self):
+        return len(self.items)
+
+    def _term_hits(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Boolean vectors: term found in any ingredient / in the item name."""
+        hits = self._term_cache.get(term)
+        if hits is None:
+            if self.index is not None:
+                ingredient_hits = self._positions_to_mask(self.index.positions_containing(term, "ingredients"))
+                name_hits = self._positions_to_mask(self.index.positions_containing(term, "name"))
+            elif not term:
+                # "" is in every string, but any() over no ingredients is still False
+                ingredient_hits = self._has_ingredients.copy()
+                name_hits = np.ones(len(self.items), dtype=bool)
+            elif len(self.items):
+                ingredient_hits = np.char.find(self._ingredients, term) >= 0
+                name_hits = np.char.find(self._names, term) >= 0
+            else:
+                ingredient_hits = name_hits = np.zeros(0, dtype=bool)
+            if len(self._term_cache) >= _TERM_CACHE_SIZE:
+                self._term_cache.clear()
+            hits = (ingredient_hits, name_hits)
+            self._term_cache[term] = hits
+        return hits
+
+    def _positions_to_mask(self, positions) -> np.ndarray:
+        mask = np.zeros(len(self.items), dtype=bool)
+        if positions:
+            mask[list(positions)] = True
+        return mask
+
+    def _hit_matrices(self, terms: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """Stack per-term hit vectors into (terms x items) ingredient and name matrices."""
+        hits = [self._term_hits(term) for term in terms]
+        return (np.vstack([ingredient_hits for ingredient_hits, _ in hits]),
+                np.vstack([name_hits for _, name_hits in hits]))
+
+    def score(self, user_likes: List[str], user_dislikes: List[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Score every menu item.
+
+        Args:
+            user_likes: User's liked foods
+            user_dislikes: User's disliked foods
+
+        Returns:
+            (scores, early_exit, confidence_level) arrays over the menu, where
+            early_exit marks items rejected on dislikes alone and
+            confidence_level is 2=high, 1=medium, 0=low
+        """
+        n_items = len(self.items)
+
+        # Dislikes: -30 if in an ingredient, else -25 if in the name
+        dislike_terms, dislike_counts = _term_vector(user_dislikes)
+        penalty = np.zeros(n_items)
+        if dislike_terms:
+            ingredient_hits, name_hits = self._hit_matrices(dislike_terms)
+            penalty = dislike_counts @ np.where(ingredient_hits, 30, np.where(name_hits, 25, 0))
+
+        # Likes: +20 if in an ingredient, else +15 if in the name, else +10 if it is the category
+        like_terms, like_counts = _term_vector(user_likes)
+        bonus = np.zeros(n_items)
+        if like_terms:
+            ingredient_hits, name_hits = self._hit_matrices(like_terms)
+            category_hits = self._categories_lower[np.newaxis, :] == np.array(like_terms, dtype=str)[:, np.newaxis]
+            bonus = like_counts @ np.where(ingredient_hits, 20, np.where(name_hits, 15, np.where(category_hits, 10, 0)))
+
+        base = 50.0 - penalty
+        early_exit = base < 20
+        full = np.minimum(100, base + bonus + 5 * self._healthy + 3 * self._plant_based)
+        scores = np.where(early_exit, np.maximum(0, base), full)
+
+        confidence_level = np.where(scores >= 75, 2, np.where(scores >= 50, 1, 0))
+        confidence_level = np.where(early_exit, 0, confidence_level)
+        return scores, early_exit, confidence_level
+
+    def match_reasons(self, index: int, user_likes: List[str], user_dislikes: List[str], early_exit: bool) -> List[str]:
+        """Build the match_reasons list for one item (same wording and order as calculate_match_score)."""
+        reasons = []
+        for dislike in user_dislikes:
+            ingredient_hits, name_hits = self._term_hits(dislike.lower().strip())
+            if ingredient_hits[index]:
+                reasons.append(f"Contains disliked ingredient: {dislike}")
+            elif name_hits[index]:
+                reasons.append(f"Item name contains disliked food: {dislike}")
+
+        if early_exit:
+            return reasons
+
+        matched_likes = []
+        category_lower = self._categories_lower[index]
+        for like in user_likes:
+            like_lower = like.lower().strip()
+            ingredient_hits, name_hits = self._term_hits(like_lower)
+            if ingredient_hits[index] or name_hits[index] or like_lower == category_lower:
+                matched_likes.append(like)
+        if matched_likes:
+            reasons.append(f"Matches your preferences: {', '.join(matched_likes)}")
+
+        if self._healthy[index]:
+            reasons.append("Healthy option")
+
+        if not reasons:
+            reasons.append(f"General {self._categories_lower[index]} option")
+        return reasons
+
+    def score_item(self, index: int, user_likes: List[str], user_dislikes: List[str]) -> Tuple[float, List[str], str]:
+        """Score a single item; same return shape as calculate_match_score."""
+        scores, early_exit, confidence_level = self.score(user_likes, user_dislikes)
+        reasons = self.match_reasons(index, user_likes, user_dislikes, bool(early_exit[index]))
+        return (float(scores[index]), reasons, _CONFIDENCE[confidence_level[index]])
+
+    def rank(self, user_likes: List[str], user_dislikes: List[str], limit: int = 10) -> List[Dict]:
+        """
+        Get the top menu items for a user.
+
+        Args:
+            user_likes: User's liked foods
+            user_dislikes: User's disliked foods
+            limit: Maximum number of items to return
+
+        Returns:
+            List of {"item", "match_score", "match_reasons", "confidence"} dicts,
+            ordered exactly like sorting calculate_match_score results
+        """
+        if not self.items or limit <= 0:
+            return []
+
+        scores, early_exit, confidence_level = self.score(user_likes, user_dislikes)
+        rounded = np.round(scores, 1)
+        # Stable descending sort keeps menu order among equal scores, like list.sort(reverse=True)
+        order = np.argsort(-rounded, kind='stable')[:limit]
+
+        return [
+            {
+                "item": self.items[index],
+                "match_score": float(rounded[index]),
+                "match_reasons": self.match_reasons(index, user_likes, user_dislikes, bool(early_exit[index])),
+                "confidence": _CONFIDENCE[confidence_level[index]]
+            }
+            for index in order.tolist()
+        ]
+
+
+_CONFIDENCE = {0: "low", 1: "medium", 2: "high"}
+
+
+def _term_vector(foods: List[str]) -> Tuple[List[str], np.ndarray]:
+    """Represent a list of foods as (unique normalized terms, multiplicity vector)."""
+    counts: Dict[str, int] = {}
+    for food in foods:
+        term = food.lower().strip()
+        counts[term] = counts.get(term, 0) + 1
+    return list(counts.keys()), np.array(list(counts.values()), dtype=float)
@@ -0,0 +1,356 @@
+"""
+Request instrumentation exposed in Prometheus text format.
+
+`init_app(app)` installs before/after request hooks that record, per
+route template (e.g. `/api/user/<user_id>/summary`) and method:
+
+- request count by status code and error (5xx) count
+- a latency histogram
+- time spent in, and calls made to, MongoDB and the vision API during
+  that request
+
+MongoDB time comes from a pymongo command listener (CommandTimingListener,
+or command_monitor's subclass of it) that db_registry registers on the
+shared clients. Vision time comes from `timer("vision")` around scheduler
+calls, so it includes time queued behind rate limits. Calls made outside
+a request (background jobs) only feed the per-dependency call histograms.
+
+`render()` produces the /metrics payload, including gauges read from the
+connection pools, analysis cache, job queue, vision scheduler and upload
+counters. Set METRICS_ENABLED=false to skip the request hooks entirely.
+"""
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Tuple
+import os
+import threading
+import time
+from pymongo import monitoring
+from dotenv import load_dotenv
+
+load_dotenv()
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() not in ("0", "false", "off", "no")
+
+# Seconds; vision calls routinely take several seconds, so the tail goes past Prometheus' defaults
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Calls to one dependency during one request (MongoDB round trips, vision calls)
+CALL_COUNT_BUCKETS = (0.0, 1.0, 2.0, 3.0, 5.0, 10.0, 20.0, 50.0, 100.0)
+
+DEPENDENCIES = ("mongodb", "vision")
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Histogram:
+    """Cumulative-bucket histogram; callers hold the registry lock."""
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        # bisect_left puts a value equal to a bound in that bucket (Prometheus `le` is inclusive)
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class RequestTimings:
+    """Dependency time accumulated by the request currently being served."""
+
+    __slots__ = ("started", "mongodb", "vision", "mongodb_calls", "vision_calls", "_lock")
+
+    def __init__(self, started: float):
+        self.started = started
+        self.mongodb = 0.0
+        self.vision = 0.0
+        self.mongodb_calls = 0
+        self.vision_calls = 0
+        # Batch analysis runs cache/preprocessing work on helper threads
+        self._lock = threading.Lock()
+
+    def add(self, dependency: str, seconds: float):
+        calls = f"{dependency}_calls"
+        with self._lock:
+            setattr(self, dependency, getattr(self, dependency) + seconds)
+            setattr(self, calls, getattr(self, calls) + 1)
+
+
+_current: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+_lock = threading.Lock()
+_requests: Dict[Tuple[str, str, int], int] = {}
+_errors: Dict[Tuple[str, str], int] = {}
+_durations: Dict[Tuple[str, str], Histogram] = {}
+_dependency_time: Dict[Tuple[str, str, str], Histogram] = {}
+_dependency_calls: Dict[Tuple[str, str, str], Histogram] = {}
+_calls: Dict[str, Histogram] = {name: Histogram() for name in DEPENDENCIES}
+
+
+def current_request() -> Optional[RequestTimings]:
+    """Timings of the request being served on this thread/task, if any."""
+    return _current.get()
+
+
+def observe(dependency: str, seconds: float):
+    """Record one call to a dependency and charge it to the current request."""
+    with _lock:
+        _calls[dependency].observe(seconds)
+    timings = _current.get()
+    if timings is not None:
+        timings.add(dependency, seconds)
+
+
+@contextmanager
+def timer(dependency: str):
+    """Time a block as one call to `dependency` (see observe)."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(dependency, time.perf_counter() - started)
+
+
+class CommandTimingListener(monitoring.CommandListener):
+    """Feeds MongoDB command round-trip times into the mongodb timer."""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        observe("mongodb", event.duration_micros / 1e6)
+
+    def failed(self, event):
+        observe("mongodb", event.duration_micros / 1e6)
+
+
+# --- Flask hooks ---
+
+def _start_request():
+    _current.set(RequestTimings(time.perf_counter()))
+
+
+def _finish_request(response):
+    from flask import request
+
+    timings = _current.get()
+    if timings is None:
+        return response
+    elapsed = time.perf_counter() - timings.started
+    _current.set(None)
+
+    # Label by route template, not path, to keep cardinality bounded
+    rule = request.url_rule
+    route = rule.rule if rule is not None else "unmatched"
+    method = request.method
+    status = response.status_code
+    key = (route, method)
+    with _lock:
+        _requests[(route, method, status)] = _requests.get((route, method, status), 0) + 1
+        if status >= 500:
+            _errors[key] = _errors.get(key, 0) + 1
+        histogram = _durations.get(key)
+        if histogram is None:
+            histogram = _durations[key] = Histogram()
+            for dependency in DEPENDENCIES:
+                _dependency_time[(route, method, dependency)] = Histogram()
+                _dependency_calls[(route, method, dependency)] = Histogram(CALL_COUNT_BUCKETS)
+        histogram.observe(elapsed)
+        _dependency_time[(route, method, "mongodb")].observe(timings.mongodb)
+        _dependency_time[(route, method, "vision")].observe(timings.vision)
+        _dependency_calls[(route, method, "mongodb")].observe(timings.mongodb_calls)
+        _dependency_calls[(route, method, "vision")].observe(timings.vision_calls)
+    return response
+
+
+def init_app(app):
+    """Install the request hooks on a Flask app (no-op when METRICS_ENABLED is off)."""
+    if not METRICS_ENABLED:
+        return
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+
+
+def reset():
+    """Drop all recorded request and call metrics."""
+    with _lock:
+        _requests.clear()
+        _errors.clear()
+        _durations.clear()
+        _dependency_time.clear()
+        _dependency_calls.clear()
+        for name in DEPENDENCIES:
+            _calls[name] = Histogram()
+
+
+# --- Exposition ---
+
+Sample = Tuple[Dict[str, str], float]
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def _family(lines: List[str], name: str, kind: str, help_text: str, samples: List[Sample]):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} {kind}")
+    for labels, value in samples:
+        lines.append(f"{name}{_labels(labels)} {_number(value)}")
+
+
+def _histogram_family(lines: List[str], name: str, help_text: str, histograms: List[Tuple[Dict[str, str], Histogram]]):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} histogram")
+    for labels, histogram in histograms:
+        cumulative = 0
+        for bound, count in zip(histogram.buckets + (float("inf"),), histogram.counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{_labels({**labels, 'le': _number(bound)})} {cumulative}")
+        lines.append(f"{name}_sum{_labels(labels)} {_number(histogram.sum)}")
+        lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+
+
+def _copy(histogram: Histogram) -> Histogram:
+    clone = Histogram(histogram.buckets)
+    clone.counts = list(histogram.counts)
+    clone.sum = histogram.sum
+    clone.count = histogram.count
+    return clone
+
+
+def _pool_samples(lines: List[str]):
+    import db_registry
+
+    pools = db_registry.get_pool_stats()
+    for field, kind, help_text in [
+        ("open_connections", "gauge", "Open connections in the MongoDB pool"),
+        ("in_use", "gauge", "Connections checked out of the MongoDB pool"),
+        ("checkout_failures", "counter", "Failed MongoDB pool checkouts")
+    ]:
+        name = f"mongodb_pool_{field}" + ("_total" if kind == "counter" else "")
+        _family(lines, name, kind, help_text, [({"host": pool["host"]}, pool[field]) for pool in pools])
+    _family(lines, "mongodb_pool_max_size", "gauge", "Configured maximum MongoDB pool size",
+            [({"host": pool["host"]}, pool["max_pool_size"]) for pool in pools])
+
+
+def _cache_samples(lines: List[str]):
+    import analysis_cache
+
+    # Read the singleton only if something already created it; a scrape should not configure the cache
+    cache = analysis_cache._cache
+    if cache is None:
+        return
+    stats = cache.stats()
+    for field in ("hits", "misses", "stores", "evictions", "errors"):
+        _family(lines, f"analysis_cache_{field}_total", "counter", f"Analysis cache {field}", [({}, stats[field])])
+    if isinstance(stats.get("bytes"), (int, float)):
+        _family(lines, "analysis_cache_bytes", "gauge", "Bytes stored in the analysis cache", [({}, stats["bytes"])])
+
+
+def _job_samples(lines: List[str]):
+    import analysis_jobs
+
+    queue = analysis_jobs._queue
+    if queue is None:
+        return
+    stats = queue.stats()
+    _family(lines, "analysis_jobs_queued", "gauge", "Analysis jobs waiting for a worker", [({}, stats["queue_depth"])])
+    _family(lines, "analysis_jobs_running", "gauge", "Analysis jobs being processed", [({}, stats["running"])])
+    _family(lines, "analysis_jobs_oldest_queued_seconds", "gauge", "Age of the oldest queued analysis job",
+            [({}, stats["oldest_queued_seconds"] or 0)])
+
+
+def _scheduler_samples(lines: List[str]):
+    import vision_scheduler
+
+    scheduler = vision_scheduler._scheduler
+    if scheduler is None:
+        return
+    stats = scheduler.stats()
+    _family(lines, "vision_scheduler_in_flight", "gauge", "Vision calls in progress", [({}, stats["in_flight"])])
+    _family(lines, "vision_scheduler_waiting", "gauge", "Vision calls queued for admission",
+            [({"lane": lane}, count) for lane, count in stats["waiting"].items()])
+    _family(lines, "vision_scheduler_paused_seconds", "gauge", "Remaining rate-limit pause",
+            [({}, stats["paused_for_seconds"])])
+    for field in ("calls", "succeeded", "failed", "retries", "rate_limited", "queue_timeouts"):
+        _family(lines, f"vision_scheduler_{field}_total", "counter", f"Vision scheduler {field.replace('_', ' ')}",
+                [({}, stats[field])])
+
+
+def _upload_samples(lines: List[str]):
+    import upload_streaming
+
+    stats = upload_streaming.stats()
+    for name, field, help_text in [
+        ("uploads_total", "uploads", "Image uploads received"),
+        ("uploads_spooled_to_disk_total", "spooled_to_disk", "Uploads spooled to a temporary file"),
+        ("upload_bytes_total", "upload_bytes", "Bytes of image uploads received"),
+        ("uploads_rejected_too_large_total", "rejected_too_large", "Request bodies rejected with 413")
+    ]:
+        _family(lines, name, "counter", help_text, [({}, stats[field])])
+
+
+_COLLECTORS: List[Callable[[List[str]], None]] = [
+    _pool_samples, _cache_samples, _job_samples, _scheduler_samples, _upload_samples
+]
+
+
+def render() -> str:
+    """All metrics in Prometheus text exposition format."""
+    with _lock:
+        requests = sorted(_requests.items())
+        errors = sorted(_errors.items())
+        durations = sorted((key, _copy(h)) for key, h in _durations.items())
+        dependency_time = sorted((key, _copy(h)) for key, h in _dependency_time.items())
+        dependency_calls = sorted((key, _copy(h)) for key, h in _dependency_calls.items())
+        calls = [(name, _copy(_calls[name])) for name in DEPENDENCIES]
+
+    lines: List[str] = []
+    _family(lines, "http_requests_total", "counter", "HTTP requests by route, method and status",
+            [({"route": route, "method": method, "status": str(status)}, count)
+             for (route, method, status), count in requests])
+    _family(lines, "http_request_errors_total", "counter", "HTTP requests answered with a 5xx status",
+            [({"route": route, "method": method}, count) for (route, method), count in errors])
+    _histogram_family(lines, "http_request_duration_seconds", "HTTP request latency",
+                      [({"route": route, "method": method}, h) for (route, method), h in durations])
+    _histogram_family(lines, "http_request_dependency_seconds",
+                      "Time one HTTP request spent in a dependency (mongodb, vision)",
+                      [({"route": route, "method": method, "dependency": dependency}, h)
+                       for (route, method, dependency), h in dependency_time])
+    _histogram_family(lines, "http_request_dependency_calls",
+                      "Calls one HTTP request made to a dependency (MongoDB round trips, vision calls)",
+                      [({"route": route, "method": method, "dependency": dependency}, h)
+                       for (route, method, dependency), h in dependency_calls])
+    _histogram_family(lines, "dependency_call_duration_seconds",
+                      "Duration of individual MongoDB commands and vision calls (including scheduling)",
+                      [({"dependency": name}, h) for name, h in calls])
+
+    for collect in _COLLECTORS:
+        try:
+            collect(lines)
+        except Exception as e:
+            print(f"[ERROR] Metrics collector {collect.__name__} failed: {e}")
+    lines.append("")
+    return "\n".join(lines)
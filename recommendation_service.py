@@ -1,6 +1,7 @@
 from typing import List, Dict, Optional
 from datetime import datetime
 from user_preference_manager import UserFoodPreferenceManager
+from food_categorizer import FoodCategorizer
 import os
 from dotenv import load_dotenv
 
@@ -44,20 +45,29 @@ def get_food_image_url(food_name: str) -> str:
     food_slug = food_name.replace(" ", "-").lower()
     return f"https://source.unsplash.com/400x300/?{food_slug},food"
 
+# Optional extra vocabulary (JSON or CSV of keyword -> category) merged over FOOD_CATEGORIES
+FOOD_CATEGORIES_FILE = os.getenv("FOOD_CATEGORIES_FILE")
+
+_categorizer: Optional[FoodCategorizer] = None
+
+def get_categorizer() -> FoodCategorizer:
+    """Get the shared categorizer, compiling the category table on first use."""
+    global _categorizer
+    if _categorizer is None:
+        if FOOD_CATEGORIES_FILE:
+            _categorizer = FoodCategorizer.from_file(FOOD_CATEGORIES_FILE, base=FOOD_CATEGORIES)
+        else:
+            _categorizer = FoodCategorizer(FOOD_CATEGORIES)
+    return _categorizer
+
 def categorize_food(food_name: str) -> str:
-    """Categorize a food item."""
-    food_lower = food_name.lower()
-    
-    # Check exact matches first
-    if food_lower in FOOD_CATEGORIES:
-        return FOOD_CATEGORIES[food_lower]
-    
-    # Check if any category keyword is in the food name
-    for keyword, category in FOOD_CATEGORIES.items():
-        if keyword in food_lower:
-            return category
+    """
+    Categorize a food item.
     
-    return "other"
+    Exact matches win; otherwise the longest category keyword found in the
+    name is used (see FoodCategorizer for the tie-breaking rules).
+    """
+    return get_categorizer().categorize(food_name)
 
 def get_recommendations(user_id: str, limit: int = 10) -> List[Dict]:
     """
@@ -91,17 +101,15 @@ def get_recommendations(user_id: str, limit: int = 10) -> List[Dict]:
         
         recommendations = []
         
-        # Get meal history to calculate frequencies
-        history = manager.get_meal_history(user_id, limit=100)
+        # Per-food counters are maintained on the user document at ingest
+        food_stats = user.get('food_stats', {})
         
-        # Count how often each liked food appears
+        # Count how often each liked food has been eaten
         food_frequency = {}
-        for meal in history:
-            eaten_items = meal.get('eaten', [])
-            for item in eaten_items:
-                food_name = item.get('item', '').lower().strip()
-                if food_name in liked_foods:
-                    food_frequency[food_name] = food_frequency.get(food_name, 0) + 1
+        for food in liked_foods:
+            eaten_count = food_stats.get(food, {}).get('eaten_count', 0)
+            if eaten_count:
+                food_frequency[food] = eaten_count
         
         # Calculate match percentages based on frequency
         max_frequency = max(food_frequency.values()) if food_frequency else 1
@@ -195,28 +203,19 @@ def get_dislikes(user_id: str) -> List[Dict]:
         if not disliked_foods:
             return []
         
-        # Get meal history to find when foods were last wasted
-        history = manager.get_meal_history(user_id, limit=100)
+        # Per-food counters are maintained on the user document at ingest
+        food_stats = user.get('food_stats', {})
         
         # Track frequency and last seen
         dislike_data = {}
-        for meal in history:
-            thrown_away = meal.get('thrown_away', [])
-            timestamp = meal.get('timestamp', '')
-            
-            for item in thrown_away:
-                food_name = item.get('item', '').lower().strip()
-                if food_name in disliked_foods:
-                    if food_name not in dislike_data:
-                        dislike_data[food_name] = {
-                            'frequency': 0,
-                            'last_seen': timestamp
-                        }
-                    dislike_data[food_name]['frequency'] += 1
-                    # Update last seen if this is more recent
-                    if timestamp and (not dislike_data[food_name]['last_seen'] or 
-                                     timestamp > dislike_data[food_name]['last_seen']):
-                        dislike_data[food_name]['last_seen'] = timestamp
+        for food in disliked_foods:
+            stats = food_stats.get(food, {})
+            if stats.get('thrown_away_count'):
+                last_seen = stats.get('last_thrown_away')
+                dislike_data[food] = {
+                    'frequency': stats['thrown_away_count'],
+                    'last_seen': last_seen.isoformat() if isinstance(last_seen, datetime) else last_seen
+                }
         
         dislikes = []
         for food in disliked_foods:
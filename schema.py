@@ -0,0 +1,191 @@
+"""
+One-time schema bootstrap for the CleanPlate database.
+
+Creates and verifies every index used by the services and records the
+schema version in the `schema_meta` collection, so the managers never
+have to issue DDL or pings on the request path.
+
+Usage:
+    python schema.py            # create indexes and record the version
+    python schema.py --verify   # only check that the schema is up to date
+"""
+from pymongo.errors import OperationFailure
+from datetime import datetime
+from typing import Dict, List, Optional
+import argparse
+import os
+import sys
+import threading
+from dotenv import load_dotenv
+import db_registry
+
+load_dotenv()
+
+# Bump whenever INDEXES changes so running deployments re-bootstrap
+SCHEMA_VERSION = 5
+
+SCHEMA_META_COLLECTION = "schema_meta"
+
+# collection -> list of (keys, options)
+INDEXES: Dict[str, List] = {
+    "users": [
+        ([("user_id", 1)], {"unique": True}),
+    ],
+    "meal_history": [
+        ([("user_id", 1)], {}),
+        ([("timestamp", 1)], {}),
+        ([("user_id", 1), ("timestamp", -1)], {}),
+    ],
+    "dining_hall_items": [
+        ([("item_id", 1)], {"unique": True}),
+        ([("dining_hall", 1)], {}),
+        ([("meal_period", 1)], {}),
+        ([("category", 1)], {}),
+    ],
+    "menu_match_results": [
+        ([("user_id", 1), ("dining_hall", 1), ("meal_period", 1)], {"unique": True}),
+    ],
+    "dislike_rollup": [
+        ([("kind", 1), ("food", 1)], {"unique": True}),
+        ([("kind", 1), ("count", -1), ("food", 1)], {}),
+    ],
+    "waste_rollup": [
+        ([("granularity", 1), ("kind", 1), ("bucket", 1), ("key", 1)], {"unique": True}),
+    ],
+    "analysis_cache": [
+        ([("last_accessed", 1)], {}),
+    ],
+}
+
+_bootstrapped = set()
+_lock = threading.Lock()
+
+
+def _index_name(keys: List) -> str:
+    return "_".join(f"{field}_{direction}" for field, direction in keys)
+
+
+def get_schema_version(db) -> Optional[int]:
+    """Get the schema version recorded in the database (None if never bootstrapped)."""
+    meta = db[SCHEMA_META_COLLECTION].find_one({"_id": "schema"})
+    return meta.get("version") if meta else None
+
+
+def _is_stale(version: Optional[int]) -> bool:
+    """
+    True if the recorded version is older than this code's.
+
+    A newer version means a newer process already bootstrapped (e.g. during
+    a rolling deploy) and must not be rolled back.
+    """
+    return version is None or version < SCHEMA_VERSION
+
+
+def bootstrap_schema(db) -> Dict:
+    """
+    Create all indexes and record the current schema version.
+
+    The recorded version only ever moves up, so running an older release
+    against a newer database leaves the newer version in place.
+
+    Args:
+        db: pymongo Database
+
+    Returns:
+        Dictionary of created index names per collection
+    """
+    created = {}
+    for collection_name, indexes in INDEXES.items():
+        collection = db[collection_name]
+        created[collection_name] = []
+        for keys, options in indexes:
+            name = collection.create_index(keys, **options)
+            created[collection_name].append(name)
+
+    db[SCHEMA_META_COLLECTION].update_one(
+        {"_id": "schema"},
+        {"$max": {"version": SCHEMA_VERSION}, "$set": {"updated_at": datetime.utcnow()}},
+        upsert=True
+    )
+    return created
+
+
+def verify_schema(db) -> List[str]:
+    """
+    Check that every expected index exists and the version is current.
+
+    A version newer than SCHEMA_VERSION is not a problem: a newer release
+    has already bootstrapped this database.
+
+    Args:
+        db: pymongo Database
+
+    Returns:
+        List of problems found (empty if the schema is up to date)
+    """
+    problems = []
+    version = get_schema_version(db)
+    if _is_stale(version):
+        problems.append(f"schema version is {version}, expected {SCHEMA_VERSION}")
+
+    for collection_name, indexes in INDEXES.items():
+        existing = db[collection_name].index_information()
+        for keys, options in indexes:
+            name = _index_name(keys)
+            if name not in existing:
+                problems.append(f"{collection_name}: missing index {name}")
+            elif options.get("unique") and not existing[name].get("unique"):
+                problems.append(f"{collection_name}: index {name} is not unique")
+    return problems
+
+
+def ensure_schema(db) -> None:
+    """
+    Bootstrap the schema once per process if the recorded version is stale.
+
+    Cheap to call on every request: after the first successful check it
+    only does an in-memory set lookup.
+    """
+    key = (id(db.client), db.name)
+    if key in _bootstrapped:
+        return
+
+    with _lock:
+        if key in _bootstrapped:
+            return
+        try:
+            if _is_stale(get_schema_version(db)):
+                bootstrap_schema(db)
+                print(f"Database schema bootstrapped to version {SCHEMA_VERSION}")
+        except OperationFailure as e:
+            print(f"Warning: Could not bootstrap schema: {e}")
+            return
+        _bootstrapped.add(key)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bootstrap or verify the CleanPlate database schema")
+    parser.add_argument("--verify", action="store_true", help="Only verify, do not create anything")
+    parser.add_argument("--db-name", default=db_registry.DEFAULT_DB_NAME)
+    args = parser.parse_args(argv)
+
+    db = db_registry.get_database(args.db_name, os.getenv("MONGODB_URI"))
+    db.client.admin.command('ping')
+
+    if not args.verify:
+        created = bootstrap_schema(db)
+        for collection_name, names in created.items():
+            print(f"✅ {collection_name}: {', '.join(names)}")
+
+    problems = verify_schema(db)
+    if problems:
+        for problem in problems:
+            print(f"❌ {problem}")
+        return 1
+
+    print(f"🎉 Schema is at version {SCHEMA_VERSION}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,20 @@
-from food_analysis_service import analyze_image_bytes, analyze_image_url
+import asyncio
+from typing import BinaryIO, List, Union
+from food_analysis_service import analyze_image_bytes, analyze_image_file, analyze_image_url, analyze_images_async
 
-def analyze_food_waste_image(image_bytes: bytes) -> dict:
+def analyze_food_waste_image(image_bytes: bytes, use_cache: bool = True) -> dict:
     """
     Analyze an image of unfinished food provided as bytes.
     Delegates to food_analysis_service.
     """
-    return analyze_image_bytes(image_bytes)
+    return analyze_image_bytes(image_bytes, use_cache=use_cache)
+
+def analyze_food_waste_upload(stream: BinaryIO, use_cache: bool = True) -> dict:
+    """
+    Analyze an uploaded image of unfinished food without reading it into memory.
+    Delegates to food_analysis_service.
+    """
+    return analyze_image_file(stream, use_cache=use_cache)
 
 def analyze_food_waste_url(image_url: str) -> dict:
     """
@@ -13,3 +22,10 @@ def analyze_food_waste_url(image_url: str) -> dict:
     Delegates to food_analysis_service.
     """
     return analyze_image_url(image_url)
+
+def analyze_food_waste_batch(images: List[Union[BinaryIO, str]], use_cache: bool = True) -> list:
+    """
+    Analyze several images (uploads or URLs) concurrently; results come back in input order.
+    Delegates to food_analysis_service.
+    """
+    return asyncio.run(analyze_images_async(images, use_cache=use_cache))
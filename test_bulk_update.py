@@ -0,0 +1,68 @@
+"""
+Test the bulk preference ingest endpoint (tray-return station backlog upload).
+"""
+import requests
+import json
+
+BASE_URL = "http://localhost:5001"
+
+print("=" * 60)
+print("Bulk Preference Update Test")
+print("=" * 60)
+
+def make_update(user_id, likes, dislikes, waste):
+    return {
+        "user_id": user_id,
+        "waste_analysis": {
+            "original_meal": {"name": "Test Tray", "description": "Bulk upload test"},
+            "thrown_away": [{"item": d, "quantity": "1 cup", "percentage_of_original": "80%"} for d in dislikes],
+            "eaten": [{"item": l, "quantity": "1 cup", "percentage_of_original": "100%"} for l in likes],
+            "food_preferences": {"likely_dislikes": dislikes, "likely_likes": likes, "insights": "Test data"},
+            "waste_summary": {"total_waste_percentage": f"{waste}%", "waste_value": "medium"}
+        }
+    }
+
+# 1. JSON array with two meals for the same user and one invalid item
+print("\n1. Uploading a JSON array backlog...")
+updates = [
+    make_update("bulk_test_001", ["chicken"], ["broccoli"], 20),
+    make_update("bulk_test_002", ["rice"], ["carrots"], 40),
+    make_update("bulk_test_001", ["broccoli"], ["olives"], 10),
+    {"user_id": "bulk_test_003"}
+]
+response = requests.post(f"{BASE_URL}/api/user/preferences/bulk-update", json=updates)
+result = response.json()
+print(f"   Status: {response.status_code}")
+print(f"   Succeeded: {result.get('succeeded')}, Failed: {result.get('failed')}")
+for item in result.get('results', []):
+    status = "✅" if item['success'] else f"❌ {item.get('error', '')[:60]}"
+    print(f"      [{item['index']}] {item['user_id']}: {status}")
+
+# 2. Check that meals for the same user were applied in order
+print("\n2. Checking bulk_test_001 after two meals...")
+response = requests.get(f"{BASE_URL}/api/user/bulk_test_001")
+user = response.json().get('user', {})
+print(f"   Likes: {user.get('liked_foods')}")
+print(f"   Dislikes: {user.get('disliked_foods')}")
+print(f"   Meal count: {user.get('meal_count')} (expected 2)")
+print(f"   Average waste: {user.get('total_waste_percentage')} (expected 15.0)")
+
+# 3. NDJSON stream
+print("\n3. Uploading an NDJSON stream...")
+body = "\n".join(json.dumps(make_update(f"bulk_test_{i:03d}", ["pasta"], ["kale"], 30)) for i in range(4, 9))
+response = requests.post(
+    f"{BASE_URL}/api/user/preferences/bulk-update",
+    data=body,
+    headers={"Content-Type": "application/x-ndjson"}
+)
+result = response.json()
+print(f"   Status: {response.status_code}")
+print(f"   Count: {result.get('count')}, Succeeded: {result.get('succeeded')}")
+
+# Cleanup
+for i in range(1, 9):
+    requests.delete(f"{BASE_URL}/api/user/bulk_test_{i:03d}")
+
+print("\n" + "=" * 60)
+print("✅ Bulk update test complete!")
+print("=" * 60)
@@ -0,0 +1,217 @@
+"""
+Test MongoDB command monitoring: per-request accounting and the slow log.
+
+Needs no MongoDB: commands are fed to the listener as synthetic pymongo
+events, and the explain for slow commands is answered by a fake client
+registered in db_registry.
+
+Usage:
+    python test_command_monitor.py
+"""
+from types import SimpleNamespace
+import itertools
+import sys
+import time
+
+sys.path.append('.')
+
+from flask import Flask, jsonify
+
+import command_monitor
+import db_registry
+import metrics
+
+FAKE_URI = "mongodb://command-monitor-test"
+_request_ids = itertools.count(1)
+
+IXSCAN_EXPLAIN = {
+    "queryPlanner": {
+        "winningPlan": {"stage": "FETCH", "inputStage": {"stage": "IXSCAN", "indexName": "user_id_1"}},
+        "rejectedPlans": [{"stage": "COLLSCAN"}]
+    },
+    "command": {"find": "users", "filter": {"stage": "x"}}
+}
+
+
+def _command(monitor, name, command, micros=500, reply=None, database="food_preferences"):
+    request_id = next(_request_ids)
+    event = SimpleNamespace(command_name=name, command=command, database_name=database, request_id=request_id,
+                            connection_id=("localhost", 27017), duration_micros=micros, reply=reply or {"ok": 1})
+    monitor.started(event)
+    monitor.succeeded(event)
+
+
+class FakeDatabase:
+    def __init__(self, client):
+        self.client = client
+
+    def command(self, command):
+        self.client.explained.append(command)
+        # The monitor must ignore its own explain round trip
+        _command(self.client.monitor, "explain", command, micros=10_000_000)
+        return self.client.explain_reply
+
+
+class FakeClient:
+    def __init__(self, monitor, explain_reply):
+        self.monitor = monitor
+        self.explain_reply = explain_reply
+        self.explained = []
+
+    def __getitem__(self, name):
+        return FakeDatabase(self)
+
+
+def _wait_for_slow(count, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        recent = command_monitor.stats()["recent_slow"]
+        if len(recent) >= count and all(entry["plan"] is not None for entry in recent):
+            return recent
+        time.sleep(0.01)
+    raise AssertionError(f"expected {count} slow commands, got {command_monitor.stats()['recent_slow']}")
+
+
+def _app(monitor, debug=True):
+    app = Flask(__name__)
+    app.debug = debug
+    metrics.init_app(app)
+    command_monitor.init_app(app)
+
+    @app.route('/api/user/<user_id>/summary')
+    def summary(user_id):
+        _command(monitor, "find", {"find": "users", "filter": {"user_id": user_id}},
+                 reply={"cursor": {"id": 0, "firstBatch": [{"user_id": user_id}]}})
+        for _ in range(3):
+            _command(monitor, "find", {"find": "meal_history", "filter": {"user_id": user_id}},
+                     micros=2000, reply={"cursor": {"id": 0, "firstBatch": [{}, {}]}})
+        _command(monitor, "update", {"update": "users", "updates": [{"q": {"user_id": user_id}, "u": {}}]},
+                 reply={"n": 1, "nModified": 1})
+        timings = metrics.current_request()
+        return jsonify({"mongodb_calls": timings.mongodb_calls if timings else None}), 200
+
+    return app
+
+
+def test_commands_are_attributed_to_the_request():
+    monitor = command_monitor.CommandMonitor(FAKE_URI, slow_ms=1000)
+    client = _app(monitor).test_client()
+    response = client.get('/api/user/alice/summary')
+    assert response.headers["X-DB-Round-Trips"] == "5"
+    assert response.headers["X-DB-Time-Ms"] == "7.0"
+    detail = response.headers["X-DB-Commands"]
+    assert detail.startswith("meal_history.findx3=6.0ms/6docs"), detail
+    assert "users.findx1=0.5ms/1docs" in detail and "users.updatex1=0.5ms/1docs" in detail
+    # The metrics timer sees the same round trips
+    assert response.get_json()["mongodb_calls"] == 5
+
+
+def test_summary_header_only_in_debug_mode():
+    monitor = command_monitor.CommandMonitor(FAKE_URI, slow_ms=1000)
+    response = _app(monitor, debug=False).test_client().get('/api/user/alice/summary')
+    assert "X-DB-Round-Trips" not in response.headers
+    assert command_monitor.current_request() is None
+
+
+def test_docs_returned():
+    assert command_monitor.docs_returned({"cursor": {"firstBatch": [1, 2, 3]}}) == 3
+    assert command_monitor.docs_returned({"cursor": {"nextBatch": [1]}}) == 1
+    assert command_monitor.docs_returned({"value": None, "ok": 1}) == 0
+    assert command_monitor.docs_returned({"value": {"_id": 1}, "ok": 1}) == 1
+    assert command_monitor.docs_returned({"n": 4, "ok": 1}) == 4
+    assert command_monitor.docs_returned({"ok": 1}) == 0
+
+
+def test_query_shape_hides_literals():
+    shape = command_monitor.command_shape("find", {
+        "find": "users",
+        "filter": {"user_id": "alice", "meal_count": {"$gte": 3}, "tags": {"$in": ["a", "b", "c"]}},
+        "sort": {"updated_at": -1},
+        "limit": 5
+    })
+    assert shape == {"filter": {"user_id": "?", "meal_count": {"$gte": "?"}, "tags": {"$in": ["?"]}},
+                     "sort": {"updated_at": "?"}}
+    update = command_monitor.command_shape("update", {"update": "users", "updates": [
+        {"q": {"user_id": "a"}, "u": {"$set": {"x": 1}}}, {"q": {"user_id": "b"}, "u": {}}
+    ]})
+    assert update == {"q": {"user_id": "?"}, "statements": 2}
+    assert command_monitor.command_shape("insert", {"insert": "users", "documents": []}) is None
+    assert command_monitor.command_collection("getMore", {"getMore": 123, "collection": "users"}) == "users"
+
+
+def test_plan_summary_reads_the_winning_plan():
+    plan = command_monitor.plan_summary(IXSCAN_EXPLAIN)
+    assert plan["used_index"] and plan["indexes"] == ["user_id_1"] and not plan["collscan"], plan
+
+    collscan = command_monitor.plan_summary({"queryPlanner": {"winningPlan": {"stage": "COLLSCAN"}}})
+    assert not collscan["used_index"] and collscan["collscan"]
+
+    aggregate = command_monitor.plan_summary({"stages": [
+        {"$cursor": {"queryPlanner": {"winningPlan": {"stage": "PROJECTION_SIMPLE",
+                                                      "inputStage": {"stage": "COLLSCAN"}}}}},
+        {"$group": {}}
+    ]})
+    assert aggregate["collscan"] and not aggregate["used_index"]
+
+
+def test_slow_commands_are_explained_once_per_shape():
+    monitor = command_monitor.CommandMonitor(FAKE_URI, slow_ms=50)
+    fake = FakeClient(monitor, IXSCAN_EXPLAIN)
+    db_registry._clients[FAKE_URI] = fake
+    command_monitor._recent_slow.clear()
+    command_monitor._plans.clear()
+    try:
+        before = command_monitor.stats()
+        _command(monitor, "find", {"find": "users", "filter": {"user_id": "alice"}, "lsid": {"id": 1},
+                                   "$db": "food_preferences"}, micros=80_000)
+        _command(monitor, "find", {"find": "users", "filter": {"user_id": "bob"}}, micros=90_000)
+        _command(monitor, "find", {"find": "users", "filter": {"user_id": "carol"}}, micros=10_000)  # fast
+        recent = _wait_for_slow(2)
+        after = command_monitor.stats()
+
+        assert len(fake.explained) == 1, fake.explained
+        explained = fake.explained[0]
+        assert explained["verbosity"] == "queryPlanner"
+        assert "lsid" not in explained["explain"] and "$db" not in explained["explain"]
+        assert [entry["duration_ms"] for entry in recent] == [90.0, 80.0]
+        assert all(entry["plan"]["indexes"] == ["user_id_1"] for entry in recent)
+        assert recent[0]["shape"] == {"filter": {"user_id": "?"}}
+        assert after["slow"] - before["slow"] == 2
+        assert after["explained"] - before["explained"] == 1
+        # Three finds counted; the explain round trip was not
+        assert after["commands"] - before["commands"] == 3
+    finally:
+        db_registry._clients.pop(FAKE_URI, None)
+
+
+def test_listener_overhead_is_small():
+    monitor = command_monitor.CommandMonitor(FAKE_URI, slow_ms=1000)
+    command = {"find": "users", "filter": {"user_id": "alice"}}
+    reply = {"cursor": {"id": 0, "firstBatch": [{}]}}
+    event = SimpleNamespace(command_name="find", command=command, database_name="food_preferences",
+                            request_id=1, connection_id=("localhost", 27017), duration_micros=500, reply=reply)
+    runs = 20000
+    token = command_monitor._current.set(command_monitor.RequestCommands())
+    try:
+        started = time.perf_counter()
+        for _ in range(runs):
+            monitor.started(event)
+            monitor.succeeded(event)
+        per_command = (time.perf_counter() - started) / runs
+    finally:
+        command_monitor._current.reset(token)
+    assert per_command < 20e-6, f"{per_command * 1e6:.1f} us per command"
+
+
+if __name__ == "__main__":
+    tests = [name for name in sorted(globals()) if name.startswith("test_")]
+    failed = 0
+    for name in tests:
+        try:
+            globals()[name]()
+            print(f"✅ {name}")
+        except Exception as e:
+            failed += 1
+            print(f"❌ {name}: {e}")
+    print(f"\n{len(tests) - failed}/{len(tests)} passed")
+    sys.exit(1 if failed else 0)
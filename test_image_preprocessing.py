@@ -0,0 +1,82 @@
+"""
+Test upload preprocessing: downscaling, metadata stripping and passthrough.
+
+Needs Pillow but no server or API key.
+
+Usage:
+    python test_image_preprocessing.py
+"""
+import io
+import random
+import sys
+
+sys.path.append('.')
+
+from PIL import Image
+
+import image_preprocessing
+
+
+def _encode(img, image_format, **options):
+    buffer = io.BytesIO()
+    img.save(buffer, image_format, **options)
+    return buffer.getvalue()
+
+
+def _noise(width, height, seed=0):
+    rng = random.Random(seed)
+    return Image.frombytes("RGB", (width, height), bytes(rng.getrandbits(8) for _ in range(width * height * 3)))
+
+
+def test_large_photo_is_downscaled():
+    photo = _encode(_noise(2400, 1800), "JPEG", quality=95)
+    prepared = image_preprocessing.prepare_image(photo, max_dimension=1024)
+    assert prepared.size == (1024, 768), prepared.size
+    assert prepared.mime_type == "image/jpeg"
+    assert prepared.byte_size < len(photo)
+
+
+def test_small_images_are_not_grown_by_reencoding():
+    png = _encode(Image.new("RGB", (800, 600), (200, 30, 30)), "PNG")
+    gif = _encode(Image.new("P", (20, 20)), "GIF")
+    for original, mime_type in ((png, "image/png"), (gif, "image/gif")):
+        prepared = image_preprocessing.prepare_image(original)
+        assert prepared.data is original, f"{mime_type} was re-encoded"
+        assert prepared.mime_type == mime_type
+        assert prepared.byte_size == prepared.original_bytes == len(original)
+
+
+def test_passthrough_keeps_stream_position():
+    png = _encode(Image.new("RGB", (64, 64), (0, 128, 0)), "PNG")
+    stream = io.BytesIO(png)
+    prepared = image_preprocessing.prepare_image(stream)
+    assert prepared.data is stream and stream.tell() == 0
+
+
+def test_metadata_is_stripped_even_without_downscaling():
+    exif = Image.Exif()
+    exif[0x0110] = "Test Phone"  # camera model
+    photo = _encode(_noise(120, 80), "JPEG", quality=60, exif=exif)
+    prepared = image_preprocessing.prepare_image(photo)
+    assert prepared.data is not photo
+    assert not Image.open(io.BytesIO(prepared.data)).getexif()
+
+
+def test_unsupported_formats_are_converted():
+    bmp = _encode(Image.new("RGB", (10, 10)), "BMP")
+    prepared = image_preprocessing.prepare_image(bmp)
+    assert prepared.mime_type == "image/jpeg" and prepared.original_format == "bmp"
+
+
+if __name__ == "__main__":
+    tests = [name for name in sorted(globals()) if name.startswith("test_")]
+    failed = 0
+    for name in tests:
+        try:
+            globals()[name]()
+            print(f"✅ {name}")
+        except Exception as e:
+            failed += 1
+            print(f"❌ {name}: {e}")
+    print(f"\n{len(tests) - failed}/{len(tests)} passed")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,154 @@
+"""
+Test request metrics and the /metrics exposition.
+
+Needs no MongoDB or API key: routes are registered on a throwaway Flask
+app and MongoDB commands are simulated through the command listener.
+
+Usage:
+    python test_metrics.py
+"""
+from types import SimpleNamespace
+import re
+import sys
+import time
+
+sys.path.append('.')
+
+from flask import Flask, Response, jsonify
+
+import metrics
+
+
+def _app():
+    app = Flask(__name__)
+    metrics.init_app(app)
+    listener = metrics.CommandTimingListener()
+
+    @app.route('/api/user/<user_id>/summary')
+    def summary(user_id):
+        for _ in range(3):
+            listener.succeeded(SimpleNamespace(duration_micros=2000))
+        with metrics.timer("vision"):
+            time.sleep(0.02)
+        return jsonify({"success": True, "user_id": user_id}), 200
+
+    @app.route('/api/fails', methods=['POST'])
+    def fails():
+        return jsonify({"success": False, "error": "boom"}), 500
+
+    @app.route('/metrics')
+    def prometheus_metrics():
+        return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+    return app
+
+
+def _sample(text, name, **labels):
+    for line in text.splitlines():
+        if line.startswith("#") or not line.startswith(name):
+            continue
+        series, value = line.rsplit(" ", 1)
+        if series.split("{")[0] != name:
+            continue
+        found = dict(re.findall(r'(\w+)="((?:[^"\\]|\\.)*)"', series))
+        if all(found.get(key) == str(value_) for key, value_ in labels.items()):
+            return float(value)
+    return None
+
+
+def test_requests_are_labelled_by_route_template():
+    metrics.reset()
+    client = _app().test_client()
+    for user in ("alice", "bob"):
+        assert client.get(f'/api/user/{user}/summary').status_code == 200
+    client.post('/api/fails')
+    client.get('/no/such/path')
+    text = client.get('/metrics').get_data(as_text=True)
+
+    route = "/api/user/<user_id>/summary"
+    assert _sample(text, "http_requests_total", route=route, method="GET", status=200) == 2
+    assert _sample(text, "http_request_errors_total", route="/api/fails", method="POST") == 1
+    assert _sample(text, "http_requests_total", route="unmatched", status=404) == 1
+    assert _sample(text, "http_request_errors_total", route=route) is None
+    assert _sample(text, "http_request_duration_seconds_count", route=route, method="GET") == 2
+    assert _sample(text, "http_request_duration_seconds_bucket", route=route, le="+Inf") == 2
+
+
+def test_dependency_time_is_charged_to_the_request():
+    metrics.reset()
+    client = _app().test_client()
+    client.get('/api/user/alice/summary')
+    text = client.get('/metrics').get_data(as_text=True)
+
+    route = "/api/user/<user_id>/summary"
+    mongo = _sample(text, "http_request_dependency_seconds_sum", route=route, dependency="mongodb")
+    vision = _sample(text, "http_request_dependency_seconds_sum", route=route, dependency="vision")
+    total = _sample(text, "http_request_duration_seconds_sum", route=route)
+    assert abs(mongo - 0.006) < 1e-9, mongo
+    assert 0.02 <= vision <= total, (vision, total)
+    assert _sample(text, "dependency_call_duration_seconds_count", dependency="mongodb") == 3
+    assert _sample(text, "dependency_call_duration_seconds_count", dependency="vision") == 1
+
+
+def test_calls_outside_a_request_only_feed_call_histograms():
+    metrics.reset()
+    metrics.observe("mongodb", 0.01)
+    assert metrics.current_request() is None
+    text = metrics.render()
+    assert _sample(text, "dependency_call_duration_seconds_count", dependency="mongodb") == 1
+    assert "http_request_dependency_seconds_sum" not in text
+
+
+def test_histogram_buckets_are_cumulative_and_inclusive():
+    histogram = metrics.Histogram((0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 5.0):
+        histogram.observe(value)
+    lines = []
+    metrics._histogram_family(lines, "h", "test", [({}, histogram)])
+    assert 'h_bucket{le="0.1"} 2' in lines
+    assert 'h_bucket{le="1"} 3' in lines
+    assert 'h_bucket{le="+Inf"} 4' in lines
+    assert "h_count 4" in lines
+
+
+def test_label_values_are_escaped():
+    assert metrics._labels({"route": 'a"b\\c\nd'}) == '{route="a\\"b\\\\c\\nd"}'
+
+
+def test_exposition_format_is_valid():
+    metrics.reset()
+    client = _app().test_client()
+    client.get('/api/user/alice/summary')
+    response = client.get('/metrics')
+    assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+    sample_line = re.compile(r'^[a-zA-Z_:][a-zA-Z0-9_:]*(\{([a-zA-Z_]\w*="(?:[^"\\]|\\.)*",?)*\})? -?[0-9.e+-]+$|^.* \+Inf$')
+    for line in response.get_data(as_text=True).splitlines():
+        if line and not line.startswith("# "):
+            assert sample_line.match(line), line
+
+
+def test_hook_overhead_is_small():
+    app = _app()
+    response = Response("ok")
+    runs = 20000
+    with app.test_request_context('/api/user/alice/summary'):
+        started = time.perf_counter()
+        for _ in range(runs):
+            metrics._start_request()
+            metrics._finish_request(response)
+        per_request = (time.perf_counter() - started) / runs
+    assert per_request < 50e-6, f"{per_request * 1e6:.1f} us per request"
+
+
+if __name__ == "__main__":
+    tests = [name for name in sorted(globals()) if name.startswith("test_")]
+    failed = 0
+    for name in tests:
+        try:
+            globals()[name]()
+            print(f"✅ {name}")
+        except Exception as e:
+            failed += 1
+            print(f"❌ {name}: {e}")
+    print(f"\n{len(tests) - failed}/{len(tests)} passed")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,325 @@
+"""
+Test the vision scheduler against a local fake OpenAI server.
+
+Needs no API key, MongoDB or network access: a ThreadingHTTPServer on
+127.0.0.1 answers /v1/chat/completions and can be told to return 429s
+with retry-after, to be slow, or to fail.
+
+Usage:
+    python test_vision_scheduler.py
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+import sys
+import threading
+import time
+
+sys.path.append('.')
+
+import openai
+import vision_scheduler
+from vision_scheduler import BACKFILL, INTERACTIVE, TokenBucket, VisionScheduler
+
+ANALYSIS = {
+    "original_meal": {"name": "Chicken Rice Bowl", "description": "Grilled chicken over rice with broccoli"},
+    "thrown_away": [{"item": "broccoli", "quantity": "1/2 cup", "percentage_of_original": "80%"}],
+    "eaten": [{"item": "chicken", "quantity": "1 breast", "percentage_of_original": "100%"}],
+    "food_preferences": {"likely_dislikes": ["broccoli"], "likely_likes": ["chicken"], "insights": "Prefers protein"},
+    "waste_summary": {"total_waste_percentage": "25%", "waste_value": "low"}
+}
+
+
+class FakeOpenAI:
+    """Fake chat completions endpoint with scripted failures and latency."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.failures = []      # (status, retry_after) returned before succeeding
+        self.latency = 0.0
+        self.latency_by_url = {}  # image URL -> seconds, for batch ordering tests
+        self.received = []      # request tags in arrival order
+        self.active = 0
+        self.max_active = 0
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                image_url = _image_url(body)
+                with fake.lock:
+                    fake.received.append(body.get("user"))
+                    failure = fake.failures.pop(0) if fake.failures else None
+                    fake.active += 1
+                    fake.max_active = max(fake.max_active, fake.active)
+                try:
+                    time.sleep(fake.latency_by_url.get(image_url, fake.latency))
+                    if failure:
+                        status, retry_after = failure
+                        self.send_response(status)
+                        if retry_after is not None:
+                            self.send_header("retry-after", str(retry_after))
+                        message = "Rate limit reached" if status == 429 else f"Fake error {status}"
+                        payload = {"error": {"message": message, "type": "fake_error"}}
+                    else:
+                        self.send_response(200)
+                        analysis = dict(ANALYSIS, original_meal={"name": image_url or "Chicken Rice Bowl",
+                                                                 "description": "Grilled chicken over rice"})
+                        payload = {
+                            "id": "chatcmpl-fake", "object": "chat.completion", "created": int(time.time()),
+                            "model": body.get("model"),
+                            "choices": [{"index": 0, "finish_reason": "stop",
+                                         "message": {"role": "assistant", "content": json.dumps(analysis)}}],
+                            "usage": {"prompt_tokens": 900, "completion_tokens": 300, "total_tokens": 1200}
+                        }
+                    data = json.dumps(payload).encode("utf-8")
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                finally:
+                    with fake.lock:
+                        fake.active -= 1
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def client(self) -> openai.OpenAI:
+        return openai.OpenAI(api_key="test", base_url=self.base_url, max_retries=0)
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def _image_url(body):
+    for message in body.get("messages", []):
+        content = message.get("content")
+        for part in content if isinstance(content, list) else []:
+            if part.get("type") == "image_url":
+                return part["image_url"]["url"]
+    return None
+
+
+def _complete(client, tag):
+    return lambda: client.chat.completions.create(
+        model="gpt-4o", messages=[{"role": "user", "content": "hi"}], user=tag
+    )
+
+
+def test_retries_honor_retry_after():
+    fake = FakeOpenAI()
+    try:
+        fake.failures = [(429, 0.3), (429, 0.3)]
+        scheduler = VisionScheduler(backoff_base=0.01)
+        started = time.monotonic()
+        response = scheduler.run(_complete(fake.client(), "a"))
+        elapsed = time.monotonic() - started
+        stats = scheduler.stats()
+        assert response.choices[0].message.content
+        assert stats["retries"] == 2 and stats["rate_limited"] == 2 and stats["succeeded"] == 1
+        assert elapsed >= 0.6, f"retried after {elapsed:.2f}s, before retry-after elapsed"
+    finally:
+        fake.close()
+
+
+def test_non_retryable_error_fails_fast():
+    fake = FakeOpenAI()
+    try:
+        fake.failures = [(400, None)]
+        scheduler = VisionScheduler(backoff_base=0.01)
+        try:
+            scheduler.run(_complete(fake.client(), "a"))
+            raise AssertionError("400 should not be retried")
+        except openai.BadRequestError:
+            pass
+        assert len(fake.received) == 1 and scheduler.stats()["failed"] == 1
+    finally:
+        fake.close()
+
+
+def test_interrupted_call_releases_its_slot():
+    scheduler = VisionScheduler(max_concurrency=1)
+
+    def interrupted():
+        raise KeyboardInterrupt()
+
+    try:
+        scheduler.run(interrupted)
+        raise AssertionError("expected the KeyboardInterrupt to surface")
+    except KeyboardInterrupt:
+        pass
+    assert scheduler.stats()["in_flight"] == 0
+    # The only slot is free again
+    assert scheduler.run(lambda: "ok") == "ok"
+
+
+def test_server_errors_give_up_after_max_retries():
+    fake = FakeOpenAI()
+    try:
+        fake.failures = [(503, None)] * 10
+        scheduler = VisionScheduler(max_retries=2, backoff_base=0.01)
+        try:
+            scheduler.run(_complete(fake.client(), "a"))
+            raise AssertionError("expected the 503 to surface")
+        except openai.InternalServerError:
+            pass
+        assert len(fake.received) == 3
+    finally:
+        fake.close()
+
+
+def test_concurrency_is_bounded():
+    fake = FakeOpenAI()
+    try:
+        fake.latency = 0.15
+        scheduler = VisionScheduler(max_concurrency=2)
+        client = fake.client()
+        threads = [threading.Thread(target=scheduler.run, args=(_complete(client, str(i)),)) for i in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert fake.max_active == 2, f"max concurrent requests was {fake.max_active}"
+        stats = scheduler.stats()
+        assert stats["succeeded"] == 6
+        # Later callers queued behind the first two
+        assert stats["queue_time"]["interactive"]["max_ms"] >= 250
+    finally:
+        fake.close()
+
+
+def test_interactive_lane_runs_before_backfill():
+    fake = FakeOpenAI()
+    try:
+        fake.latency = 0.1
+        scheduler = VisionScheduler(max_concurrency=1)
+        client = fake.client()
+        blocker = threading.Thread(target=scheduler.run, args=(_complete(client, "blocker"),))
+        blocker.start()
+        time.sleep(0.03)
+        threads = []
+        for tag, priority in [("backfill-1", BACKFILL), ("backfill-2", BACKFILL), ("interactive", INTERACTIVE)]:
+            thread = threading.Thread(target=scheduler.run, args=(_complete(client, tag),), kwargs={"priority": priority})
+            thread.start()
+            threads.append(thread)
+            time.sleep(0.01)
+        for thread in [blocker] + threads:
+            thread.join()
+        assert fake.received == ["blocker", "interactive", "backfill-1", "backfill-2"], fake.received
+    finally:
+        fake.close()
+
+
+def test_rate_limit_pauses_other_callers():
+    fake = FakeOpenAI()
+    try:
+        fake.failures = [(429, 0.4)]
+        scheduler = VisionScheduler(max_concurrency=4, backoff_base=0.01)
+        client = fake.client()
+        first = threading.Thread(target=scheduler.run, args=(_complete(client, "first"),))
+        first.start()
+        time.sleep(0.1)
+        started = time.monotonic()
+        scheduler.run(_complete(client, "second"))
+        waited = time.monotonic() - started
+        first.join()
+        assert waited >= 0.2, f"second caller was not held back ({waited:.2f}s)"
+    finally:
+        fake.close()
+
+
+def test_token_bucket_refill_and_correction():
+    now = [0.0]
+    bucket = TokenBucket(600, clock=lambda: now[0])  # 10 per second
+    assert bucket.delay(600) == 0
+    bucket.take(600)
+    assert abs(bucket.delay(5) - 0.5) < 1e-9
+    now[0] = 1.0
+    assert bucket.delay(10) == 0
+    # Actual usage above the estimate pushes the balance negative
+    bucket.take(10)
+    bucket.adjust(20)
+    assert abs(bucket.delay(0.001) - 2.0001) < 1e-3
+
+
+def test_food_analysis_service_through_fake():
+    fake = FakeOpenAI()
+    try:
+        fake.failures = [(429, 0.1)]
+        os.environ["OPENAI_BASE_URL"] = fake.base_url
+        os.environ.setdefault("OPENAI_KEY", "test")
+        os.environ["ANALYSIS_CACHE_BACKEND"] = "off"
+        import food_analysis_service
+        food_analysis_service._client = None
+        vision_scheduler._scheduler = VisionScheduler(backoff_base=0.01)
+        result = food_analysis_service.analyze_image_url("https://example.com/tray.jpg")
+        assert result["original_meal"]["name"] == "https://example.com/tray.jpg"
+        assert vision_scheduler.get_scheduler().stats()["retries"] == 1
+    finally:
+        food_analysis_service._client = None
+        vision_scheduler._scheduler = None
+        os.environ.pop("OPENAI_BASE_URL", None)
+        fake.close()
+
+
+def test_batch_analysis_is_concurrent_and_ordered():
+    fake = FakeOpenAI()
+    try:
+        os.environ["OPENAI_BASE_URL"] = fake.base_url
+        os.environ.setdefault("OPENAI_KEY", "test")
+        import asyncio
+        import food_analysis_service
+        vision_scheduler._scheduler = VisionScheduler(max_concurrency=8)
+        urls = [f"https://example.com/plate{i}.jpg" for i in range(4)]
+        # Later plates finish first
+        fake.latency_by_url = {url: 0.5 - 0.1 * i for i, url in enumerate(urls)}
+        fake.latency_by_url[urls[2]] = 0.0
+        fake.failures = []
+        started = time.monotonic()
+        results = asyncio.run(food_analysis_service.analyze_images_async(urls + ["not a url"], concurrency=8))
+        elapsed = time.monotonic() - started
+        assert [r["analysis"]["original_meal"]["name"] for r in results[:4]] == urls
+        assert all(r["success"] for r in results[:4])
+        # The fake answers anything, so the last one succeeds too; order is what matters
+        assert results[4]["analysis"]["original_meal"]["name"] == "not a url"
+        assert elapsed < 0.5 + 0.4, f"batch took {elapsed:.2f}s; the slowest image takes 0.5s"
+    finally:
+        vision_scheduler._scheduler = None
+        os.environ.pop("OPENAI_BASE_URL", None)
+        fake.close()
+
+
+def test_batch_isolates_failures():
+    fake = FakeOpenAI()
+    try:
+        os.environ["OPENAI_BASE_URL"] = fake.base_url
+        os.environ.setdefault("OPENAI_KEY", "test")
+        import asyncio
+        import food_analysis_service
+        vision_scheduler._scheduler = VisionScheduler(max_concurrency=1)
+        fake.failures = [(400, None)]
+        results = asyncio.run(food_analysis_service.analyze_images_async(["a", "b"], concurrency=1))
+        assert [r["success"] for r in results] == [False, True], results
+    finally:
+        vision_scheduler._scheduler = None
+        os.environ.pop("OPENAI_BASE_URL", None)
+        fake.close()
+
+
+if __name__ == "__main__":
+    tests = [name for name in sorted(globals()) if name.startswith("test_")]
+    failed = 0
+    for name in tests:
+        try:
+            globals()[name]()
+            print(f"✅ {name}")
+        except Exception as e:
+            failed += 1
+            print(f"❌ {name}: {e}")
+    print(f"\n{len(tests) - failed}/{len(tests)} passed")
+    sys.exit(1 if failed else 0)
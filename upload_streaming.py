@@ -0,0 +1,210 @@
+"""
+Memory-bounded handling of image uploads.
+
+Reading an upload with `file.read()` and building the data URL with
+`base64.b64encode(...).decode()` plus an f-string keeps four to five
+copies of the image alive at once. This module keeps that bounded:
+
+- Request bodies above MAX_UPLOAD_BYTES are rejected with 413 before
+  they are read (Flask's MAX_CONTENT_LENGTH). Endpoints that take several
+  files get a larger body limit with `set_endpoint_limit` and check each
+  file against MAX_UPLOAD_BYTES themselves.
+- Uploaded files live in a SpooledTemporaryFile that moves to disk above
+  UPLOAD_SPOOL_MAX_MEMORY bytes, and are consumed as streams.
+- `encode_data_url` base64-encodes in chunks into one preallocated
+  buffer, so the only full-size copies are that buffer and the final str.
+
+With UPLOAD_TRACE_MEMORY=1 each upload request records its peak Python
+heap growth via tracemalloc (reported in the X-Upload-Peak-Memory header
+and in `stats()`). tracemalloc is process-wide and slows allocation, so
+this is a measurement mode: peaks are per request only when requests do
+not overlap, and memory allocated inside C libraries (e.g. Pillow's
+decoded pixels) is not counted.
+
+Environment:
+    MAX_UPLOAD_BYTES            Largest accepted request body / uploaded file (default 20 MB)
+    UPLOAD_SPOOL_MAX_MEMORY     Upload size kept in memory before spooling to disk (default 1 MB)
+    UPLOAD_TRACE_MEMORY         "1" to record per-request peak memory
+"""
+from contextlib import contextmanager
+from typing import BinaryIO, Dict, Optional, Union
+import binascii
+import os
+import tempfile
+import threading
+import tracemalloc
+from dotenv import load_dotenv
+from flask import Request
+
+load_dotenv()
+
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(20 * 1024 * 1024)))
+SPOOL_MAX_MEMORY = int(os.getenv("UPLOAD_SPOOL_MAX_MEMORY", str(1024 * 1024)))
+TRACE_MEMORY = os.getenv("UPLOAD_TRACE_MEMORY", "").lower() in ("1", "true", "yes")
+
+# Bytes encoded per step; a multiple of 3 so chunks never need base64 padding
+ENCODE_CHUNK_SIZE = 3 * 64 * 1024
+
+# Allowance for multipart boundaries and headers on multi-file endpoints
+FORM_OVERHEAD_BYTES = 64 * 1024
+
+# endpoint -> request body limit, for endpoints that accept several files
+_endpoint_limits: Dict[str, int] = {}
+
+_stats_lock = threading.Lock()
+_stats = {"uploads": 0, "spooled_to_disk": 0, "upload_bytes": 0, "rejected_too_large": 0,
+          "traced": 0, "peak_bytes_max": 0, "peak_bytes_total": 0, "peak_ratio_max": 0.0}
+
+
+class SpooledRequest(Request):
+    """
+    Flask request whose file uploads spool to disk above UPLOAD_SPOOL_MAX_MEMORY
+    and whose body limit can be raised per endpoint (see set_endpoint_limit).
+    """
+
+    @property
+    def max_content_length(self) -> Optional[int]:
+        limit = _endpoint_limits.get(self.endpoint) if self.url_rule is not None else None
+        return limit if limit is not None else super().max_content_length
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY, mode="rb+")
+
+
+def set_endpoint_limit(endpoint: str, max_files: int):
+    """
+    Accept request bodies of up to `max_files` uploads on `endpoint`.
+
+    The endpoint must still check each file against MAX_UPLOAD_BYTES.
+    """
+    _endpoint_limits[endpoint] = max_files * MAX_UPLOAD_BYTES + FORM_OVERHEAD_BYTES
+
+
+def stream_size(stream: BinaryIO) -> int:
+    """Bytes from the current position to the end of a seekable stream."""
+    position = stream.tell()
+    end = stream.seek(0, os.SEEK_END)
+    stream.seek(position)
+    return end - position
+
+
+def iter_chunks(source: Union[bytes, BinaryIO], chunk_size: int = ENCODE_CHUNK_SIZE):
+    """
+    Yield chunks of exactly chunk_size bytes (the last may be shorter).
+
+    Streams are read from their current position and rewound afterwards.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        view = memoryview(source)
+        for start in range(0, len(view), chunk_size):
+            yield view[start:start + chunk_size]
+        return
+
+    position = source.tell()
+    try:
+        while True:
+            chunk = source.read(chunk_size)
+            # Short reads can happen before EOF on some streams; top up to keep chunks 3-aligned
+            while chunk and len(chunk) < chunk_size:
+                more = source.read(chunk_size - len(chunk))
+                if not more:
+                    break
+                chunk += more
+            if not chunk:
+                return
+            yield chunk
+    finally:
+        source.seek(position)
+
+
+def encode_data_url(source: Union[bytes, BinaryIO], mime_type: str) -> str:
+    """
+    Build a base64 data URL without intermediate full-size copies.
+
+    Args:
+        source: Image bytes or a seekable binary stream
+        mime_type: MIME type for the data URL
+
+    Returns:
+        "data:<mime_type>;base64,..." string
+    """
+    size = len(source) if isinstance(source, (bytes, bytearray, memoryview)) else stream_size(source)
+    prefix = f"data:{mime_type};base64,".encode("ascii")
+    buffer = bytearray(len(prefix) + 4 * ((size + 2) // 3))
+    buffer[:len(prefix)] = prefix
+    position = len(prefix)
+    for chunk in iter_chunks(source):
+        encoded = binascii.b2a_base64(chunk, newline=False)
+        buffer[position:position + len(encoded)] = encoded
+        position += len(encoded)
+    return buffer.decode("ascii")
+
+
+def record_upload(stream: BinaryIO):
+    """Count an accepted upload and whether it was spooled to disk."""
+    size = stream_size(stream)
+    # SpooledTemporaryFile exposes the backing file; BytesIO means it stayed in memory
+    backing = getattr(stream, "_file", None)
+    on_disk = backing is not None and not hasattr(backing, "getvalue")
+    with _stats_lock:
+        _stats["uploads"] += 1
+        _stats["upload_bytes"] += size
+        if on_disk:
+            _stats["spooled_to_disk"] += 1
+
+
+def record_rejected():
+    """Count a request or file rejected for exceeding its size limit."""
+    with _stats_lock:
+        _stats["rejected_too_large"] += 1
+
+
+class MemoryTrace:
+    """Peak Python heap growth during one traced block (None when tracing is off)."""
+
+    def __init__(self):
+        self.peak_bytes: Optional[int] = None
+
+
+@contextmanager
+def trace_memory(upload_bytes: int = 0):
+    """
+    Measure peak heap growth of the enclosed block when UPLOAD_TRACE_MEMORY is on.
+
+    Args:
+        upload_bytes: Size of the upload, to record the peak as a multiple of it
+    """
+    trace = MemoryTrace()
+    if not TRACE_MEMORY:
+        yield trace
+        return
+
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    try:
+        yield trace
+    finally:
+        _, peak = tracemalloc.get_traced_memory()
+        trace.peak_bytes = max(peak - baseline, 0)
+        with _stats_lock:
+            _stats["traced"] += 1
+            _stats["peak_bytes_total"] += trace.peak_bytes
+            _stats["peak_bytes_max"] = max(_stats["peak_bytes_max"], trace.peak_bytes)
+            if upload_bytes:
+                _stats["peak_ratio_max"] = max(_stats["peak_ratio_max"], round(trace.peak_bytes / upload_bytes, 2))
+
+
+def stats() -> Dict:
+    """Upload counters, limits and (when tracing) peak memory per request."""
+    with _stats_lock:
+        counters = dict(_stats)
+    counters["peak_bytes_avg"] = counters["peak_bytes_total"] // counters["traced"] if counters["traced"] else None
+    del counters["peak_bytes_total"]
+    counters.update({
+        "max_upload_bytes": MAX_UPLOAD_BYTES,
+        "spool_max_memory": SPOOL_MAX_MEMORY,
+        "trace_memory": TRACE_MEMORY
+    })
+    return counters
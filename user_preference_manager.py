@@ -1,15 +1,25 @@
-from pymongo import MongoClient
-import certifi
-from pymongo.errors import ConnectionFailure, OperationFailure
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, ConnectionFailure, DuplicateKeyError
 from datetime import datetime
 from typing import Dict, List, Optional
 import json
 import os
+import uuid
 from dotenv import load_dotenv
+import db_registry
+import dislike_rollup
+import schema
+import waste_rollup
+from meal_history_buffer import MealHistoryBuffer
 
 # Load environment variables from .env file
 load_dotenv()
 
+# Meals chained into one bulk update pipeline; a user's further meals go in
+# follow-up pipelines so one pipeline stays far below MongoDB's 1000-stage
+# and 16 MB command limits
+MAX_MEALS_PER_PIPELINE = 100
+
 class UserFoodPreferenceManager:
     """
     Manages user food preferences in MongoDB Atlas based on food waste analysis.
@@ -19,14 +29,22 @@ class UserFoodPreferenceManager:
     def __init__(
         self,
         mongodb_uri: Optional[str] = None,
-        db_name: str = "food_preferences"
+        db_name: str = "food_preferences",
+        bootstrap: bool = False,
+        write_behind: Optional[bool] = None
     ):
         """
         Initialize MongoDB Atlas connection.
         
+        No round trips are made here: indexes are created once by the schema
+        bootstrap (schema.py / app startup), not on every construction.
+        
         Args:
             mongodb_uri: MongoDB Atlas connection string (if None, reads from env)
             db_name: Database name
+            bootstrap: Ping the server and ensure the schema exists (for scripts)
+            write_behind: Buffer meal history inserts and flush them in batches
+                (if None, reads MEAL_HISTORY_WRITE_BEHIND from env)
         """
         # Get MongoDB URI from parameter or environment variable
         self.mongodb_uri = mongodb_uri or os.getenv("MONGODB_URI")
@@ -35,25 +53,21 @@ class UserFoodPreferenceManager:
             raise ValueError("MongoDB URI must be provided either as parameter or MONGODB_URI environment variable")
         
         try:
-            # Connect to MongoDB Atlas with certifi for SSL verification
-            self.client = MongoClient(
-                self.mongodb_uri,
-                tlsCAFile=certifi.where(),
-                serverSelectionTimeoutMS=5000,
-                connectTimeoutMS=10000,
-                socketTimeoutMS=10000
-            )
-            
-            # Test the connection
-            self.client.admin.command('ping')
-            print("Successfully connected to MongoDB Atlas!")
+            # Borrow the process-wide pooled client for this URI
+            self.client = db_registry.get_client(self.mongodb_uri)
             
             self.db = self.client[db_name]
             self.users_collection = self.db['users']
             self.history_collection = self.db['meal_history']
             
-            # Create indexes for better performance
-            self._create_indexes()
+            if write_behind is None:
+                write_behind = os.getenv("MEAL_HISTORY_WRITE_BEHIND", "").lower() in ("1", "true", "yes")
+            self.history_buffer = MealHistoryBuffer(self.history_collection) if write_behind else None
+            
+            if bootstrap:
+                self.client.admin.command('ping')
+                print("Successfully connected to MongoDB Atlas!")
+                schema.ensure_schema(self.db)
             
         except ConnectionFailure as e:
             print(f"Failed to connect to MongoDB Atlas: {e}")
@@ -62,21 +76,6 @@ class UserFoodPreferenceManager:
             print(f"Error initializing MongoDB connection: {e}")
             raise
     
-    def _create_indexes(self):
-        """Create database indexes for better performance."""
-        try:
-            # User collection indexes
-            self.users_collection.create_index("user_id", unique=True)
-            
-            # History collection indexes
-            self.history_collection.create_index("user_id")
-            self.history_collection.create_index("timestamp")
-            self.history_collection.create_index([("user_id", 1), ("timestamp", -1)])
-            
-            print("Database indexes created successfully!")
-        except OperationFailure as e:
-            print(f"Warning: Could not create indexes: {e}")
-    
     def test_connection(self) -> bool:
         """
         Test MongoDB Atlas connection.
@@ -102,7 +101,8 @@ class UserFoodPreferenceManager:
             User document or None if not found
         """
         try:
-            return self.users_collection.find_one({"user_id": user_id})
+            return self.users_collection.find_one({"user_id": user_id}, {dislike_rollup.DELTA_FIELD: 0,
+                                                                         dislike_rollup.PENDING_DELTAS_FIELD: 0})
         except Exception as e:
             print(f"Error getting user: {e}")
             return None
@@ -131,15 +131,140 @@ class UserFoodPreferenceManager:
         
         try:
             self.users_collection.insert_one(user_doc)
+            self._record_dislike_changes([dislike_rollup.created_user_change()])
             return user_doc
         except Exception as e:
             print(f"Error creating user: {e}")
             raise
     
+    @staticmethod
+    def _normalize_foods(foods: List[str]) -> List[str]:
+        """Normalize food names (lowercase, strip whitespace), dropping empties and duplicates."""
+        normalized = []
+        for food in foods or []:
+            food = food.lower().strip()
+            if food and food not in normalized:
+                normalized.append(food)
+        return normalized
+    
+    @staticmethod
+    def _parse_waste_percentage(waste_analysis: Dict) -> float:
+        """Parse the total waste percentage string (e.g. '35%') from an analysis."""
+        waste_summary = waste_analysis.get('waste_summary', {})
+        waste_percentage_str = waste_summary.get('total_waste_percentage', '0%')
+        return float(waste_percentage_str.replace('%', ''))
+    
+    def _preference_update_stages(self, waste_analysis: Dict, now: datetime) -> List[Dict]:
+        """
+        Build the update-pipeline stages that apply one meal to a user document.
+        
+        Likes and dislikes are merged server-side with the same rules as the
+        original Python merge: a food moves between the lists when the user's
+        behaviour changes, and a food reported as both liked and disliked in
+        the same meal ends up disliked. The running waste average is computed
+        from the stored values, so concurrent meals cannot overwrite each other.
+        
+        Args:
+            waste_analysis: JSON response from food waste analyzer API
+            now: Timestamp to record as updated_at (and created_at for new users)
+            
+        Returns:
+            List of aggregation pipeline stages
+        """
+        food_prefs = waste_analysis.get('food_preferences', {})
+        new_likes = self._normalize_foods(food_prefs.get('likely_likes', []))
+        new_dislikes = self._normalize_foods(food_prefs.get('likely_dislikes', []))
+        waste_percentage = self._parse_waste_percentage(waste_analysis)
+        
+        # User-supplied strings are wrapped in $literal so names starting with '$' are safe
+        likes = {"$literal": new_likes}
+        dislikes = {"$literal": new_dislikes}
+        current_likes = {"$ifNull": ["$liked_foods", []]}
+        current_dislikes = {"$ifNull": ["$disliked_foods", []]}
+        meal_count = {"$ifNull": ["$meal_count", 0]}
+        current_avg_waste = {"$ifNull": ["$total_waste_percentage", 0.0]}
+        
+        return [{
+            "$set": {
+                "user_name": {"$ifNull": ["$user_name", None]},
+                "created_at": {"$ifNull": ["$created_at", now]},
+                "liked_foods": {"$sortArray": {
+                    "input": {"$setDifference": [{"$setUnion": [current_likes, likes]}, dislikes]},
+                    "sortBy": 1
+                }},
+                "disliked_foods": {"$sortArray": {
+                    "input": {"$setUnion": [{"$setDifference": [current_dislikes, likes]}, dislikes]},
+                    "sortBy": 1
+                }},
+                "meal_count": {"$add": [meal_count, 1]},
+                "total_waste_percentage": {"$round": [
+                    {"$divide": [
+                        {"$add": [{"$multiply": [current_avg_waste, meal_count]}, waste_percentage]},
+                        {"$add": [meal_count, 1]}
+                    ]},
+                    2
+                ]},
+                "updated_at": now
+            }
+        }, self._food_stats_stage(waste_analysis, now)]
+    
+    def _food_stats_stage(self, waste_analysis: Dict, now: datetime) -> Dict:
+        """
+        Build the pipeline stage that folds one meal into the per-food counters.
+        
+        `food_stats` maps each normalized food name to
+        {eaten_count, thrown_away_count, last_eaten, last_thrown_away}, so the
+        recommendation and dislike endpoints never have to scan meal history.
+        Keys are written with $getField/$setField because food names may
+        contain '.' or start with '$'.
+        
+        Args:
+            waste_analysis: JSON response from food waste analyzer API
+            now: Timestamp of the meal
+            
+        Returns:
+            A single $set stage
+        """
+        counts: Dict[str, Dict[str, int]] = {}
+        for kind in ('eaten', 'thrown_away'):
+            for item in waste_analysis.get(kind, []) or []:
+                food = (item.get('item') or '').lower().strip()
+                if food:
+                    counts.setdefault(food, {'eaten': 0, 'thrown_away': 0})[kind] += 1
+        
+        current_stats = {"$ifNull": ["$food_stats", {}]}
+        food_stats = current_stats
+        for food, food_counts in counts.items():
+            value = {
+                "eaten_count": {"$add": [{"$ifNull": ["$$stats.eaten_count", 0]}, food_counts['eaten']]},
+                "thrown_away_count": {"$add": [{"$ifNull": ["$$stats.thrown_away_count", 0]}, food_counts['thrown_away']]},
+                "last_eaten": now if food_counts['eaten'] else "$$stats.last_eaten",
+                "last_thrown_away": now if food_counts['thrown_away'] else "$$stats.last_thrown_away"
+            }
+            food_stats = {"$setField": {
+                "field": {"$literal": food},
+                "input": food_stats,
+                "value": {"$let": {
+                    "vars": {"stats": {"$ifNull": [
+                        {"$getField": {"field": {"$literal": food}, "input": current_stats}}, {}
+                    ]}},
+                    "in": value
+                }}
+            }}
+        
+        return {"$set": {"food_stats": food_stats}}
+    
     def update_user_preferences(self, user_id: str, waste_analysis: Dict) -> Dict:
         """
         Update user food preferences based on waste analysis JSON.
         
+        The user document is created or updated atomically with a single
+        find-one-and-update (upsert + update pipeline), followed by the
+        dislike rollup increments and the meal history insert; safe when
+        several scans for the same user arrive concurrently. The pipeline
+        also records what changed in disliked_foods, which is turned into
+        $inc deltas for the dislike_rollup collection.
+        
         Args:
             user_id: Unique user identifier
             waste_analysis: JSON response from food waste analyzer API
@@ -148,95 +273,343 @@ class UserFoodPreferenceManager:
             Updated user document
         """
         try:
-            # Get or create user
-            user = self.get_user(user_id)
-            if not user:
-                user = self.create_user(user_id)
+            now = datetime.utcnow()
+            pipeline = dislike_rollup.track_dislike_changes(self._preference_update_stages(waste_analysis, now))
             
-            # Extract preferences from analysis
-            food_prefs = waste_analysis.get('food_preferences', {})
-            new_likes = food_prefs.get('likely_likes', [])
-            new_dislikes = food_prefs.get('likely_dislikes', [])
+            try:
+                updated_user = self._apply_preference_pipeline(user_id, pipeline)
+            except DuplicateKeyError:
+                # Two first-ever meals for the same user raced on the upsert;
+                # the document exists now, so the retry is a plain update.
+                updated_user = self._apply_preference_pipeline(user_id, pipeline)
             
-            # Get current preferences
-            current_likes = set(user.get('liked_foods', []))
-            current_dislikes = set(user.get('disliked_foods', []))
-            
-            # Normalize food names (lowercase, strip whitespace)
-            new_likes = [food.lower().strip() for food in new_likes]
-            new_dislikes = [food.lower().strip() for food in new_dislikes]
-            
-            # Add new likes (avoiding duplicates)
-            for food in new_likes:
-                if food and food not in current_likes:
-                    # Remove from dislikes if it was there (preference changed)
-                    current_dislikes.discard(food)
-                    current_likes.add(food)
-            
-            # Add new dislikes (avoiding duplicates)
-            for food in new_dislikes:
-                if food and food not in current_dislikes:
-                    # Remove from likes if it was there (preference changed)
-                    current_likes.discard(food)
-                    current_dislikes.add(food)
-            
-            # Parse waste percentage
-            waste_summary = waste_analysis.get('waste_summary', {})
-            waste_percentage_str = waste_summary.get('total_waste_percentage', '0%')
-            waste_percentage = float(waste_percentage_str.replace('%', ''))
-            
-            # Calculate running average of waste
-            meal_count = user.get('meal_count', 0)
-            current_avg_waste = user.get('total_waste_percentage', 0.0)
-            new_avg_waste = ((current_avg_waste * meal_count) + waste_percentage) / (meal_count + 1)
-            
-            # Update user document
-            update_result = self.users_collection.update_one(
-                {"user_id": user_id},
-                {
-                    "$set": {
-                        "liked_foods": sorted(list(current_likes)),
-                        "disliked_foods": sorted(list(current_dislikes)),
-                        "meal_count": meal_count + 1,
-                        "total_waste_percentage": round(new_avg_waste, 2),
-                        "updated_at": datetime.utcnow()
-                    }
-                }
-            )
+            self._record_dislike_changes([updated_user.pop(dislike_rollup.DELTA_FIELD)])
             
             # Save meal history
-            self._save_meal_history(user_id, waste_analysis)
+            self._save_meal_history(user_id, waste_analysis, timestamp=now)
             
-            # Return updated user
-            return self.get_user(user_id)
+            return updated_user
             
         except Exception as e:
             print(f"Error updating user preferences: {e}")
             raise
     
-    def _save_meal_history(self, user_id: str, waste_analysis: Dict):
+    def bulk_update_user_preferences(self, updates: List[Dict]) -> List[Dict]:
         """
-        Save individual meal analysis to history collection.
+        Apply many meal analyses in a handful of round trips.
+        
+        Updates are grouped by user; each user's meals are chained (in input
+        order) into one update pipeline, all users are written with a single
+        unordered bulk_write, and the history documents with one insert_many.
+        A user with more than MAX_MEALS_PER_PIPELINE meals gets the rest in
+        follow-up pipelines, applied in order with an ordered bulk_write.
+        The users' dislike deltas are read back with one query and folded into
+        the dislike rollup with one more bulk_write.
         
         Args:
-            user_id: Unique user identifier
-            waste_analysis: JSON response from food waste analyzer API
+            updates: List of {"user_id": ..., "waste_analysis": {...}} dicts
+            
+        Returns:
+            Per-item results in input order: {"index", "user_id", "success", "error"?}
+        """
+        now = datetime.utcnow()
+        results = [None] * len(updates)
+        # user_id -> segments of at most MAX_MEALS_PER_PIPELINE meals, in input order
+        segments: Dict[str, List[Dict[str, List]]] = {}
+        
+        for index, update in enumerate(updates):
+            user_id = update.get('user_id')
+            waste_analysis = update.get('waste_analysis') or {}
+            try:
+                stages = self._preference_update_stages(waste_analysis, now)
+            except (ValueError, TypeError, AttributeError) as e:
+                results[index] = {"index": index, "user_id": user_id, "success": False,
+                                  "error": f"Invalid waste_analysis: {e}"}
+                continue
+            user_segments = segments.setdefault(user_id, [])
+            if not user_segments or len(user_segments[-1]["indexes"]) >= MAX_MEALS_PER_PIPELINE:
+                user_segments.append({"stages": [], "indexes": [], "history": []})
+            segment = user_segments[-1]
+            segment["stages"].extend(stages)
+            segment["indexes"].append(index)
+            segment["history"].append(self._build_history_doc(user_id, waste_analysis, now))
+        
+        token = uuid.uuid4().hex
+        pipelines = {
+            user_id: [
+                dislike_rollup.track_dislike_changes(segment["stages"], token,
+                                                     first=position == 0, last=position == len(user_segments) - 1)
+                for position, segment in enumerate(user_segments)
+            ]
+            for user_id, user_segments in segments.items()
+        }
+        failed_users = self._bulk_apply_preference_pipelines(pipelines, token)
+        # Partially applied users had their delta closed, so they are read back too
+        self._collect_bulk_dislike_changes(
+            [user_id for user_id in pipelines if user_id not in failed_users or failed_users[user_id][1]], token
+        )
+        
+        # Save history only for the meals whose preference update was applied
+        docs = []
+        for user_id, user_segments in segments.items():
+            applied = failed_users[user_id][1] if user_id in failed_users else len(user_segments)
+            for segment in user_segments[:applied]:
+                docs.extend(segment["history"])
+        if docs:
+            if self.history_buffer is not None:
+                for doc in docs:
+                    self.history_buffer.add(doc)
+            else:
+                self.history_collection.insert_many(docs, ordered=False)
+            self._record_waste_rollup(docs)
+        
+        for user_id, user_segments in segments.items():
+            error, applied = failed_users.get(user_id, (None, len(user_segments)))
+            for position, segment in enumerate(user_segments):
+                for index in segment["indexes"]:
+                    result = {"index": index, "user_id": user_id, "success": position < applied}
+                    if position >= applied:
+                        result["error"] = error
+                    results[index] = result
+        
+        return results
+    
+    def _bulk_apply_preference_pipelines(self, pipelines: Dict[str, List[List[Dict]]], token: str) -> Dict[str, tuple]:
+        """
+        Upsert many users with one unordered bulk_write.
+        
+        Each user's first pipeline goes in the shared batch; any further
+        pipelines for that user follow in an ordered bulk_write of their own,
+        so they apply in sequence and stop at the first failure. When one
+        fails, the dislike delta of the pipelines already applied is written
+        (under `token`) by a closing update.
+        
+        Returns:
+            Mapping of user_id -> (error message, number of that user's pipelines
+            applied) for users that could not be fully updated
+        """
+        failed = {}
+        pending = list(pipelines.keys())
+        
+        # A second attempt only retries duplicate-key races on first-ever upserts
+        for attempt in range(2):
+            if not pending:
+                break
+            operations = [
+                UpdateOne({"user_id": user_id}, pipelines[user_id][0], upsert=True)
+                for user_id in pending
+            ]
+            retry = []
+            try:
+                self.users_collection.bulk_write(operations, ordered=False)
+            except BulkWriteError as e:
+                for write_error in e.details.get('writeErrors', []):
+                    user_id = pending[write_error['index']]
+                    if write_error.get('code') == 11000 and attempt == 0:
+                        retry.append(user_id)
+                    else:
+                        failed[user_id] = (write_error.get('errmsg', 'Write failed'), 0)
+            pending = retry
+        
+        for user_id, user_pipelines in pipelines.items():
+            if len(user_pipelines) < 2 or user_id in failed:
+                continue
+            try:
+                self.users_collection.bulk_write(
+                    [UpdateOne({"user_id": user_id}, pipeline) for pipeline in user_pipelines[1:]],
+                    ordered=True
+                )
+            except BulkWriteError as e:
+                write_errors = e.details.get('writeErrors', [])
+                position = write_errors[0]['index'] if write_errors else 0
+                message = write_errors[0].get('errmsg', 'Write failed') if write_errors else str(e)
+                failed[user_id] = (message, 1 + position)
+                # The last pipeline never ran: close the delta for the ones that did
+                try:
+                    self.users_collection.update_one({"user_id": user_id},
+                                                     dislike_rollup.close_dislike_tracking(token))
+                except Exception as close_error:
+                    print(f"Error closing dislike tracking for {user_id}: {close_error}")
+        
+        return failed
+    
+    def _collect_bulk_dislike_changes(self, user_ids: List[str], token: str):
+        """
+        Read back the dislike deltas written by a bulk update, fold them into
+        the rollup, then remove them from the user documents.
+        
+        The deltas sit in PENDING_DELTAS_FIELD under this batch's token, which
+        concurrent updates append to but never overwrite.
         """
-        history_doc = {
+        if not user_ids:
+            return
+        field = dislike_rollup.PENDING_DELTAS_FIELD
+        query = {"user_id": {"$in": user_ids}, f"{field}.token": token}
+        changes = [
+            delta
+            for doc in self.users_collection.find(query, {"_id": 0, field: 1})
+            for delta in doc[field] if delta.get("token") == token
+        ]
+        if len(changes) < len(user_ids):
+            # Only possible if the user was deleted in between
+            print(f"Dislike rollup: {len(user_ids) - len(changes)} bulk deltas were not found; "
+                  "run `python dislike_rollup.py --check`")
+        self._record_dislike_changes(changes)
+        self.users_collection.update_many(query, {"$pull": {field: {"token": token}}})
+    
+    def _record_dislike_changes(self, changes: List[Dict]):
+        """Apply dislike deltas to the rollup; failures are logged, not raised (the rollup can be rebuilt)."""
+        try:
+            dislike_rollup.apply_changes(self.db, changes)
+        except Exception as e:
+            print(f"Error updating dislike rollup: {e}")
+    
+    def _record_waste_rollup(self, history_docs: List[Dict]):
+        """Fold saved meals into the time-bucketed waste rollups; failures are logged, not raised."""
+        try:
+            waste_rollup.record_meals(self.db, history_docs)
+        except Exception as e:
+            print(f"Error updating waste rollup: {e}")
+    
+    def _apply_preference_pipeline(self, user_id: str, pipeline: List[Dict]) -> Dict:
+        """
+        Upsert a user document with an update pipeline and return the new version.
+        
+        `food_stats` is left out of the returned document: it grows with every
+        distinct food the user has logged and is only read server-side. So
+        are the pending deltas of bulk updates still in flight.
+        """
+        return self.users_collection.find_one_and_update(
+            {"user_id": user_id},
+            pipeline,
+            projection={"food_stats": 0, dislike_rollup.PENDING_DELTAS_FIELD: 0},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+    
+    @staticmethod
+    def _build_history_doc(user_id: str, waste_analysis: Dict, timestamp: datetime) -> Dict:
+        """Build a meal_history document from a waste analysis."""
+        return {
             "user_id": user_id,
-            "timestamp": datetime.utcnow(),
+            "timestamp": timestamp,
             "original_meal": waste_analysis.get('original_meal', {}),
             "thrown_away": waste_analysis.get('thrown_away', []),
             "eaten": waste_analysis.get('eaten', []),
             "food_preferences": waste_analysis.get('food_preferences', {}),
             "waste_summary": waste_analysis.get('waste_summary', {})
         }
+    
+    def _save_meal_history(self, user_id: str, waste_analysis: Dict, timestamp: Optional[datetime] = None):
+        """
+        Save individual meal analysis to history collection.
+        
+        Args:
+            user_id: Unique user identifier
+            waste_analysis: JSON response from food waste analyzer API
+            timestamp: Meal timestamp (defaults to now)
+        """
+        history_doc = self._build_history_doc(user_id, waste_analysis, timestamp or datetime.utcnow())
         
         try:
-            self.history_collection.insert_one(history_doc)
+            if self.history_buffer is not None:
+                # Written asynchronously in batches (see MealHistoryBuffer)
+                self.history_buffer.add(history_doc)
+            else:
+                self.history_collection.insert_one(history_doc)
         except Exception as e:
             print(f"Error saving meal history: {e}")
             raise
+        
+        self._record_waste_rollup([history_doc])
+    
+    def rebuild_food_stats(self, user_id: Optional[str] = None, batch_size: int = 500) -> int:
+        """
+        Recompute `food_stats` from meal history (backfill for existing users).
+        
+        Runs one aggregation over meal_history, streams the per-(user, food)
+        counters sorted by user, and writes them back in bulk batches.
+        
+        Args:
+            user_id: Only rebuild this user (default: all users with history)
+            batch_size: Number of user updates per bulk_write
+            
+        Returns:
+            Number of users updated
+        """
+        def normalized_items(field: str, kind: str) -> Dict:
+            return {"$map": {
+                "input": {"$ifNull": [f"${field}", []]},
+                "as": "entry",
+                "in": {
+                    "food": {"$toLower": {"$trim": {"input": {"$ifNull": ["$$entry.item", ""]}}}},
+                    "kind": kind
+                }
+            }}
+        
+        def count_if(kind: str) -> Dict:
+            return {"$sum": {"$cond": [{"$eq": ["$items.kind", kind]}, 1, 0]}}
+        
+        def last_if(kind: str) -> Dict:
+            return {"$max": {"$cond": [{"$eq": ["$items.kind", kind]}, "$timestamp", None]}}
+        
+        pipeline = []
+        if user_id is not None:
+            pipeline.append({"$match": {"user_id": user_id}})
+        pipeline += [
+            {"$project": {
+                "user_id": 1,
+                "timestamp": 1,
+                "items": {"$concatArrays": [
+                    normalized_items("eaten", "eaten"),
+                    normalized_items("thrown_away", "thrown_away")
+                ]}
+            }},
+            {"$unwind": "$items"},
+            {"$match": {"items.food": {"$ne": ""}}},
+            {"$group": {
+                "_id": {"user_id": "$user_id", "food": "$items.food"},
+                "eaten_count": count_if("eaten"),
+                "thrown_away_count": count_if("thrown_away"),
+                "last_eaten": last_if("eaten"),
+                "last_thrown_away": last_if("thrown_away")
+            }},
+            {"$sort": {"_id.user_id": 1}}
+        ]
+        
+        updated = 0
+        operations = []
+        current_user, current_stats = None, {}
+        
+        def flush_user():
+            if current_user is not None:
+                operations.append(UpdateOne(
+                    {"user_id": current_user},
+                    [{"$set": {"food_stats": {"$literal": current_stats}}}]
+                ))
+        
+        for row in self.history_collection.aggregate(pipeline, allowDiskUse=True):
+            row_user = row['_id']['user_id']
+            if row_user != current_user:
+                flush_user()
+                current_user, current_stats = row_user, {}
+                if len(operations) >= batch_size:
+                    updated += self.users_collection.bulk_write(operations, ordered=False).matched_count
+                    operations = []
+            stats = {
+                "eaten_count": row['eaten_count'],
+                "thrown_away_count": row['thrown_away_count']
+            }
+            if row.get('last_eaten') is not None:
+                stats['last_eaten'] = row['last_eaten']
+            if row.get('last_thrown_away') is not None:
+                stats['last_thrown_away'] = row['last_thrown_away']
+            current_stats[row['_id']['food']] = stats
+        
+        flush_user()
+        if operations:
+            updated += self.users_collection.bulk_write(operations, ordered=False).matched_count
+        return updated
     
     def get_user_summary(self, user_id: str) -> Optional[Dict]:
         """
@@ -329,30 +702,48 @@ class UserFoodPreferenceManager:
         """
         try:
             # Delete user document
-            user_result = self.users_collection.delete_one({"user_id": user_id})
+            deleted_user = self.users_collection.find_one_and_delete(
+                {"user_id": user_id}, {"_id": 0, "disliked_foods": 1}
+            )
             
             # Delete all meal history
             self.history_collection.delete_many({"user_id": user_id})
             
-            return user_result.deleted_count > 0
+            if deleted_user is None:
+                return False
+            self._record_dislike_changes([dislike_rollup.deleted_user_change(deleted_user.get('disliked_foods', []))])
+            return True
         except Exception as e:
             print(f"Error deleting user: {e}")
             return False
     
+    def get_history_buffer_stats(self) -> Optional[Dict]:
+        """
+        Get write-behind counters for meal history.
+        
+        Returns:
+            Buffer stats, or None if write-behind is disabled
+        """
+        return self.history_buffer.stats() if self.history_buffer is not None else None
+    
     def close(self):
-        """Close MongoDB connection."""
-        try:
-            self.client.close()
-            print("MongoDB connection closed successfully!")
-        except Exception as e:
-            print(f"Error closing connection: {e}")
+        """
+        Flush buffered meal history and release the shared MongoDB client.
+        
+        The underlying client is owned by db_registry and stays open for
+        other callers; it is closed once at process exit.
+        """
+        if self.history_buffer is not None:
+            self.history_buffer.close()
+        self.client = None
+        self.db = None
 
 
 # Example usage
 if __name__ == "__main__":
     try:
         # Initialize the manager (will read MONGODB_URI from .env)
-        manager = UserFoodPreferenceManager()
+        manager = UserFoodPreferenceManager(bootstrap=True)
         
         # Test connection
         if manager.test_connection():
@@ -0,0 +1,419 @@
+"""
+Rate-limit-aware scheduling of vision API calls.
+
+Every call to the vision API goes through one process-wide scheduler that
+
+- admits at most VISION_MAX_CONCURRENCY calls at a time,
+- keeps under VISION_REQUESTS_PER_MINUTE and VISION_TOKENS_PER_MINUTE with
+  two token buckets (token estimates are corrected with the usage the API
+  reports),
+- serves the interactive lane (uploads a user is waiting on) strictly
+  before the backfill lane (queued jobs),
+- retries rate limits, 5xx and connection errors with exponential backoff
+  and full jitter. It honors retry-after, and a 429 pauses admission for
+  every caller, not just the one that hit it, so a rate limit does not turn
+  into a retry storm.
+
+Queue time (waiting for admission) and call time (the API round trip) are
+tracked separately in `stats()`.
+
+The scheduler only wraps a callable, so it can be tested against a local
+fake HTTP server (see test_vision_scheduler.py).
+"""
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+import asyncio
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Priority lanes (lower runs first)
+INTERACTIVE = 0
+BACKFILL = 1
+LANE_NAMES = {INTERACTIVE: "interactive", BACKFILL: "backfill"}
+
+MAX_CONCURRENCY = int(os.getenv("VISION_MAX_CONCURRENCY", "4"))
+REQUESTS_PER_MINUTE = float(os.getenv("VISION_REQUESTS_PER_MINUTE", "500"))
+# Tokens reserved per single-image analysis is about 1,550 (prompt + image + expected output).
+# Unset, the token limit is sized so the request limit binds; set it to the account's
+# tokens/min, which then allows about VISION_TOKENS_PER_MINUTE / 1550 calls per minute.
+TOKENS_PER_CALL_ALLOWANCE = 2000
+TOKENS_PER_MINUTE = float(os.getenv("VISION_TOKENS_PER_MINUTE") or REQUESTS_PER_MINUTE * TOKENS_PER_CALL_ALLOWANCE)
+MAX_RETRIES = int(os.getenv("VISION_MAX_RETRIES", "5"))
+BACKOFF_BASE = float(os.getenv("VISION_BACKOFF_BASE", "1.0"))
+BACKOFF_MAX = float(os.getenv("VISION_BACKOFF_MAX", "60"))
+QUEUE_TIMEOUT = float(os.getenv("VISION_QUEUE_TIMEOUT", "120"))
+
+# Samples kept for percentile metrics
+METRIC_WINDOW = 1000
+
+# Seconds between admission checks for async callers
+ASYNC_POLL_INTERVAL = 0.05
+
+
+class QueueTimeoutError(Exception):
+    """A call waited longer than the queue timeout for admission."""
+
+
+class TokenBucket:
+    """
+    Continuously refilling bucket of `rate_per_minute` units.
+
+    Holds at most `capacity` units (one minute's worth by default). The
+    balance may go negative when a call reports more usage than estimated;
+    later admissions then wait for it to refill.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.clock = clock
+        self.tokens = self.capacity
+        self.updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, amount: float) -> float:
+        """Seconds until `amount` units are available (0 if they are now)."""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount: float):
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+    def adjust(self, amount: float):
+        """Charge (positive) or refund (negative) the difference between estimate and actual use."""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - amount)
+
+
+def retry_decision(error: Exception) -> Tuple[bool, Optional[float], bool]:
+    """
+    Decide whether a failed call should be retried.
+
+    Works with OpenAI SDK errors and anything exposing `status_code` and
+    `response.headers` the same way.
+
+    Returns:
+        (retryable, retry_after_seconds or None, was_rate_limited)
+    """
+    status = getattr(error, "status_code", None)
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+
+    retry_after = None
+    if headers.get("retry-after-ms"):
+        try:
+            retry_after = float(headers["retry-after-ms"]) / 1000.0
+        except ValueError:
+            pass
+    if retry_after is None and headers.get("retry-after"):
+        try:
+            retry_after = float(headers["retry-after"])
+        except ValueError:
+            pass  # HTTP-date form; fall back to backoff
+
+    if status == 429:
+        return True, retry_after, True
+    if status is not None:
+        return status >= 500 or status == 408, retry_after, False
+    # No HTTP status: connection errors and timeouts are worth retrying
+    name = type(error).__name__
+    return name in ("APIConnectionError", "APITimeoutError", "ConnectionError", "TimeoutError"), retry_after, False
+
+
+def _percentile(samples: List[float], pct: float) -> Optional[float]:
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+class VisionScheduler:
+    """Admission control, rate limiting and retries for vision calls."""
+
+    def __init__(
+        self,
+        max_concurrency: int = MAX_CONCURRENCY,
+        requests_per_minute: float = REQUESTS_PER_MINUTE,
+        tokens_per_minute: float = TOKENS_PER_MINUTE,
+        max_retries: int = MAX_RETRIES,
+        backoff_base: float = BACKOFF_BASE,
+        backoff_max: float = BACKOFF_MAX,
+        queue_timeout: float = QUEUE_TIMEOUT
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.queue_timeout = queue_timeout
+        self._requests = TokenBucket(requests_per_minute)
+        self._tokens = TokenBucket(tokens_per_minute)
+        self._cond = threading.Condition()
+        self._waiting: List[Tuple[int, int, object]] = []
+        self._sequence = itertools.count()
+        self._active = 0
+        self._paused_until = 0.0
+        self._counters = {"calls": 0, "succeeded": 0, "failed": 0, "retries": 0, "rate_limited": 0, "queue_timeouts": 0}
+        self._queue_times: Dict[int, List[float]] = {lane: [] for lane in LANE_NAMES}
+        self._call_times: List[float] = []
+
+    def run(
+        self,
+        call: Callable[[], Any],
+        priority: int = INTERACTIVE,
+        estimated_tokens: int = 0,
+        tokens_used: Optional[Callable[[Any], Optional[int]]] = None
+    ) -> Any:
+        """
+        Run `call` once admitted, retrying transient failures.
+
+        Args:
+            call: Performs one API request and returns its result
+            priority: INTERACTIVE or BACKFILL
+            estimated_tokens: Tokens charged to the tokens/min bucket up front
+            tokens_used: Extracts the actual token usage from a result, to
+                correct the estimate
+
+        Returns:
+            Result of `call`
+
+        Raises:
+            QueueTimeoutError: If admission took longer than the queue timeout
+            Exception: The last error once retries are exhausted or the
+                error is not retryable
+        """
+        sequence = self._start_call()
+        deadline = time.monotonic() + self.queue_timeout
+        attempt = 0
+        while True:
+            self._admit(priority, sequence, estimated_tokens, deadline)
+            started = time.monotonic()
+            try:
+                result = call()
+            except Exception as e:
+                self._release(time.monotonic() - started)
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                attempt += 1
+                time.sleep(delay)
+                # Retries keep their original place in line and get a fresh timeout
+                deadline = time.monotonic() + self.queue_timeout
+                continue
+            except BaseException:
+                # Interrupted mid-call (KeyboardInterrupt, SystemExit): give the slot back
+                self._release(time.monotonic() - started)
+                raise
+
+            self._release(time.monotonic() - started)
+            self._finish_call(result, estimated_tokens, tokens_used)
+            return result
+
+    async def run_async(
+        self,
+        call: Callable[[], Awaitable[Any]],
+        priority: int = INTERACTIVE,
+        estimated_tokens: int = 0,
+        tokens_used: Optional[Callable[[Any], Optional[int]]] = None
+    ) -> Any:
+        """
+        Async counterpart of `run` for coroutine-based clients.
+
+        Shares the same lanes, limits and metrics as `run`; waiting for
+        admission polls instead of blocking the event loop.
+
+        Args:
+            call: Returns a coroutine performing one API request
+            priority, estimated_tokens, tokens_used: As for `run`
+        """
+        sequence = self._start_call()
+        deadline = time.monotonic() + self.queue_timeout
+        attempt = 0
+        while True:
+            await self._admit_async(priority, sequence, estimated_tokens, deadline)
+            started = time.monotonic()
+            try:
+                result = await call()
+            except Exception as e:
+                self._release(time.monotonic() - started)
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                attempt += 1
+                await asyncio.sleep(delay)
+                deadline = time.monotonic() + self.queue_timeout
+                continue
+            except BaseException:
+                # Cancelled mid-call: give the slot back
+                self._release(time.monotonic() - started)
+                raise
+
+            self._release(time.monotonic() - started)
+            self._finish_call(result, estimated_tokens, tokens_used)
+            return result
+
+    def _start_call(self) -> int:
+        with self._cond:
+            self._counters["calls"] += 1
+        return next(self._sequence)
+
+    def _retry_delay(self, error: Exception, attempt: int) -> Optional[float]:
+        """Seconds to wait before retrying, or None when the error is final."""
+        retryable, retry_after, rate_limited = retry_decision(error)
+        delay = self._backoff(attempt, retry_after)
+        with self._cond:
+            if rate_limited:
+                self._counters["rate_limited"] += 1
+                # Hold back every caller, not just this one
+                self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                self._cond.notify_all()
+            if not retryable or attempt >= self.max_retries:
+                self._counters["failed"] += 1
+                return None
+            self._counters["retries"] += 1
+        print(f"[DEBUG] Vision call failed ({error}); retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+        return delay
+
+    def _finish_call(self, result: Any, estimated_tokens: int, tokens_used: Optional[Callable[[Any], Optional[int]]]):
+        used = None
+        if tokens_used is not None and estimated_tokens:
+            try:
+                used = tokens_used(result)
+            except Exception:
+                used = None
+        with self._cond:
+            if used is not None:
+                self._tokens.adjust(used - estimated_tokens)
+            self._counters["succeeded"] += 1
+
+    def _backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        # Full jitter; never retry earlier than the server asked
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    def _poll_admission(self, entry: Tuple[int, int, object], estimated_tokens: int, deadline: float) -> Tuple[bool, float]:
+        """
+        Admit `entry` if it is first in line and capacity allows (caller holds the lock).
+
+        Returns:
+            (admitted, seconds to wait before checking again)
+        """
+        now = time.monotonic()
+        if now >= deadline:
+            self._counters["queue_timeouts"] += 1
+            raise QueueTimeoutError(f"Vision call waited more than {self.queue_timeout:.0f}s for a rate-limit slot")
+        if self._waiting[0] is entry and self._active < self.max_concurrency:
+            wait = max(self._paused_until - now, self._requests.delay(1), self._tokens.delay(estimated_tokens))
+            if wait <= 0:
+                self._requests.take(1)
+                self._tokens.take(estimated_tokens)
+                self._active += 1
+                return True, 0.0
+            return False, min(wait, deadline - now)
+        return False, deadline - now
+
+    def _dequeue(self, entry: Tuple[int, int, object], enqueued: float, admitted: bool):
+        """Remove `entry` from the line (caller holds the lock)."""
+        self._waiting.remove(entry)
+        heapq.heapify(self._waiting)
+        # The next in line may be admissible now
+        self._cond.notify_all()
+        if admitted:
+            samples = self._queue_times.setdefault(entry[0], [])
+            samples.append(time.monotonic() - enqueued)
+            del samples[:-METRIC_WINDOW]
+
+    def _admit(self, priority: int, sequence: int, estimated_tokens: int, deadline: float):
+        entry = (priority, sequence, object())
+        enqueued = time.monotonic()
+        admitted = False
+        with self._cond:
+            heapq.heappush(self._waiting, entry)
+            try:
+                while not admitted:
+                    admitted, wait = self._poll_admission(entry, estimated_tokens, deadline)
+                    if not admitted:
+                        self._cond.wait(wait)
+            finally:
+                self._dequeue(entry, enqueued, admitted)
+
+    async def _admit_async(self, priority: int, sequence: int, estimated_tokens: int, deadline: float):
+        entry = (priority, sequence, object())
+        enqueued = time.monotonic()
+        admitted = False
+        with self._cond:
+            heapq.heappush(self._waiting, entry)
+        try:
+            while True:
+                with self._cond:
+                    admitted, wait = self._poll_admission(entry, estimated_tokens, deadline)
+                if admitted:
+                    return
+                await asyncio.sleep(min(wait, ASYNC_POLL_INTERVAL))
+        finally:
+            with self._cond:
+                self._dequeue(entry, enqueued, admitted)
+
+    def _release(self, call_seconds: float):
+        with self._cond:
+            self._active -= 1
+            self._call_times.append(call_seconds)
+            del self._call_times[:-METRIC_WINDOW]
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters plus queue-time (per lane) and call-time percentiles in milliseconds."""
+        def summary(samples):
+            return {
+                "count": len(samples),
+                "p50_ms": round(_percentile(samples, 50) * 1000, 1) if samples else None,
+                "p95_ms": round(_percentile(samples, 95) * 1000, 1) if samples else None,
+                "max_ms": round(max(samples) * 1000, 1) if samples else None
+            }
+
+        with self._cond:
+            waiting = {name: 0 for name in LANE_NAMES.values()}
+            for priority, _, _ in self._waiting:
+                waiting[LANE_NAMES.get(priority, str(priority))] += 1
+            return {
+                **self._counters,
+                "in_flight": self._active,
+                "waiting": waiting,
+                "paused_for_seconds": round(max(0.0, self._paused_until - time.monotonic()), 2),
+                "queue_time": {LANE_NAMES.get(lane, str(lane)): summary(list(samples))
+                               for lane, samples in self._queue_times.items()},
+                "call_time": summary(list(self._call_times)),
+                "limits": {
+                    "max_concurrency": self.max_concurrency,
+                    "requests_per_minute": self._requests.rate * 60,
+                    "tokens_per_minute": self._tokens.rate * 60
+                }
+            }
+
+
+_scheduler: Optional[VisionScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> VisionScheduler:
+    """The process-wide vision scheduler configured from env."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = VisionScheduler()
+        return _scheduler
@@ -0,0 +1,271 @@
+"""
+Time-bucketed waste rollups for trend queries.
+
+Every meal saved to `meal_history` is also folded into per-hour and per-day
+buckets in the `waste_rollup` collection (UTC). Each bucket is a handful of
+small documents, told apart by `kind`:
+
+    {granularity, bucket, kind: "total", key: "",     meal_count, waste_sum}
+    {granularity, bucket, kind: "item",  key: <food>, count}        # thrown away
+    {granularity, bucket, kind: "meal",  key: <name>, meal_count, waste_sum}
+
+so a trend query reads one document per bucket instead of scanning history.
+
+Usage:
+    python waste_rollup.py --rebuild    # recompute all buckets from meal_history
+"""
+from pymongo import UpdateOne
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, Optional, Tuple
+import argparse
+import os
+import sys
+from dotenv import load_dotenv
+import db_registry
+
+load_dotenv()
+
+ROLLUP_COLLECTION = "waste_rollup"
+
+GRANULARITIES = {
+    "hour": timedelta(hours=1),
+    "day": timedelta(days=1),
+}
+
+# Default look-back when no `from` is given
+DEFAULT_RANGES = {
+    "hour": timedelta(hours=48),
+    "day": timedelta(days=30),
+}
+
+# Upper bound on buckets per query (~6 months of hours)
+MAX_BUCKETS = 5000
+
+
+def bucket_start(timestamp: datetime, granularity: str) -> datetime:
+    """Truncate a timestamp to the start of its bucket."""
+    start = timestamp.replace(minute=0, second=0, microsecond=0)
+    if granularity == "day":
+        start = start.replace(hour=0)
+    return start
+
+
+def _as_utc(timestamp: Optional[datetime]) -> Optional[datetime]:
+    """Convert an aware datetime to naive UTC, as stored by pymongo."""
+    if timestamp is not None and timestamp.tzinfo is not None:
+        return timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+
+def _waste_percentage(history_doc: Dict) -> float:
+    """Parse the '35%'-style total waste percentage of a history document."""
+    value = (history_doc.get('waste_summary') or {}).get('total_waste_percentage', '0%')
+    try:
+        return float(str(value).replace('%', ''))
+    except ValueError:
+        return 0.0
+
+
+def _increments(history_docs: Iterable[Dict]) -> Dict[Tuple, Dict[str, float]]:
+    """Sum the bucket increments for a batch of history documents."""
+    increments: Dict[Tuple, Dict[str, float]] = {}
+
+    def add(key: Tuple, **values):
+        counters = increments.setdefault(key, {})
+        for field, value in values.items():
+            counters[field] = counters.get(field, 0) + value
+
+    for doc in history_docs:
+        timestamp = doc.get('timestamp')
+        if not isinstance(timestamp, datetime):
+            continue
+        waste = _waste_percentage(doc)
+        meal_name = ((doc.get('original_meal') or {}).get('name') or '').strip()
+        items = [(item.get('item') or '').lower().strip() for item in doc.get('thrown_away') or []]
+
+        for granularity in GRANULARITIES:
+            bucket = bucket_start(timestamp, granularity)
+            add((granularity, bucket, "total", ""), meal_count=1, waste_sum=waste)
+            if meal_name:
+                add((granularity, bucket, "meal", meal_name), meal_count=1, waste_sum=waste)
+            for item in items:
+                if item:
+                    add((granularity, bucket, "item", item), count=1)
+    return increments
+
+
+def record_meals(db, history_docs: Iterable[Dict]):
+    """
+    Fold meal history documents into the hour and day buckets.
+
+    All increments for the batch go out in one unordered bulk_write.
+
+    Args:
+        db: pymongo Database
+        history_docs: Documents as written to meal_history
+    """
+    now = datetime.utcnow()
+    operations = [
+        UpdateOne(
+            {"granularity": granularity, "bucket": bucket, "kind": kind, "key": key},
+            {"$inc": counters, "$set": {"updated_at": now}},
+            upsert=True
+        )
+        for (granularity, bucket, kind, key), counters in _increments(history_docs).items()
+    ]
+    if operations:
+        db[ROLLUP_COLLECTION].bulk_write(operations, ordered=False)
+
+
+def rebuild(db, batch_size: int = 1000) -> int:
+    """
+    Recompute every bucket from meal_history.
+
+    Meals saved while the rebuild runs may be counted twice or not at all;
+    pause ingest for an exact result.
+
+    Args:
+        db: pymongo Database
+        batch_size: History documents folded per bulk_write
+
+    Returns:
+        Number of history documents processed
+    """
+    db[ROLLUP_COLLECTION].delete_many({})
+    cursor = db['meal_history'].find(
+        {}, {"_id": 0, "timestamp": 1, "waste_summary": 1, "original_meal.name": 1, "thrown_away.item": 1}
+    ).batch_size(batch_size)
+
+    processed = 0
+    batch = []
+    for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            record_meals(db, batch)
+            processed += len(batch)
+            batch = []
+    if batch:
+        record_meals(db, batch)
+        processed += len(batch)
+    return processed
+
+
+def get_trends(
+    db,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    granularity: str = "day",
+    limit: int = 10
+) -> Dict:
+    """
+    Waste trend series between two times, read from the buckets.
+
+    Args:
+        db: pymongo Database
+        start: Range start (UTC; default: 30 days / 48 hours before end)
+        end: Range end, inclusive of its bucket (UTC; default: now)
+        granularity: "day" or "hour"
+        limit: Number of top thrown-away items and meals to return
+
+    Returns:
+        Dictionary with a zero-filled bucket series and range-wide top items and meals
+
+    Raises:
+        ValueError: For an unknown granularity, an inverted range, or too many buckets
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"granularity must be one of: {', '.join(GRANULARITIES)}")
+    end = _as_utc(end) or datetime.utcnow()
+    start = _as_utc(start) or end - DEFAULT_RANGES[granularity]
+    if start > end:
+        raise ValueError("'from' must be before 'to'")
+
+    step = GRANULARITIES[granularity]
+    first, last = bucket_start(start, granularity), bucket_start(end, granularity)
+    if (last - first) / step + 1 > MAX_BUCKETS:
+        raise ValueError(f"Range too large: at most {MAX_BUCKETS} {granularity} buckets per query")
+
+    collection = db[ROLLUP_COLLECTION]
+    in_range = {"granularity": granularity, "bucket": {"$gte": first, "$lte": last}}
+
+    totals = {
+        doc['bucket']: doc
+        for doc in collection.find({**in_range, "kind": "total"}, {"_id": 0, "bucket": 1, "meal_count": 1, "waste_sum": 1})
+    }
+    bucket_items = {
+        row['_id']: row['top']
+        for row in collection.aggregate([
+            {"$match": {**in_range, "kind": "item"}},
+            {"$group": {"_id": "$bucket", "top": {"$topN": {"n": 3, "sortBy": {"count": -1, "key": 1}, "output": {"item": "$key", "count": "$count"}}}}}
+        ])
+    }
+
+    buckets = []
+    current = first
+    while current <= last:
+        total = totals.get(current, {})
+        meal_count = total.get('meal_count', 0)
+        waste_sum = total.get('waste_sum', 0.0)
+        buckets.append({
+            "start": current.isoformat(),
+            "meal_count": meal_count,
+            "total_waste_percentage": round(waste_sum, 2),
+            "average_waste_percentage": round(waste_sum / meal_count, 2) if meal_count else None,
+            "top_thrown_away": bucket_items.get(current, [])
+        })
+        current += step
+
+    top_items = [
+        {"item": row['_id'], "count": row['count']}
+        for row in collection.aggregate([
+            {"$match": {**in_range, "kind": "item"}},
+            {"$group": {"_id": "$key", "count": {"$sum": "$count"}}},
+            {"$sort": {"count": -1, "_id": 1}},
+            {"$limit": limit}
+        ])
+    ]
+    meals = [
+        {
+            "name": row['_id'],
+            "meal_count": row['meal_count'],
+            "average_waste_percentage": round(row['waste_sum'] / row['meal_count'], 2) if row['meal_count'] else None
+        }
+        for row in collection.aggregate([
+            {"$match": {**in_range, "kind": "meal"}},
+            {"$group": {"_id": "$key", "meal_count": {"$sum": "$meal_count"}, "waste_sum": {"$sum": "$waste_sum"}}},
+            {"$sort": {"meal_count": -1, "_id": 1}},
+            {"$limit": limit}
+        ])
+    ]
+
+    meal_count = sum(bucket['meal_count'] for bucket in buckets)
+    waste_sum = sum(total.get('waste_sum', 0.0) for total in totals.values())
+    return {
+        "granularity": granularity,
+        "from": first.isoformat(),
+        "to": last.isoformat(),
+        "summary": {
+            "meal_count": meal_count,
+            "average_waste_percentage": round(waste_sum / meal_count, 2) if meal_count else None
+        },
+        "buckets": buckets,
+        "top_thrown_away": top_items,
+        "meals": meals
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rebuild the time-bucketed waste rollups")
+    parser.add_argument("--rebuild", action="store_true", required=True, help="Recompute all buckets from meal_history")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--db-name", default="food_preferences")
+    args = parser.parse_args(argv)
+
+    db = db_registry.get_database(args.db_name, os.getenv("MONGODB_URI"))
+    processed = rebuild(db, batch_size=args.batch_size)
+    print(f"✅ Rebuilt waste rollups from {processed} meals")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,14 @@
+"""
+WSGI entry point: the API app with the analysis job workers started.
+
+Importing api_atlas alone never starts background workers (process pools
+and scripts import it too); production servers load this module instead:
+
+    gunicorn wsgi:app
+
+Do not combine it with gunicorn --preload: the workers would start in the
+master and be lost when it forks.
+"""
+from api_atlas import app, start_analysis_jobs
+
+start_analysis_jobs()